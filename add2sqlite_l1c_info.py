@@ -128,9 +128,8 @@ try:
 
     # -- get equator crossing time
     f = h5py.File(fil_name, "r+")
-    lat, lon = rh5.read_latlon(f)
+    ect = rh5.read_ect(f, start_time_l1c, args.verbose)
     f.close()
-    ect = subs.get_ect_local_hour(lat, lon, start_time_l1c, args.verbose)
 
     if args.verbose:
         logger.info("UPDATE {0}:".format(args.db_file))
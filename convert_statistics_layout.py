@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Convert the wide statistics table of run_pystat_add2sqlite.py,
+# i.e. one column per latitudinal belt, into statistics_blob.
+#
+
+import os
+import sys
+import argparse
+import sqlite3
+import numpy as np
+import subs_avhrrgac as mysub
+from pycmsaf.logger import setup_root_logger
+
+logger = setup_root_logger(name='root')
+
+# records read and written at once
+CHUNK_SIZE = 1000
+
+
+def get_binsize(db):
+    """
+    Zone size of the wide layout, belts cover -90 to 90 degrees.
+    """
+    nzones = db.execute("SELECT COUNT(*) FROM latitudes").fetchone()[0]
+    return 180. / nzones, nzones
+
+
+def convert_statistics(db, fill_value=-9999., verbose=False):
+    """
+    Copy all records of the statistics table into statistics_blob.
+    Records already converted are replaced, i.e. a conversion can
+    simply be repeated. Transaction handling is up to the caller.
+    :return: number of converted records, zone size
+    """
+    (binsize, nzones) = get_binsize(db)
+    mysub.create_statistics_blob_table(db)
+
+    zonal_cols = ["{0}{1}".format(zon, idx) for zon in
+                  ('ZonalMean', 'ZonalStdv', 'ZonalNobs') for idx in range(nzones)]
+    sql_query = "SELECT satelliteID, date, channelID, selectID, OrbitCount, " \
+                "GlobalMean, GlobalStdv, GlobalNobs, {0} " \
+                "FROM statistics".format(', '.join(zonal_cols))
+    insert = "INSERT OR REPLACE INTO statistics_blob " \
+             "(satelliteID, date, channelID, selectID, binsize, " \
+             "OrbitCount, GlobalMean, GlobalStdv, GlobalNobs, " \
+             "ZonalMean, ZonalStdv, ZonalNobs) " \
+             "VALUES(?,?,?,?,?,?,?,?,?,?,?,?)"
+
+    cursor = db.execute(sql_query)
+    count = 0
+    while True:
+        rows = cursor.fetchmany(CHUNK_SIZE)
+        if not rows:
+            break
+
+        zonal = np.array([row[8:] for row in rows], dtype=np.float64)
+        zonal = np.where(np.isnan(zonal), fill_value, zonal).reshape(len(rows), 3, nzones)
+
+        records = list()
+        for pos, row in enumerate(rows):
+            records.append(list(row[0:4]) + [binsize] + list(row[4:8]) +
+                           [mysub.array_to_blob(zonal[pos, 0], '<f4'),
+                            mysub.array_to_blob(zonal[pos, 1], '<f4'),
+                            mysub.array_to_blob(zonal[pos, 2], '<i4')])
+
+        db.executemany(insert, records)
+        count += len(rows)
+        if verbose:
+            logger.info("{0} records converted".format(count))
+
+    return count, binsize
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='''%s
+    converts the statistics table of run_pystat_add2sqlite.py, i.e.
+    one column per latitudinal belt for each of mean, stdv and nobs,
+    into statistics_blob. There, the zonal statistics are stored as
+    float32/int32 blobs next to the global statistics and the zone
+    size is part of the primary key, i.e. statistics of several
+    binsizes can be kept in the same database (see -lay blob of
+    run_pystat_add2sqlite.py).''' % os.path.basename(__file__))
+
+    parser.add_argument('-g', '--gsqlite', required=True,
+                        help='/path/to/AVHRR_GAC_L1c_pystat.sqlite3')
+
+    parser.add_argument('-rm', '--remove', action="store_true",
+                        help='Drop the wide statistics and latitudes tables '
+                             'after converting them and shrink the database')
+
+    parser.add_argument('-v', '--verbose', action="store_true",
+                        help='increase output verbosity')
+
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.gsqlite):
+        logger.info("{0} does not exist".format(args.gsqlite))
+        sys.exit(1)
+
+    size = os.path.getsize(args.gsqlite)
+
+    db = sqlite3.connect(args.gsqlite, timeout=36000)
+    # transactions are handled explicitly
+    db.isolation_level = None
+
+    tables = [row[0] for row in
+              db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    if 'statistics' not in tables or 'latitudes' not in tables:
+        logger.info("No wide statistics table in {0}".format(args.gsqlite))
+        db.close()
+        sys.exit(1)
+
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        (count, binsize) = convert_statistics(db, verbose=args.verbose)
+        if args.remove:
+            db.execute("DROP TABLE statistics")
+            db.execute("DROP TABLE latitudes")
+        db.execute("COMMIT")
+    except sqlite3.Error as err:
+        db.execute("ROLLBACK")
+        logger.info("FAILED: {0}".format(err))
+        db.close()
+        sys.exit(1)
+
+    logger.info("{0} records of binsize {1} converted".format(count, binsize))
+
+    if args.remove:
+        logger.info("VACUUM")
+        db.execute("VACUUM")
+        logger.info("Size of {0}: {1:.1f} MB -> {2:.1f} MB".format(
+            args.gsqlite, size / 1024. ** 2, os.path.getsize(args.gsqlite) / 1024. ** 2))
+
+    db.close()
+    logger.info("{0} finished".format(os.path.basename(__file__)))
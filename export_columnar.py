@@ -0,0 +1,479 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Export the pystat statistics (run_pystat_add2sqlite.py) and the
+# quick L1c analysis results (quick_l1c_analysis.py) into a chunked
+# and compressed HDF5 file, see subs_plot_sql.StatisticsCube.
+#
+
+import os
+import sys
+import argparse
+import datetime
+import sqlite3
+import numpy as np
+import h5py
+import subs_avhrrgac as mysub
+import subs_plot_sql as psql
+from pycmsaf.logger import setup_root_logger
+
+logger = setup_root_logger(name='root')
+
+# days per chunk of the date axis
+CHUNK_DAYS = 366
+# records per chunk of the quick analysis columns
+CHUNK_ROWS = 65536
+# byte shuffle helps gzip with float and integer arrays
+COMPRESSION = dict(compression='gzip', compression_opts=4, shuffle=True)
+
+# quick analysis times are stored as microseconds since EPOCH
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# pystat cubes of shape (satellites, channels, selects, dates):
+# (name, dtype, fill value, column of the statistics table)
+GLOBAL_CUBES = [('record', 'u1', 0, None),
+                ('orbit_count', 'i4', 0, 'OrbitCount'),
+                ('global_mean', 'f4', np.nan, 'GlobalMean'),
+                ('global_stdv', 'f4', np.nan, 'GlobalStdv'),
+                ('global_nobs', 'i8', 0, 'GlobalNobs')]
+
+# pystat cubes of shape (satellites, channels, selects, dates, zones)
+ZONAL_CUBES = [('zonal_mean', 'f4', np.nan),
+               ('zonal_stdv', 'f4', np.nan),
+               ('zonal_nobs', 'i8', 0)]
+
+# quick analysis columns: (name, dtype, column of vw_procs/vw_stats)
+PROCS_COLUMNS = [('orbit_name', 'S64', 'orbit_name'),
+                 ('satellite', 'S16', 'satellite_name'),
+                 ('pygac_version', 'S64', 'pygac_version_name'),
+                 ('start_time_l1c', 'i8', 'start_time_l1c'),
+                 ('end_time_l1c', 'i8', 'end_time_l1c'),
+                 ('pygac_runtime', 'f8', 'pygac_runtime'),
+                 ('pygac_errors', h5py.special_dtype(vlen=bytes), 'pygac_errors'),
+                 ('pygac_warnings', h5py.special_dtype(vlen=bytes), 'pygac_warnings')]
+
+STATS_COLUMNS = [('orbit_name', 'S64', 'orbit_name'),
+                 ('satellite', 'S16', 'satellite_name'),
+                 ('pygac_version', 'S64', 'pygac_version_name'),
+                 ('channel', 'S8', 'channel_name'),
+                 ('start_time_l1c', 'i8', 'start_time_l1c'),
+                 ('min_val', 'f8', 'min_val'),
+                 ('max_val', 'f8', 'max_val'),
+                 ('mean_val', 'f8', 'mean_val'),
+                 ('number_of_total_obs', 'i8', 'number_of_total_obs'),
+                 ('number_of_masked_obs', 'i8', 'number_of_masked_obs'),
+                 ('number_of_valid_obs', 'i8', 'number_of_valid_obs')]
+
+
+class ExportError(Exception):
+    pass
+
+
+def get_names(cursor, table):
+    """
+    Names of an id/name table ordered by id.
+    """
+    return [item['name'] for item in
+            cursor.execute("SELECT id, name FROM {0} ORDER BY id".format(table))]
+
+
+def date_to_ordinal(value):
+    """
+    Proleptic Gregorian ordinal of a DATE column value.
+    """
+    if not isinstance(value, datetime.date):
+        value = datetime.datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+    return value.toordinal()
+
+
+def time_to_us(value):
+    """
+    Microseconds since EPOCH of a TIMESTAMP column value, -1 if missing.
+    """
+    if value is None:
+        return -1
+    delta = value - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 10 ** 6 + delta.microseconds
+
+
+def string_array(values, dtype):
+    """
+    Fixed length strings, missing values are set to ''. Longer
+    values raise an ExportError instead of being truncated.
+    """
+    values = [val if isinstance(val, bytes) else (val or u'').encode('utf-8')
+              for val in values]
+    size = np.dtype(dtype).itemsize
+    for val in values:
+        if len(val) > size:
+            raise ExportError("{0} is longer than {1} bytes".format(
+                val.decode("utf-8", "replace"), size))
+    return np.array(values, dtype=dtype)
+
+
+def extend_axis(grp, name, values, axis):
+    """
+    Append names missing in an axis of the pystat group and extend
+    all cubes along this axis, the new slices hold no records.
+    :return: names of the axis, i.e. the exported ones and the new ones
+    """
+    stored = [val.decode('ascii') for val in grp[name][:]]
+    new = [val for val in values if val not in stored]
+    if not new:
+        return stored
+
+    if grp[name].maxshape[0] is not None:
+        raise ExportError("{0} of this file cannot be extended, use -full".format(name))
+
+    size = len(stored) + len(new)
+    grp[name].resize((size,))
+    grp[name][len(stored):] = string_array(new, 'S16')
+    for cube in [item[0] for item in GLOBAL_CUBES + ZONAL_CUBES]:
+        grp[cube].resize(size, axis=axis)
+
+    logger.info("New {0}: {1}".format(name, ', '.join(new)))
+    return stored + new
+
+
+def create_pystat_group(h5, sats, chas, sels, lats, first):
+    """
+    Axes and empty cubes of the pystat group, all axes are extended
+    by the exports. Dates are given relative to first_date, i.e. the
+    date of index d is date.fromordinal(first_date + d).
+    """
+    names = [(name, string_array(values, 'S16')) for (name, values) in
+             (('satellites', sats), ('channels', chas), ('selects', sels))]
+
+    grp = h5.create_group('pystat')
+    grp.attrs['first_date'] = first
+
+    for (name, values) in names:
+        grp.create_dataset(name, data=values, maxshape=(None,), chunks=(64,))
+    grp.create_dataset('lats', data=np.array(lats, dtype='f4'))
+
+    dates = grp.create_dataset('dates', shape=(0,), maxshape=(None,), dtype='i4',
+                               chunks=(CHUNK_DAYS,))
+    dates.attrs['units'] = 'proleptic Gregorian ordinal'
+
+    axes = (len(sats), len(chas), len(sels))
+    for (name, dtype, fill, col) in GLOBAL_CUBES:
+        grp.create_dataset(name, shape=axes + (0,), maxshape=(None,) * 4,
+                           dtype=dtype, fillvalue=fill,
+                           chunks=(1, 1, 1, CHUNK_DAYS), **COMPRESSION)
+    for (name, dtype, fill) in ZONAL_CUBES:
+        grp.create_dataset(name, shape=axes + (0, len(lats)),
+                           maxshape=(None,) * 4 + (len(lats),),
+                           dtype=dtype, fillvalue=fill,
+                           chunks=(1, 1, 1, CHUNK_DAYS, len(lats)), **COMPRESSION)
+    return grp
+
+
+def export_satellite(cursor, reader, table, grp, pos, sat, chas, sels, start, last):
+    """
+    Write the records of one satellite between the ordinals start and
+    last into the cubes, one hyperslab per cube and channel/select.
+    :return: number of exported records
+    """
+    first = int(grp.attrs['first_date'])
+    (d0, ndays) = (start - first, last - start + 1)
+    (sd, ed) = (datetime.date.fromordinal(start), datetime.date.fromordinal(last))
+    nzones = grp['lats'].shape[0]
+
+    # names of the axes may be missing in the database
+    cha_pos = dict((reader.get_id('channels', cha), j) for j, cha in enumerate(chas)
+                   if reader.get_id('channels', cha) is not None)
+    sel_pos = dict((reader.get_id('selects', sel), k) for k, sel in enumerate(sels)
+                   if reader.get_id('selects', sel) is not None)
+
+    # global statistics of all channels and selects in one query
+    blocks = dict((name, np.full((len(chas), len(sels), ndays), fill, dtype=dtype))
+                  for (name, dtype, fill, col) in GLOBAL_CUBES)
+    sql_query = "SELECT channelID, selectID, date, OrbitCount, " \
+                "GlobalMean, GlobalStdv, GlobalNobs FROM {0} " \
+                "WHERE satelliteID={1} AND date>=\'{2}\' AND date<=\'{3}\'". \
+        format(table, reader.get_id('satellites', sat), sd, ed)
+
+    rows = cursor.execute(sql_query).fetchall()
+    if not rows:
+        return 0
+
+    for item in rows:
+        (j, k) = (cha_pos[item['channelID']], sel_pos[item['selectID']])
+        day = date_to_ordinal(item['date']) - start
+        blocks['record'][j, k, day] = 1
+        for (name, dtype, fill, col) in GLOBAL_CUBES:
+            if col is not None and item[col] is not None:
+                blocks[name][j, k, day] = item[col]
+
+    for (name, dtype, fill, col) in GLOBAL_CUBES:
+        grp[name][pos, :, :, d0:d0 + ndays] = blocks[name]
+
+    # zonal statistics of the channels and selects holding records
+    for (j, k) in zip(*np.nonzero(blocks['record'].any(axis=2))):
+        (dates, zmean, zstdv, znobs, lats) = reader.read_range(sat, chas[j], sels[k], sd, ed)
+        days = [dt.toordinal() - start for dt in dates]
+
+        for (name, dtype, fill), values in zip(ZONAL_CUBES, (zmean, zstdv, znobs)):
+            block = np.full((ndays, nzones), fill, dtype=dtype)
+            if np.dtype(dtype).kind == 'i':
+                values = np.where(np.isnan(values), fill, values)
+            block[days] = values
+            grp[name][pos, j, k, d0:d0 + ndays] = block
+
+    return int(blocks['record'].sum())
+
+
+def get_missing_days(cursor, reader, table, grp, pos, sat, last):
+    """
+    Days of a satellite with more records in the database than in the
+    record cube, i.e. new days, backfilled days and days of new
+    channels or selects.
+    :return: list of [start, last] ordinals of consecutive missing days
+    """
+    first = int(grp.attrs['first_date'])
+    exported = grp['record'][pos].sum(axis=(0, 1))
+
+    sql_query = "SELECT date, COUNT(DISTINCT channelID || \',\' || selectID) " \
+                "AS nrec FROM {0} WHERE satelliteID={1} AND date>=\'{2}\' " \
+                "AND date<=\'{3}\' GROUP BY date ORDER BY date". \
+        format(table, reader.get_id('satellites', sat),
+               datetime.date.fromordinal(first), datetime.date.fromordinal(last))
+
+    runs = list()
+    for item in cursor.execute(sql_query).fetchall():
+        day = date_to_ordinal(item['date'])
+        if item['nrec'] <= exported[day - first]:
+            continue
+        if runs and day == runs[-1][1] + 1:
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return runs
+
+
+def export_statistics(db, h5, binsize=None, verbose=False):
+    """
+    Export the daily statistics of a pystat database into cubes of
+    shape (satellites, channels, selects, dates[, zones]). Days with
+    records missing in the record cube are added, also backfilled days
+    and days of new satellites, channels and selects. Records exported
+    before are only written again on days with new records, i.e. they
+    are not updated (use -full).
+    Both layouts are read, see psql.ZonalStatsReader.
+    :return: dict [satellite] = number of new records
+    """
+    cursor = db.cursor()
+    reader = psql.ZonalStatsReader(cursor, binsize)
+    table = psql.get_global_table(cursor)
+
+    (sats, chas, sels) = (get_names(cursor, 'satellites'),
+                          get_names(cursor, 'channels'),
+                          get_names(cursor, 'selects'))
+    lats = reader.belts[1]
+
+    row = cursor.execute("SELECT MIN(date) AS first, MAX(date) AS last "
+                         "FROM {0}".format(table)).fetchone()
+    if row['first'] is None:
+        return dict()
+    (first, last) = (date_to_ordinal(row['first']), date_to_ordinal(row['last']))
+
+    if 'pystat' in h5:
+        grp = h5['pystat']
+        if not np.allclose(grp['lats'][:], lats):
+            raise ExportError("latitudinal belts differ from the exported ones, use -full")
+        if first < grp.attrs['first_date']:
+            logger.info("Records before {0} are not exported, use -full".format(
+                datetime.date.fromordinal(int(grp.attrs['first_date']))))
+    else:
+        grp = create_pystat_group(h5, sats, chas, sels, lats, first)
+
+    (sat_axis, cha_axis, sel_axis) = [
+        extend_axis(grp, name, values, axis) for axis, (name, values) in
+        enumerate((('satellites', sats), ('channels', chas), ('selects', sels)))]
+
+    first = int(grp.attrs['first_date'])
+    ndays = last - first + 1
+    if ndays > grp['dates'].shape[0]:
+        for (name, dtype, fill, col) in GLOBAL_CUBES:
+            grp[name].resize(ndays, axis=3)
+        for (name, dtype, fill) in ZONAL_CUBES:
+            grp[name].resize(ndays, axis=3)
+        grp['dates'].resize((ndays,))
+        grp['dates'][:] = np.arange(first, first + ndays)
+
+    counts = dict()
+    for sat in sats:
+        pos = sat_axis.index(sat)
+        for (start, end) in get_missing_days(cursor, reader, table, grp, pos, sat, last):
+            # records of these days exported before are written again
+            done = int(grp['record'][pos, :, :, start - first:end - first + 1].sum())
+            count = export_satellite(cursor, reader, table, grp, pos, sat,
+                                     cha_axis, sel_axis, start, end) - done
+            counts[sat] = counts.get(sat, 0) + count
+            if verbose:
+                logger.info("{0}: {1} new records from {2} to {3}".format(
+                    sat, count, datetime.date.fromordinal(start),
+                    datetime.date.fromordinal(end)))
+
+    return counts
+
+
+def column_array(values, dtype):
+    """
+    Values of one column, missing values are set to NaN, -1 or ''.
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'f':
+        return np.array([np.nan if val is None else val for val in values], dtype=dtype)
+    if dtype.kind == 'i':
+        return np.array([-1 if val is None else val for val in values], dtype=dtype)
+    if dtype.kind == 'O':
+        return np.array([(val or u'').encode('utf-8') for val in values], dtype=dtype)
+    return string_array(values, dtype)
+
+
+def append_rows(grp, columns, rows):
+    """
+    Append records (dict rows) to the column datasets of a group.
+    All columns are converted before the first one is extended.
+    """
+    arrays = list()
+    for (name, dtype, col) in columns:
+        if np.dtype(dtype).kind == 'i' and col.endswith('_time_l1c'):
+            values = [time_to_us(item[col]) for item in rows]
+        else:
+            values = [item[col] for item in rows]
+        arrays.append((name, column_array(values, dtype)))
+
+    nrows = grp[columns[0][0]].shape[0]
+    for (name, values) in arrays:
+        grp[name].resize((nrows + len(rows),))
+        grp[name][nrows:] = values
+
+
+def export_quick(db, h5, verbose=False):
+    """
+    Export procs and stats of a quick analysis database into columns,
+    one record per orbit (and channel) of orbits with an L1c file.
+    Times are stored as microseconds since 1970-01-01 and only orbits
+    starting after the last exported orbit of each satellite are added,
+    i.e. orbits processed with another pygac version later are not
+    exported (use -full).
+    :return: dict [satellite] = number of exported procs records
+    """
+    cursor = db.cursor()
+
+    if 'quick' not in h5:
+        grp = h5.create_group('quick')
+        for (table, columns) in (('procs', PROCS_COLUMNS), ('stats', STATS_COLUMNS)):
+            sub = grp.create_group(table)
+            for (name, dtype, col) in columns:
+                sub.create_dataset(name, shape=(0,), maxshape=(None,), dtype=dtype,
+                                   chunks=(CHUNK_ROWS,), **COMPRESSION)
+            sub['start_time_l1c'].attrs['units'] = 'microseconds since 1970-01-01'
+        grp['procs/end_time_l1c'].attrs['units'] = 'microseconds since 1970-01-01'
+    grp = h5['quick']
+
+    exported = grp['procs/satellite'][:]
+    times = grp['procs/start_time_l1c'][:]
+
+    counts = dict()
+    for sat in get_names(cursor, 'satellites'):
+        where = "satellite_name=\'{0}\' AND start_time_l1c IS NOT NULL".format(sat)
+        sat_times = times[exported == sat.encode('ascii')]
+        if sat_times.size:
+            last = EPOCH + datetime.timedelta(microseconds=int(sat_times.max()))
+            where += " AND start_time_l1c > \'{0}\'".format(last)
+
+        procs = cursor.execute(
+            "SELECT * FROM vw_procs WHERE {0} "
+            "ORDER BY start_time_l1c".format(where)).fetchall()
+        if not procs:
+            continue
+
+        stats = cursor.execute(
+            "SELECT a.*, t.start_time_l1c AS start_time_l1c "
+            "FROM vw_stats a JOIN procs t ON t.orbit_id = a.orbit_id AND "
+            "t.satellite_id = a.satellite_id AND "
+            "t.pygac_version_id = a.pygac_version_id "
+            "WHERE {0} ORDER BY t.start_time_l1c, a.channel_id".format(where)).fetchall()
+
+        append_rows(grp['procs'], PROCS_COLUMNS, procs)
+        append_rows(grp['stats'], STATS_COLUMNS, stats)
+
+        counts[sat] = len(procs)
+        if verbose:
+            logger.info("{0}: {1} orbits, {2} channel records".format(
+                sat, len(procs), len(stats)))
+
+    return counts
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='''%s
+    exports the daily statistics of run_pystat_add2sqlite.py into
+    chunked and gzip compressed cubes of shape (satellites, channels,
+    selects, dates, zones) and the procs and stats tables of
+    quick_l1c_analysis.py into columns of a HDF5 file. An existing
+    file is appended, i.e. days missing in the cubes (orbits after the
+    last exported ones of each satellite) are added, also those of new
+    satellites, channels and selects. Use subs_plot_sql.StatisticsCube
+    or plot_pystat_results.py -col to read the cubes.''' % os.path.basename(__file__))
+
+    parser.add_argument('-g', '--gsqlite', required=True,
+                        help='/path/to/AVHRR_GAC_L1c_pystat.sqlite3 '
+                             'or quick analysis database')
+
+    parser.add_argument('-out', '--output', required=True,
+                        help='/path/to/export.h5')
+
+    parser.add_argument('-b', '--binsize', type=float,
+                        help='Binsize of the zonal statistics stored as blobs '
+                             '(statistics_blob), required if several are stored')
+
+    parser.add_argument('-full', '--full', action="store_true",
+                        help='Replace the exported data instead of appending')
+
+    parser.add_argument('-v', '--verbose', action="store_true",
+                        help='increase output verbosity')
+
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.gsqlite):
+        logger.info("{0} does not exist".format(args.gsqlite))
+        sys.exit(1)
+
+    db = sqlite3.connect(args.gsqlite, timeout=36000,
+                         detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+    db.row_factory = mysub.dict_factory
+
+    tables = [item['name'] for item in
+              db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    if 'statistics' in tables or 'statistics_blob' in tables:
+        kind = 'pystat'
+    elif 'procs' in tables:
+        kind = 'quick'
+    else:
+        logger.info("Neither statistics nor quick analysis tables in {0}".format(args.gsqlite))
+        db.close()
+        sys.exit(1)
+
+    h5 = h5py.File(args.output, 'a')
+    try:
+        if args.full and kind in h5:
+            del h5[kind]
+        if kind == 'pystat':
+            counts = export_statistics(db, h5, args.binsize, args.verbose)
+        else:
+            counts = export_quick(db, h5, args.verbose)
+    except (ExportError, ValueError, sqlite3.Error) as err:
+        logger.info("FAILED: {0}".format(err))
+        sys.exit(1)
+    finally:
+        h5.close()
+        db.close()
+
+    logger.info("{0} records of {1} satellites exported to {2}".format(
+        sum(counts.values()), len(counts), args.output))
+    logger.info("{0} finished".format(os.path.basename(__file__)))
@@ -95,10 +95,9 @@ for dt in rrule(DAILY, dtstart=args.start_date, until=args.end_date):
 
         # read file
         f = h5py.File(fil, "r+")
-        lat, lon = rh5.read_latlon(f)
+        ect = rh5.read_ect(f, start_time_l1c, args.verbose)
         f.close()
 
-        ect = subs.get_ect_local_hour(lat, lon, start_time_l1c, args.verbose)
         if ect is not None:
             res_dict[sat][cnt] = dict()
             res_dict[sat][cnt]['date'] = dt
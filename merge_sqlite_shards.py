@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Merge shard databases, i.e. databases written by single jobs,
+# into the main statistics or quick analysis database.
+#
+
+import os
+import sys
+import argparse
+import sqlite3
+from pycmsaf.logger import setup_root_logger
+
+logger = setup_root_logger(name='root')
+
+# id/name tables and tables referencing them:
+# [(table, {column: referenced id/name table})]
+SCHEMAS = {
+    # run_pystat_add2sqlite.py
+    'pystat': dict(
+        lookups=['satellites', 'channels', 'selects'],
+        tables=[('statistics', {'satelliteID': 'satellites',
+                                'channelID': 'channels',
+                                'selectID': 'selects'}),
+                ('statistics_blob', {'satelliteID': 'satellites',
+                                     'channelID': 'channels',
+                                     'selectID': 'selects'}),
+                ('base_moments', {'satelliteID': 'satellites',
+                                  'channelID': 'channels',
+                                  'selectID': 'selects'})]),
+    # quick_l1c_analysis.py
+    'quick': dict(
+        lookups=['pygac_versions', 'satellites', 'channels', 'orbits'],
+        tables=[('procs', {'orbit_id': 'orbits',
+                           'satellite_id': 'satellites',
+                           'pygac_version_id': 'pygac_versions'}),
+                ('stats', {'orbit_id': 'orbits',
+                           'satellite_id': 'satellites',
+                           'pygac_version_id': 'pygac_versions',
+                           'channel_id': 'channels'})]),
+}
+
+
+class MergeError(Exception):
+    pass
+
+
+def get_schema_name(db, schema):
+    """
+    Type of an attached database, see SCHEMAS.
+    :return: 'pystat', 'quick' or None
+    """
+    names = get_table_names(db, schema)
+    if 'statistics' in names or 'statistics_blob' in names:
+        return 'pystat'
+    if 'procs' in names:
+        return 'quick'
+    return None
+
+
+def get_table_names(db, schema):
+    sql_query = "SELECT name FROM {0}.sqlite_master " \
+                "WHERE type = 'table'".format(schema)
+    return [row[0] for row in db.execute(sql_query)]
+
+
+def get_columns(db, schema, table):
+    return [row[1] for row in
+            db.execute("PRAGMA {0}.table_info({1})".format(schema, table))]
+
+
+def copy_schema(db):
+    """
+    Create tables and views of the shard in an empty main database.
+    Latitudinal belts are part of the schema of the statistics tables,
+    i.e. they are copied as well.
+    """
+    sql_query = "SELECT type, name, sql FROM shard.sqlite_master " \
+                "WHERE sql IS NOT NULL ORDER BY type = 'view', rowid"
+    for (typ, name, sql) in db.execute(sql_query).fetchall():
+        db.execute(sql)
+
+    if 'latitudes' in get_table_names(db, 'shard'):
+        db.execute("INSERT INTO main.latitudes SELECT * FROM shard.latitudes")
+
+
+def copy_table(db, table):
+    """
+    Create a table of the shard missing in the main database,
+    e.g. statistics_blob or statistics and latitudes of the other
+    layout of run_pystat_add2sqlite.py.
+    """
+    sql_query = "SELECT sql FROM shard.sqlite_master " \
+                "WHERE type = 'table' AND name = ?"
+    db.execute(db.execute(sql_query, (table,)).fetchone()[0])
+
+    if table == 'latitudes':
+        db.execute("INSERT INTO main.latitudes SELECT * FROM shard.latitudes")
+
+
+def check_schema(db, kind):
+    """
+    Shard and main database must share the latitudinal belts and
+    the columns of the data tables. Tables only found in the shard
+    are created.
+    """
+    main_names = get_table_names(db, 'main')
+    shard_names = get_table_names(db, 'shard')
+
+    if kind == 'pystat' and 'latitudes' in shard_names:
+        if 'latitudes' not in main_names:
+            copy_table(db, 'latitudes')
+        sql_query = "SELECT id, belt FROM {0}.latitudes ORDER BY id"
+        if db.execute(sql_query.format('main')).fetchall() != \
+                db.execute(sql_query.format('shard')).fetchall():
+            raise MergeError("latitudinal belts differ")
+
+    for (table, refs) in SCHEMAS[kind]['tables']:
+        if table not in shard_names:
+            continue
+        if table not in main_names:
+            copy_table(db, table)
+        if get_columns(db, 'main', table) != get_columns(db, 'shard', table):
+            raise MergeError("columns of table {0} differ".format(table))
+
+
+def merge_lookups(db, kind):
+    """
+    Add names of the id/name tables not yet known to the main database.
+    Existing IDs are never changed.
+    """
+    for table in SCHEMAS[kind]['lookups']:
+        db.execute("INSERT INTO main.{0} (name) "
+                   "SELECT DISTINCT name FROM shard.{0} "
+                   "WHERE name NOT IN (SELECT name FROM main.{0})".format(table))
+
+
+def merge_table(db, table, refs):
+    """
+    Copy all records of a shard table with one INSERT ... SELECT,
+    foreign keys are remapped by name. Existing records of the same
+    primary key are replaced like in the producing tools.
+    :return: number of merged records
+    """
+    cols = get_columns(db, 'main', table)
+    select = list()
+    joins = list()
+
+    for pos, col in enumerate(cols):
+        if col in refs:
+            joins.append("JOIN shard.{ref} s{pos} ON s{pos}.id = t.{col} "
+                         "JOIN main.{ref} m{pos} ON m{pos}.name = s{pos}.name".
+                         format(ref=refs[col], pos=pos, col=col))
+            select.append("m{0}.id".format(pos))
+        else:
+            select.append("t.{0}".format(col))
+
+    sql_query = "INSERT OR REPLACE INTO main.{table} ({cols}) " \
+                "SELECT {select} FROM shard.{table} t {joins}". \
+        format(table=table, cols=', '.join(cols),
+               select=', '.join(select), joins=' '.join(joins))
+
+    before = db.total_changes
+    db.execute(sql_query)
+    return db.total_changes - before
+
+
+def merge_shard(db, shard, verbose=False):
+    """
+    Merge one shard within one transaction. Merging is idempotent,
+    i.e. a shard can be merged again after a failure.
+    :return: dict [table] = number of merged records
+    """
+    # attaching a missing file would create it
+    if not os.path.isfile(shard):
+        raise MergeError("no such file")
+
+    db.execute("ATTACH DATABASE ? AS shard", (shard,))
+    try:
+        kind = get_schema_name(db, 'shard')
+        if kind is None:
+            raise MergeError("neither statistics nor quick analysis tables")
+
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            main_kind = get_schema_name(db, 'main')
+            if main_kind is None:
+                copy_schema(db)
+            elif main_kind != kind:
+                raise MergeError("shard ({0}) does not fit main "
+                                 "database ({1})".format(kind, main_kind))
+            check_schema(db, kind)
+
+            merge_lookups(db, kind)
+
+            counts = dict()
+            shard_names = get_table_names(db, 'shard')
+            for (table, refs) in SCHEMAS[kind]['tables']:
+                if table not in shard_names:
+                    continue
+                counts[table] = merge_table(db, table, refs)
+                if verbose:
+                    logger.info("{0}: {1} records of {2}".
+                                format(os.path.basename(shard), counts[table], table))
+
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+    finally:
+        db.execute("DETACH DATABASE shard")
+
+    return counts
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='''%s
+    merges shard databases into the main database. Instead of locking
+    one database, each job of run_pystat_add2sqlite.py or
+    quick_l1c_analysis.py writes to its own shard (-g or sql_file).
+    Names of satellites, channels, etc. are remapped to the IDs of the
+    main database and records of the same primary key are replaced.
+    Each shard is merged in one transaction, i.e. shards can simply
+    be merged again after a failure.''' % os.path.basename(__file__))
+
+    parser.add_argument('-g', '--gsqlite', required=True,
+                        help='/path/to/main_database.sqlite3')
+
+    parser.add_argument('-sh', '--shards', nargs='+', required=True,
+                        help='Shard databases, e.g. /path/to/shards/*.sqlite3')
+
+    parser.add_argument('-rm', '--remove', action="store_true",
+                        help='Delete each shard after merging it')
+
+    parser.add_argument('-v', '--verbose', action="store_true",
+                        help='increase output verbosity')
+
+    args = parser.parse_args()
+
+    db = sqlite3.connect(args.gsqlite, timeout=36000)
+    # transactions are handled explicitly
+    db.isolation_level = None
+
+    failed = list()
+    for shard in sorted(args.shards):
+        try:
+            counts = merge_shard(db, shard, args.verbose)
+        except (MergeError, sqlite3.Error) as err:
+            logger.info("FAILED: {0}: {1}".format(shard, err))
+            failed.append(shard)
+            continue
+
+        logger.info("Merged {0}: {1}".format(os.path.basename(shard), ', '.join(
+            "{0} {1}".format(counts[t], t) for t in sorted(counts))))
+
+        if args.remove:
+            os.remove(shard)
+
+    db.close()
+
+    logger.info("{0} of {1} shards merged into {2}".format(
+        len(args.shards) - len(failed), len(args.shards), args.gsqlite))
+
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Create indexes for the access paths of the tools, switch to WAL,
+# run ANALYZE and report the query plans before and after.
+#
+
+import os
+import sys
+import argparse
+import sqlite3
+from pycmsaf.logger import setup_root_logger
+
+logger = setup_root_logger(name='root')
+
+# indexes per table: (name, table, columns)
+INDEXES = [
+    # satellite + whitelisted + L1c time range or ordering:
+    # orbits per day, ECT, missing scanlines, extract whitelisted orbits
+    ('idx_orbits_satellite_blacklist_l1c', 'orbits',
+     ['satellite_id', 'blacklist', 'start_time_l1c']),
+    # satellite + L1c time range regardless of blacklisting: overlap info
+    ('idx_orbits_satellite_l1c', 'orbits',
+     ['satellite_id', 'start_time_l1c']),
+    # satellite + L1b time range: date interval blacklisting
+    ('idx_orbits_satellite_start', 'orbits',
+     ['satellite_id', 'start_time_l1b']),
+    # single orbits: filename blacklisting, add2sqlite_l1c_info.py
+    ('idx_orbits_filename', 'orbits',
+     ['filename']),
+    # extract blacklisted orbits
+    ('idx_orbits_blacklist_reason', 'orbits',
+     ['blacklist_reason', 'start_time_l1b']),
+    # daily statistics of one satellite, channel and select
+    ('idx_statistics_satellite_channel_select_date', 'statistics',
+     ['satelliteID', 'channelID', 'selectID', 'date']),
+    # same for the blob layout, one zone size
+    ('idx_statistics_blob_satellite_channel_select_binsize_date', 'statistics_blob',
+     ['satelliteID', 'channelID', 'selectID', 'binsize', 'date']),
+    ('idx_base_moments_satellite_channel_select_binsize_date', 'base_moments',
+     ['satelliteID', 'channelID', 'selectID', 'binsize', 'date']),
+]
+
+# queries of the tools: (tool, table, query)
+# placeholders are filled with values found in the database
+QUERIES = [
+    ('subs_plot_sql: orbits per day', 'orbits',
+     "SELECT date(start_time_l1c) AS day, COUNT(*) FROM vw_std "
+     "WHERE blacklist=0 AND satellite_name='{sat}' AND "
+     "start_time_l1c >= '{sdt}' AND start_time_l1c < '{edt}' GROUP BY day"),
+    ('subs_avhrrgac.get_ect_records', 'orbits',
+     "SELECT start_time_l1c, equator_crossing_time FROM vw_std "
+     "WHERE blacklist=0 AND equator_crossing_time is not null AND "
+     "start_time_l1c is not null AND end_time_l1c is not null AND "
+     "satellite_name='{sat}' ORDER BY start_time_l1c"),
+    ('subs_avhrrgac.get_datagaps_records', 'orbits',
+     "SELECT start_time_l1c, missing_scanlines, along_track "
+     "FROM vw_std WHERE blacklist=0 AND start_time_l1c is not null AND "
+     "number_of_missing_scanlines is not null AND "
+     "number_of_missing_scanlines < 15000 AND "
+     "satellite_name='{sat}' ORDER BY start_time_l1c"),
+    ('subs_mapping.get_overlap_info', 'orbits',
+     "SELECT start_time_l1c, end_time_l1c, along_track, across_track "
+     "FROM vw_std WHERE satellite_name='{sat}' AND "
+     "start_time_l1c BETWEEN '{sdt}' AND '{edt}'"),
+    ('extract_avhrrgac_l1b: whitelisted', 'orbits',
+     "SELECT satellite_name, filename FROM vw_std WHERE blacklist=0 AND "
+     "start_time_l1c is not null AND satellite_name='{sat}' "
+     "ORDER BY start_time_l1b"),
+    ('extract_avhrrgac_l1b: blacklisted', 'orbits',
+     "SELECT satellite_name, filename FROM vw_std "
+     "WHERE blacklist_reason='{blr}' ORDER BY start_time_l1b"),
+    ('read_avhrrgac_sql.blacklist_filenames', 'orbits',
+     "UPDATE orbits SET blacklist=1, blacklist_reason='{blr}' WHERE filename IN "
+     "(SELECT filename FROM temp.blacklist_files) AND blacklist=0"),
+    ('read_avhrrgac_sql.blacklist_intervals', 'orbits',
+     "UPDATE orbits SET blacklist=1, blacklist_reason='{blr}' "
+     "WHERE blacklist=0 AND id IN (SELECT orbits.id "
+     "FROM temp.blacklist_intervals JOIN orbits "
+     "ON orbits.satellite_id = blacklist_intervals.satellite_id AND "
+     "orbits.start_time_l1b BETWEEN blacklist_intervals.start_time AND "
+     "blacklist_intervals.end_time) AND redundant=0"),
+    ('subs_plot_sql: daily statistics', 'statistics',
+     "SELECT date, GlobalMean FROM statistics WHERE "
+     "satelliteID=(SELECT id FROM satellites WHERE name='{sat}') "
+     "AND channelID=1 AND selectID=1 AND date>='{sdt}' AND date<='{edt}' "
+     "ORDER BY date"),
+    ('subs_plot_sql: daily zonal blobs', 'statistics_blob',
+     "SELECT date, ZonalMean, ZonalStdv, ZonalNobs FROM statistics_blob "
+     "WHERE satelliteID={sat_id} AND channelID=1 AND selectID=1 AND "
+     "date>='{sdt}' AND date<='{edt}' AND binsize=5.0 ORDER BY date"),
+    ('run_pystat_batch: committed days', 'statistics',
+     "SELECT DISTINCT date FROM statistics WHERE satelliteID={sat_id} "
+     "AND date BETWEEN '{sdt}' AND '{edt}'"),
+]
+
+# tables scanned on purpose: small id/name tables and the
+# temporary tables of read_avhrrgac_sql
+LOOKUP_TABLES = ('satellites', 'channels', 'selects', 'latitudes',
+                 'blacklist_files', 'blacklist_intervals')
+
+# temporary tables of read_avhrrgac_sql, created empty for the plans
+TEMP_TABLES = [
+    "CREATE TEMP TABLE IF NOT EXISTS blacklist_files "
+    "(filename TEXT PRIMARY KEY)",
+    "CREATE TEMP TABLE IF NOT EXISTS blacklist_intervals "
+    "(satellite_name TEXT, satellite_id INTEGER, "
+    "start_time TIMESTAMP, end_time TIMESTAMP)",
+]
+
+
+def get_tables(db):
+    return [row[0] for row in
+            db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+
+
+def get_index_columns(db, table):
+    """
+    Columns of all indexes of a table, including automatic indexes
+    of primary keys and unique constraints.
+    """
+    indexes = list()
+    for row in db.execute("PRAGMA index_list({0})".format(table)).fetchall():
+        cols = [r[2] for r in
+                db.execute("PRAGMA index_info({0})".format(row[1])).fetchall()]
+        indexes.append(cols)
+    return indexes
+
+
+def get_query_values(db, tables):
+    """
+    Values for the placeholders of QUERIES taken from the database,
+    i.e. the planner sees realistic statistics.
+    """
+    values = dict(sat='NOAA18', sat_id=1, blr='redundant',
+                  sdt='2008-01-01', edt='2008-01-02')
+
+    if 'satellites' in tables:
+        row = db.execute("SELECT id, name FROM satellites ORDER BY id").fetchone()
+        if row:
+            values['sat_id'] = row[0]
+            values['sat'] = row[1]
+
+    return values
+
+
+def explain(db, tables, values):
+    """
+    EXPLAIN QUERY PLAN of the tool queries.
+    :return: list of (tool, plan lines, full scan flag), plan is None
+             if the query does not fit the database
+    """
+    for cmd in TEMP_TABLES:
+        db.execute(cmd)
+
+    plans = list()
+    for (tool, table, query) in QUERIES:
+        if table not in tables:
+            continue
+        try:
+            rows = db.execute("EXPLAIN QUERY PLAN " +
+                              query.format(**values)).fetchall()
+        except sqlite3.Error as err:
+            plans.append((tool, ["not available: {0}".format(err)], False))
+            continue
+
+        # last column is the detail text in all SQLite versions
+        lines = [str(row[-1]) for row in rows]
+        scan = False
+        for line in lines:
+            words = line.split()
+            if words[0] != 'SCAN':
+                continue
+            name = words[2] if words[1] == 'TABLE' else words[1]
+            # newer SQLite versions prefix the schema, e.g. temp.
+            if name.split('.')[-1] not in LOOKUP_TABLES:
+                scan = True
+        plans.append((tool, lines, scan))
+
+    return plans
+
+
+def report(plans, title):
+    logger.info("--- Query plans {0} ---".format(title))
+    for (tool, lines, scan) in plans:
+        flag = "FULL SCAN" if scan else "ok"
+        logger.info("{0} [{1}]".format(tool, flag))
+        for line in lines:
+            logger.info("    {0}".format(line))
+
+
+def create_indexes(db, tables):
+    """
+    Create missing indexes, indexes already covered by an existing
+    index with the same leading columns are skipped.
+    :return: list of created index names
+    """
+    created = list()
+    for (name, table, cols) in INDEXES:
+        if table not in tables:
+            continue
+
+        table_cols = [row[1] for row in
+                      db.execute("PRAGMA table_info({0})".format(table))]
+        if not all(col in table_cols for col in cols):
+            logger.info("Skip {0}: columns not in {1}".format(name, table))
+            continue
+
+        if any(idx[0:len(cols)] == cols for idx in get_index_columns(db, table)):
+            continue
+
+        logger.info("Create index {0} ON {1} ({2})".
+                    format(name, table, ', '.join(cols)))
+        db.execute("CREATE INDEX IF NOT EXISTS {0} ON {1} ({2})".
+                   format(name, table, ', '.join(cols)))
+        created.append(name)
+
+    return created
+
+
+def set_journal_mode(db):
+    """
+    Switch to WAL, the journal mode is stored in the database file,
+    i.e. it applies to all connections of the tools.
+    """
+    mode = db.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+    logger.info("journal_mode={0}".format(mode))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='''%s
+    creates the indexes needed by the queries of the tools on the
+    AVHRR GAC archive database (vw_std/orbits) and on the pystat
+    database (statistics), switches the database to WAL mode and
+    runs ANALYZE. EXPLAIN QUERY PLAN of the tool queries is reported
+    before and after, queries still scanning a whole table are
+    flagged.''' % os.path.basename(__file__))
+
+    parser.add_argument('-dbf', '--dbfile', required=True,
+                        help='/path/to/database.sqlite3')
+
+    parser.add_argument('-exp', '--explain_only', action="store_true",
+                        help='Only report the query plans')
+
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.dbfile):
+        logger.info("{0} does not exist".format(args.dbfile))
+        sys.exit(1)
+
+    db = sqlite3.connect(args.dbfile, timeout=36000)
+    # transactions are handled explicitly
+    db.isolation_level = None
+
+    tables = get_tables(db)
+    values = get_query_values(db, tables)
+
+    report(explain(db, tables, values), "before")
+
+    if args.explain_only:
+        db.close()
+        sys.exit(0)
+
+    set_journal_mode(db)
+
+    db.execute("BEGIN IMMEDIATE")
+    created = create_indexes(db, tables)
+    db.execute("COMMIT")
+    logger.info("{0} indexes created".format(len(created)))
+
+    logger.info("ANALYZE")
+    db.execute("ANALYZE")
+
+    plans = explain(db, tables, values)
+    report(plans, "after")
+
+    scans = [tool for (tool, lines, scan) in plans if scan]
+    if scans:
+        logger.info("Queries still scanning a whole table: {0}".format(scans))
+    else:
+        logger.info("No query scans a whole table")
+
+    db.close()
+    logger.info("{0} finished".format(os.path.basename(__file__)))
@@ -0,0 +1,169 @@
+#
+# on-disk cache of products derived from AVHRR GAC L1c orbit files
+#
+
+import os
+import hashlib
+import tempfile
+import numpy as np
+import logging
+
+logger = logging.getLogger('root')
+
+# cache is only used if this environment variable is set
+CACHE_DIR_ENV = 'AVHRRGAC_CACHE_DIR'
+# maximum size of the cache directory in MB
+CACHE_SIZE_ENV = 'AVHRRGAC_CACHE_SIZE'
+DEFAULT_CACHE_SIZE = 2048
+
+# bytes read at start, middle and end of a file for the content hash
+SAMPLE_SIZE = 65536
+
+
+class OrbitCache(object):
+    """
+    Products derived from L1c orbit files (masks, ECT, ...) stored
+    as npz files in one directory. An entry is keyed on path, size,
+    mtime and a sampled content hash of all files it depends on,
+    i.e. changed or re-processed orbits are never served from the cache.
+    The least recently used entries are removed if the directory
+    grows beyond max_size bytes. The directory is scanned by the first
+    save and whenever the size known from the last scan plus the
+    entries saved since exceeds max_size.
+    """
+
+    def __init__(self, cache_dir, max_size=DEFAULT_CACHE_SIZE * 1024 ** 2):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self._keys = dict()
+        # size of the cache directory, None until first scanned
+        self._size = None
+
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def file_key(self, path):
+        """
+        Identity of a file: path, size, mtime and sampled content hash.
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        ident = (path, st.st_size, st.st_mtime)
+
+        if ident not in self._keys:
+            sha = hashlib.sha1(repr(ident).encode('utf-8'))
+            with open(path, 'rb') as fp:
+                for pos in (0, st.st_size // 2, st.st_size - SAMPLE_SIZE):
+                    fp.seek(max(pos, 0))
+                    sha.update(fp.read(SAMPLE_SIZE))
+            self._keys[ident] = sha.hexdigest()
+
+        return self._keys[ident]
+
+    def _entry(self, paths, name):
+        keys = [self.file_key(p) for p in paths]
+        sha = hashlib.sha1('_'.join(keys + [name]).encode('utf-8'))
+        return os.path.join(self.cache_dir, sha.hexdigest() + '.npz')
+
+    def load(self, paths, name):
+        """
+        :param paths: files the product depends on
+        :param name: product name, e.g. 'geo_mask'
+        :return: dict of arrays or None if not cached
+        """
+        try:
+            entry = self._entry(paths, name)
+            if not os.path.isfile(entry):
+                return None
+            npz = np.load(entry)
+            try:
+                arrays = dict((k, npz[k]) for k in npz.files)
+            finally:
+                npz.close()
+            # mark as recently used
+            os.utime(entry, None)
+            return arrays
+        except (IOError, OSError, ValueError) as err:
+            logger.info("Cache load failed for {0}: {1}".format(name, err))
+            return None
+
+    def save(self, paths, name, **arrays):
+        """
+        Store arrays of a product, see L{load}.
+        """
+        try:
+            entry = self._entry(paths, name)
+            # write to temporary file and rename, i.e. other processes
+            # never see a partial entry; no .npz suffix, i.e. evict
+            # of other processes does not take it for an entry
+            fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=self.cache_dir)
+            try:
+                with os.fdopen(fd, 'wb') as fp:
+                    np.savez_compressed(fp, **arrays)
+                size = os.path.getsize(tmp)
+                os.rename(tmp, entry)
+            except (IOError, OSError, ValueError):
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+
+            if self._size is None:
+                self.evict()
+            else:
+                self._size += size
+                if self._size > self.max_size:
+                    self.evict()
+        except (IOError, OSError, ValueError) as err:
+            logger.info("Cache save failed for {0}: {1}".format(name, err))
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache
+        is not larger than max_size. Temporary files of entries
+        being written are ignored.
+        """
+        entries = list()
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.npz'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+        self._size = total
+
+
+_cache = None
+
+
+def get_cache():
+    """
+    Cache configured by the environment (AVHRRGAC_CACHE_DIR and
+    AVHRRGAC_CACHE_SIZE in MB) or None if caching is disabled.
+    """
+    global _cache
+
+    cache_dir = os.environ.get(CACHE_DIR_ENV)
+    if not cache_dir:
+        return None
+
+    if _cache is None or _cache.cache_dir != cache_dir:
+        size = float(os.environ.get(CACHE_SIZE_ENV, DEFAULT_CACHE_SIZE))
+        _cache = OrbitCache(cache_dir, int(size * 1024 ** 2))
+
+    return _cache
@@ -11,6 +11,7 @@ from subs_avhrrgac import str2upper
 from subs_avhrrgac import pre_blacklist_reasons
 from subs_avhrrgac import proc_blacklist_reasons
 from subs_avhrrgac import post_blacklist_reasons
+from subs_avhrrgac import get_blacklist_counts, count_blacklisted
 from pycmsaf.avhrr_gac.database import AvhrrGacDatabase
 from pycmsaf.logger import setup_root_logger
 
@@ -19,7 +20,7 @@ logger = setup_root_logger(name='root', logdir=logdir,
                            append=True, logfile=True)
 
 
-def collect_histo_information( db, btype, bdict, l1bs, xcnt, xlab, ylab, cols, 
+def collect_histo_information( counts, btype, bdict, l1bs, xcnt, xlab, ylab, cols, 
                                satname=None ):
 
     logger.info("--------------------------------------------------------------")
@@ -41,7 +42,7 @@ def collect_histo_information( db, btype, bdict, l1bs, xcnt, xlab, ylab, cols,
     # --- each kind of btype
     for key in sorted( bdict ): 
         cnt = 0.0 
-        cnt = float( print_changes( db, bdict[key], satname ) )
+        cnt = float( print_changes( counts, bdict[key], satname ) )
         sum_cnt += cnt
         freq = 100.0 * ( cnt / l1bs )
         xlab.append(  bdict [key] )
@@ -68,66 +69,24 @@ def collect_histo_information( db, btype, bdict, l1bs, xcnt, xlab, ylab, cols,
         sys.exit(0)
 
 
-def print_changes(db, reason, satname=None):
+def print_changes(counts, reason, satname=None):
     """
     PRINT results to screen.
+    :param counts: blacklist counts, see get_blacklist_counts
+    :param satname: satellite name
+    :return: number of orbits
     """
-    postdict = post_blacklist_reasons()
-    sqltxt = "SELECT COUNT(*) FROM vw_std WHERE "
     logtxt = "{0:26s} -> {1:8d} orbits "
 
-    if reason is 'all_l1b':
-        sqltxt = sqltxt + "filename is not null "
-    elif reason is 'all_blacklisted':
-        sqltxt = sqltxt + "filename is not null AND blacklist=1 "
-    elif reason is 'all_l1b_white':
-        sqltxt = sqltxt + "filename is not null AND blacklist=0 "
-    elif reason is 'all_l1c_white':
-        sqltxt = sqltxt + "start_time_l1c is not null AND blacklist=0 "
-    elif reason is 'all_l1c_missing':
-        sqltxt = sqltxt + "start_time_l1c is null AND blacklist=0 "
-
-    elif reason is 'pygac_failed':
-        sqltxt = sqltxt + "( start_time_l1c is null AND blacklist=0 "
-        if satname:
-            sqltxt = sqltxt + "AND satellite_name=\'{sat}\' "
-        for key in sorted(postdict):
-            if 'wrong' in postdict[key]:
-                continue
-            if 'indexerror' in postdict[key]:
-                continue
-            if 'along_track' in postdict[key]:
-                continue
-            sqltxt = sqltxt + ") OR ( start_time_l1c is null AND "
-            sqltxt = sqltxt + "blacklist_reason=\'{0}\' ".format(postdict[key])
-            if satname:
-                sqltxt = sqltxt + "AND satellite_name=\'{sat}\' "
-        sqltxt = sqltxt + ") "
-
-    elif reason is 'redundant':
-        sqltxt = sqltxt + "redundant=1 AND blacklist=1 AND blacklist_reason LIKE 'NSS%' "
-        logtxt = logtxt + "blacklisted "
-    else:
-        sqltxt = sqltxt + "blacklist_reason=\'{0}\' ".format(reason)
+    if not reason.startswith('all_') and reason != 'pygac_failed':
         logtxt = logtxt + "blacklisted "
 
+    if satname:
+        logtxt = logtxt + "for {2}"
 
-    if sqltxt:
-        if satname:
-            sqltxt = sqltxt + "AND satellite_name=\'{sat}\'"
-            logtxt = logtxt + "for {2}"
-            cmd = sqltxt.format(sat=satname)
-            res = db.execute(cmd)
-            num = res[0]['COUNT(*)']
-            logger.info(logtxt.format(reason,num,satname))
-            return num
-        else:
-            res = db.execute(sqltxt)
-            num = res[0]['COUNT(*)']
-            logger.info(logtxt.format(reason,num))
-            return num
-    else:
-        logger.info("{0} case is not yet defined!".format(reason))
+    num = count_blacklisted(counts, reason, satname)
+    logger.info(logtxt.format(reason, num, satname))
+    return num
 
 
 if __name__ == '__main__':
@@ -183,10 +142,11 @@ if __name__ == '__main__':
     dbfile = AvhrrGacDatabase(dbfile=args.dbfile,
                               timeout=36000, exclusive=True)
 
+    # -- orbit counts per blacklist reason and satellite
+    counts = get_blacklist_counts(dbfile)
+
     # -- get total amount of l1b files
-    cmd = "SELECT COUNT(*) FROM vw_std WHERE filename is not null"
-    out = dbfile.execute(cmd)
-    all_files = float( out[0]['COUNT(*)'] )
+    all_files = float( count_blacklisted(counts, 'all_l1b') )
 
     # -- initialize lists for plotting
     x_cnts = list() # counts of blacklisted orbits
@@ -203,15 +163,15 @@ if __name__ == '__main__':
 
     # -- collect information for plotting
     if args.black_pre: 
-        collect_histo_information( dbfile, 'pre', predict, all_files, 
+        collect_histo_information( counts, 'pre', predict, all_files, 
                 x_cnts, x_axis, y_axis, colors, args.satellite )
 
     if args.black_proc: 
-        collect_histo_information( dbfile, 'proc', procdict, all_files, 
+        collect_histo_information( counts, 'proc', procdict, all_files, 
                 x_cnts, x_axis, y_axis, colors, args.satellite )
 
     if args.black_post: 
-        collect_histo_information( dbfile, 'post', postdict, all_files, 
+        collect_histo_information( counts, 'post', postdict, all_files, 
                 x_cnts, x_axis, y_axis, colors, args.satellite )
 
 
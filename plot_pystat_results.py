@@ -20,7 +20,7 @@ logger = setup_root_logger(name='root', logdir=logdir, append=True, logfile=True
 def plot_results(dbcursor, params, start_date, end_date):
     """
     Plot PySTAT results.
-    :param dbcursor: sqlite cursor
+    :param dbcursor: sqlite cursor or psql.StatisticsCube
     :param params: passed arguments
     :param start_date: first date to be considered
     :param end_date: last date to be considered
@@ -44,10 +44,23 @@ def plot_results(dbcursor, params, start_date, end_date):
             logger.info("Provide two channels using --channels argument")
             return
     else:
+        # id and latitude lookups are read once for all zonal plots
+        if isinstance(dbcursor, psql.StatisticsCube):
+            reader = dbcursor
+        else:
+            reader = psql.ZonalStatsReader(dbcursor, params.binsize)
         for channel in params.channels:
             for select in params.times:
                 if params.target == 'global':
-                    if params.linfit:
+                    if params.period:
+                        psql.plot_pooled_series(sat_list=params.satellites,
+                                                channel=channel, select=select,
+                                                start_date=start_date, end_date=end_date,
+                                                outpath=params.outdir, cursor=dbcursor,
+                                                period=params.period,
+                                                show_fig=params.show_figure,
+                                                linesty=params.linestyle, reader=reader)
+                    elif params.linfit:
                         psql.plot_time_series_linfit(sat_list=params.satellites,
                                                      channel=channel, select=select,
                                                      start_date=start_date, end_date=end_date,
@@ -66,7 +79,8 @@ def plot_results(dbcursor, params, start_date, end_date):
                                             channel=channel, select=select,
                                             start_date=start_date, end_date=end_date,
                                             outpath=params.outdir, cur=dbcursor, target=params.target,
-                                            verbose=params.verbose, show_fig=params.show_figure)
+                                            verbose=params.verbose, show_fig=params.show_figure,
+                                            reader=reader)
         return
 
 
@@ -75,9 +89,14 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='''%s displays pystat results, i.e. daily global and
     zonal means and standard deviations stored in a sqlite database.''' % os.path.basename(__file__))
 
-    parser.add_argument('-db', '--dbfile', type=str, required=True,
+    source = parser.add_mutually_exclusive_group(required=True)
+
+    source.add_argument('-db', '--dbfile', type=str,
                         help='String, e.g. /path/to/db.sqlite3')
 
+    source.add_argument('-col', '--columnar', type=str,
+                        help='HDF5 file of export_columnar.py, read instead of -db')
+
     parser.add_argument('-out', '--outdir', type=str, required=True,
                         help='Path, e.g. /path/to/plot.png')
 
@@ -102,10 +121,18 @@ if __name__ == '__main__':
                         -tar zonal plots zonal daily statistics per date/channel/satellite/time selection.
                         -tar zonalall plots all available satellite zonal statistics per date/channel/time.''')
 
+    parser.add_argument('-b', '--binsize', type=float,
+                        help='Binsize of the zonal statistics stored as blobs '
+                             '(statistics_blob), required if several are stored')
+
     parser.add_argument('-fit', '--linfit', action="store_true",
                         help='''If you want to plot a time series including a
                         linear regression (plot per satellite/channel/time).''')
 
+    parser.add_argument('-per', '--period', type=str, choices=['month', 'year'],
+                        help='''Plot monthly or yearly global statistics pooled
+                        from the daily ones [only for -tar global].''')
+
     parser.add_argument('-ver', '--verbose', action="store_true", help='increase output verbosity')
 
     parser.add_argument('-show', '--show_figure', action="store_true", help='Show figure.')
@@ -129,6 +156,13 @@ if __name__ == '__main__':
     if len(sys.argv[1:]) > 0: 
         logger.info("{0}\n".format(sys.argv[1:]))
 
+    # -- read exported cubes instead of the SQL file
+    if args.columnar:
+        with psql.StatisticsCube(args.columnar) as cube:
+            plot_results(dbcursor=cube, params=args, start_date=sdate, end_date=edate)
+        logger.info("{0} successfully finished\n\n".format(sys.argv[0]))
+        sys.exit(0)
+
     # -- open SQL file and plot data
     try:
         dbfile = lite.connect(args.dbfile, detect_types=lite.PARSE_DECLTYPES | lite.PARSE_COLNAMES)
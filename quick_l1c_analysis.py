@@ -14,6 +14,76 @@ class CountError(Exception):
     pass
 
 
+# tables and views of the quick analysis database
+TABLES = [
+    # PyGAC Version being processed
+    'CREATE TABLE IF NOT EXISTS pygac_versions '
+    '(id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)',
+
+    # Satellites
+    'CREATE TABLE IF NOT EXISTS satellites '
+    '(id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)',
+
+    # Channels
+    'CREATE TABLE IF NOT EXISTS channels '
+    '(id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)',
+
+    # Orbits
+    'CREATE TABLE IF NOT EXISTS orbits '
+    '(id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)',
+
+    # pygac processing general information
+    'CREATE TABLE IF NOT EXISTS procs '
+    '(orbit_id INTEGER NOT NULL, '
+    'satellite_id INTEGER NOT NULL, '
+    'pygac_version_id INTEGER NOT NULL, '
+    'start_time_l1c TIMESTAMP, '
+    'end_time_l1c TIMESTAMP, '
+    'pygac_runtime FLOAT, '
+    'pygac_errors TEXT, '
+    'pygac_warnings TEXT, '
+    'FOREIGN KEY (orbit_id) REFERENCES orbits(id) '
+    'FOREIGN KEY (satellite_id) REFERENCES satellites(id) '
+    'FOREIGN KEY (pygac_version_id) REFERENCES pygac_versions(id) '
+    'PRIMARY KEY (orbit_id, satellite_id, pygac_version_id)'
+    ')',
+
+    # channel statistics based on pygac output
+    'CREATE TABLE IF NOT EXISTS stats '
+    '(orbit_id INTEGER NOT NULL, '
+    'satellite_id INTEGER NOT NULL, '
+    'pygac_version_id INTEGER NOT NULL, '
+    'channel_id INTEGER NOT NULL, '
+    'min_val FLOAT, '
+    'max_val FLOAT, '
+    'mean_val FLOAT, '
+    'number_of_total_obs INTEGER, '
+    'number_of_masked_obs INTEGER, '
+    'number_of_valid_obs INTEGER, '
+    'FOREIGN KEY (orbit_id) REFERENCES orbits(id) '
+    'FOREIGN KEY (satellite_id) REFERENCES satellites(id) '
+    'FOREIGN KEY (pygac_version_id) REFERENCES pygac_versions(id) '
+    'FOREIGN KEY (channel_id) REFERENCES channels(id) '
+    'PRIMARY KEY (orbit_id, satellite_id, pygac_version_id, channel_id)'
+    ')',
+
+    # Create views
+    'CREATE VIEW IF NOT EXISTS vw_procs as '
+    'SELECT t.*, o.name as orbit_name, s.name as satellite_name, '
+    'p.name as pygac_version_name '
+    'FROM procs t, orbits o, satellites s, pygac_versions p '
+    'WHERE t.satellite_id = s.id AND t.orbit_id = o.id '
+    'AND t.pygac_version_id = p.id',
+
+    'CREATE VIEW IF NOT EXISTS vw_stats as '
+    'SELECT a.*, o.name as orbit_name, s.name as satellite_name, '
+    'p.name as pygac_version_name, c.name as channel_name '
+    'FROM stats a, orbits o, satellites s, pygac_versions p, channels c '
+    'WHERE a.satellite_id = s.id AND a.orbit_id = o.id '
+    'AND a.pygac_version_id = p.id AND a.channel_id = c.id',
+]
+
+
 class DatabaseMod(Database):
     def execute(self, sql, params=None, allow_none=True):
         """
@@ -59,82 +129,8 @@ class QuickDatabase(DatabaseMod):
         Initialize tables.
         :return:
         """
-        # PyGAC Version being processed
-        self.curs.execute(
-            'CREATE TABLE IF NOT EXISTS pygac_versions '
-            '(id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)')
-
-        # Satellites
-        self.curs.execute(
-            'CREATE TABLE IF NOT EXISTS satellites '
-            '(id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)')
-
-        # Channels
-        self.curs.execute(
-            'CREATE TABLE IF NOT EXISTS channels '
-            '(id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)')
-
-        # Orbits
-        self.curs.execute(
-            'CREATE TABLE IF NOT EXISTS orbits '
-            '(id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)')
-
-        # pygac processing general information
-        self.curs.execute(
-            'CREATE TABLE IF NOT EXISTS procs '
-            '(orbit_id INTEGER NOT NULL, '
-            'satellite_id INTEGER NOT NULL, '
-            'pygac_version_id INTEGER NOT NULL, '
-            'start_time_l1c TIMESTAMP, '
-            'end_time_l1c TIMESTAMP, '
-            'pygac_runtime FLOAT, '
-            'pygac_errors TEXT, '
-            'pygac_warnings TEXT, '
-            'FOREIGN KEY (orbit_id) REFERENCES orbits(id) '
-            'FOREIGN KEY (satellite_id) REFERENCES satellites(id) '
-            'FOREIGN KEY (pygac_version_id) REFERENCES pygac_versions(id) '
-            'PRIMARY KEY (orbit_id, satellite_id, pygac_version_id)'
-            ')'
-        )
-
-        # channel statistics based on pygac output
-        self.curs.execute(
-            'CREATE TABLE IF NOT EXISTS stats '
-            '(orbit_id INTEGER NOT NULL, '
-            'satellite_id INTEGER NOT NULL, '
-            'pygac_version_id INTEGER NOT NULL, '
-            'channel_id INTEGER NOT NULL, '
-            'min_val FLOAT, '
-            'max_val FLOAT, '
-            'mean_val FLOAT, '
-            'number_of_total_obs INTEGER, '
-            'number_of_masked_obs INTEGER, '
-            'number_of_valid_obs INTEGER, '
-            'FOREIGN KEY (orbit_id) REFERENCES orbits(id) '
-            'FOREIGN KEY (satellite_id) REFERENCES satellites(id) '
-            'FOREIGN KEY (pygac_version_id) REFERENCES pygac_versions(id) '
-            'FOREIGN KEY (channel_id) REFERENCES channels(id) '
-            'PRIMARY KEY (orbit_id, satellite_id, pygac_version_id, channel_id)'
-            ')'
-        )
-
-        # Create views
-        self.curs.execute(
-            'CREATE VIEW IF NOT EXISTS vw_procs as '
-            'SELECT t.*, o.name as orbit_name, s.name as satellite_name, '
-            'p.name as pygac_version_name '
-            'FROM procs t, orbits o, satellites s, pygac_versions p '
-            'WHERE t.satellite_id = s.id AND t.orbit_id = o.id '
-            'AND t.pygac_version_id = p.id'
-        )
-        self.curs.execute(
-            'CREATE VIEW IF NOT EXISTS vw_stats as '
-            'SELECT a.*, o.name as orbit_name, s.name as satellite_name, '
-            'p.name as pygac_version_name, c.name as channel_name '
-            'FROM stats a, orbits o, satellites s, pygac_versions p, channels c '
-            'WHERE a.satellite_id = s.id AND a.orbit_id = o.id '
-            'AND a.pygac_version_id = p.id AND a.channel_id = c.id'
-        )
+        for sql_query in TABLES:
+            self.curs.execute(sql_query)
 
     def insert_record(self, table, records):
         """
@@ -186,6 +182,27 @@ class QuickDatabase(DatabaseMod):
 
         return sat_id, orb_id, pyg_id
 
+    def get_processed_orbits(self, pyg_ver):
+        """
+        Orbits already processed with a pygac version, using one query.
+        An orbit failed if no L1c file was produced (no start_time_l1c)
+        or pygac errors were recorded.
+        :param pyg_ver: pygac version
+        :return: set of successful orbit names, set of failed orbit names
+        """
+        sql_query = "SELECT o.name, t.start_time_l1c, t.pygac_errors " \
+                    "FROM procs t, orbits o, pygac_versions p " \
+                    "WHERE t.orbit_id = o.id AND t.pygac_version_id = p.id " \
+                    "AND p.name = ?"
+        done = set()
+        failed = set()
+        for row in self.execute(sql_query, params=[(pyg_ver,)]):
+            if row[1] is None or row[2] is not None:
+                failed.add(row[0])
+            else:
+                done.add(row[0])
+        return done, failed
+
     def insert_stats(self, table, sat_id, orb_id, pyg_id, channel, stat_list):
         """
         Insert statistics information
@@ -246,49 +263,121 @@ def get_l1c_timestamps(l1c_filename):
         return None, None
 
 
-def collect_stats(h5file, data):
+def collect_stats(var, channel):
     """
-    Read h5file and collect stats for specified channel.
-    :param h5file: pygac output file = l1c file
+    Collect stats for specified channel of an already opened orbit.
+    Min, max and sum are computed on the raw integer counts,
+    gain and offset are applied to these summary values only
+    (scaling is linear, a negative gain swaps min and max).
+    The mean is exact up to float64 rounding of the scaling, i.e. it
+    may differ from the mean of the scaled data in the last digits.
+    :param var: read_avhrrgac_h5.ScaledVariable of the channel
+    :param channel: channel name, e.g. 'ch1'
     :return: min, max, mean, number of missing data
     """
     import numpy as np
-    # read data
-    f = h5py.File(h5file, "r+")
-    var, var_name, unscaled, fillv = rh5.read_var(f, data, unscaled=True)
+    unscaled = var.raw()
+    fillv = var.missingdata
 
-    # VIS reflectance between 0 and 1
-    if data == 'image1' or data == 'image2' or data == 'image6':
-        var[:] = var[:] / 100.
+    # valid observations, i.e. neither missing data nor no data
+    missing = unscaled == fillv
+    valid = np.logical_not(np.logical_or(missing, unscaled == var.nodata))
+    values = unscaled[valid]
 
     # min/max/mean of orbit based on scaled obs: data*gain + offset
-    if np.ma.count(var) > 0:
-        minv = float(var.min())
-        maxv = float(var.max())
-        meanv = float(var.mean())
+    if values.size > 0:
+        scaled = [var.gain * values.min() + var.offset,
+                  var.gain * values.max() + var.offset,
+                  var.gain * (values.sum(dtype=np.int64) / float(values.size)) +
+                  var.offset]
+        # VIS reflectance between 0 and 1
+        if channel in ('ch1', 'ch2', 'ch3a'):
+            scaled = [val / 100. for val in scaled]
+        (minv, maxv, meanv) = [float(val) for val in scaled]
+        if var.gain < 0:
+            (minv, maxv) = (maxv, minv)
     else:
         minv = float(fillv)
         maxv = float(fillv)
         meanv = float(fillv)
 
     # count valid and invalid observations
-    mask = np.ma.masked_equal(unscaled, fillv)
-    total_obs = int(np.ma.count(unscaled))
-    masked_obs = int(np.ma.count_masked(mask))
-    not_masked_obs = int(np.ma.count(mask))
-
-    if total_obs != (masked_obs + not_masked_obs):
-        raise CountError(
-            logger.info("Something is wrong here: "
-                        "total_obs:{0} != masked_obs:{1} + not_masked_obs:{2}".
-                        format(total_obs, masked_obs, not_masked_obs))
-        )
+    total_obs = int(unscaled.size)
+    masked_obs = int(np.count_nonzero(missing))
+    not_masked_obs = total_obs - masked_obs
 
     return [minv, maxv, meanv, total_obs, masked_obs, not_masked_obs]
 
 
+def analyse_l1c(l1c_file):
+    """
+    Quick analysis of all channels of a l1c output file.
+    :param l1c_file: full qualified l1c file
+    :return: list of (channel, stat_list), see L{collect_stats}
+    """
+    channels = subs.get_channel_list()
+
+    f = h5py.File(l1c_file, "r")
+    index = rh5.get_dataset_index(f)
+    images = dict(zip(channels, subs.get_avhrr_h5image_list()))
+
+    stats = [collect_stats(var=index[images[cha]], channel=cha) for cha in channels]
+    f.close()
+
+    return zip(channels, stats)
+
+
+def store_records(db, l1b_file, l1c_file, pygac_version,
+                  pygac_took, pygac_errors, pygac_warnings, stats):
+    """
+    Job of sqlite_writer.py: store the records of L{collect_records}
+    using the connection of the writer. IDs are looked up by name
+    within the statements.
+    :param db: sqlite3 connection
+    :param stats: list of (channel, stat_list), empty if no l1c file
+    """
+    for sql_query in TABLES:
+        db.execute(sql_query)
+
+    orbit = os.path.basename(l1b_file)
+    platform = get_platform_name(l1b_filename=l1b_file)
+    sta, end = get_l1c_timestamps(l1c_filename=l1c_file)
+
+    # -- insert records for assisting tables
+    names = [('satellites', subs.get_satellite_list()),
+             ('channels', subs.get_channel_list()),
+             ('pygac_versions', [pygac_version]),
+             ('orbits', [orbit])]
+    for table, records in names:
+        db.executemany('INSERT OR IGNORE INTO {table} (name) VALUES (?)'.
+                       format(table=table), [(rec,) for rec in records])
+
+    ids = '(SELECT id FROM orbits WHERE name = ?), ' \
+          '(SELECT id FROM satellites WHERE name = ?), ' \
+          '(SELECT id FROM pygac_versions WHERE name = ?)'
+    id_names = [orbit, platform, pygac_version]
+
+    # -- insert processing information
+    err = '|'.join(pygac_errors) if len(pygac_errors) > 0 else None
+    warn = '|'.join(pygac_warnings) if len(pygac_warnings) > 0 else None
+    db.execute('INSERT OR REPLACE INTO procs (orbit_id, satellite_id, '
+               'pygac_version_id, start_time_l1c, end_time_l1c, '
+               'pygac_runtime, pygac_errors, pygac_warnings) '
+               'VALUES({ids}, ?, ?, ?, ?, ?)'.format(ids=ids),
+               id_names + [sta, end, pygac_took, err, warn])
+
+    # -- insert statistics information
+    records = [tuple(id_names + [channel] + stat_list)
+               for channel, stat_list in stats]
+    db.executemany('INSERT OR REPLACE INTO stats (orbit_id, satellite_id, '
+                   'pygac_version_id, channel_id, min_val, max_val, mean_val, '
+                   'number_of_total_obs, number_of_masked_obs, number_of_valid_obs) '
+                   'VALUES({ids}, (SELECT id FROM channels WHERE name = ?), '
+                   '?, ?, ?, ?, ?, ?)'.format(ids=ids), records)
+
+
 def collect_records(l1b_file, l1c_file, sql_file, pygac_version,
-                    pygac_took, pygac_errors, pygac_warnings):
+                    pygac_took, pygac_errors, pygac_warnings, writer=None):
     """
     Make a quick analysis of l1c output file and store it into a SQLite database.
     :param l1b_file: full qualified l1b file
@@ -299,15 +388,26 @@ def collect_records(l1b_file, l1c_file, sql_file, pygac_version,
     :param pygac_took: total seconds of pygac runtime
     :param pygac_errors: list of error messages from pygac
     :param pygac_warnings: list of warning messages from pygac
+    :param writer: sqlite_writer.WriterClient, records are sent to the
+                   writer of sql_file instead of opening the database
     :return:
     """
+    # -- get stats for each channel of l1c orbit
+    stats = list()
+    if l1c_file:
+        stats = analyse_l1c(l1c_file)
+
+    if writer:
+        writer.submit(store_records, l1b_file, l1c_file, pygac_version,
+                      pygac_took, pygac_errors, pygac_warnings, stats)
+        return
+
     # -- open SQLite database
     db = QuickDatabase(dbfile=sql_file, timeout=36000, create=True)
 
     # -- prepare satellite and channel records
     satellites = subs.get_satellite_list()
     channels = subs.get_channel_list()
-    images = subs.get_avhrr_h5image_list()
     sat_records = list()
     cha_records = list()
     for sat in satellites:
@@ -326,12 +426,9 @@ def collect_records(l1b_file, l1c_file, sql_file, pygac_version,
                                                pyg_ver=pygac_version, prun=pygac_took,
                                                perr=pygac_errors, pwarn=pygac_warnings)
 
-    # -- get stats for each channel of l1c orbit
-    if l1c_file:
-        for data, channel in zip(images, channels):
-            stat_list = collect_stats(h5file=l1c_file, data=data)
-            db.insert_stats(table='stats', sat_id=sat_id, orb_id=orb_id, pyg_id=pyg_id,
-                            channel=channel, stat_list=stat_list)
+    for channel, stat_list in stats:
+        db.insert_stats(table='stats', sat_id=sat_id, orb_id=orb_id, pyg_id=pyg_id,
+                        channel=channel, stat_list=stat_list)
 
     db.commit_changes()
     db.close()
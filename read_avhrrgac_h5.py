@@ -2,10 +2,12 @@
 # reading avhrrgac level 1c H5 files
 # 
 
+import datetime
 import numpy as np
 import numpy.ma as ma
-import scipy.weave as weave
 from scipy.ndimage.filters import uniform_filter
+import subs_avhrrgac as subs
+import orbit_cache
 from pycmsaf.logger import setup_root_logger
 
 logger = setup_root_logger(name='root')
@@ -34,54 +36,23 @@ def gridbox_mean(data, fill_value, box_size):
     # Fill masked elements
     fdata = data.astype('f8').filled(fill_value)
 
-    # Allocate filtered image
-    filtered = np.zeros(data.shape, dtype='f8')
-    nrows, ncols = data.shape
-
-    c_code = """
-    int row, col, rowbox, colbox, nbox;
-    double fill_value_d = (double) fill_value;
-    int radius = (box_size-1)/2;
-
-
-    for(row=0; row<nrows; row++)
-    {
-        for(col=0; col<ncols; col++)
-        {
-            filtered(row,col) = 0;
-            nbox = 0;
-            for(rowbox=row-radius; rowbox<=row+radius; rowbox++)
-            {
-                for(colbox=col-radius; colbox<=col+radius; colbox++)
-                {
-                    if(rowbox >= 0 && rowbox < nrows && colbox >= 0 and colbox < ncols)
-                    {
-                        if(fdata(rowbox,colbox) != fill_value_d)
-                        {
-                            filtered(row,col) += fdata(rowbox,colbox);
-                            nbox += 1;
-                        }
-                    }
-                }
-            }
-            if(nbox > 0)
-            {
-                filtered(row,col) /= (double) nbox;
-            }
-        }
-    }
-    return_val=0;
-    """
+    # Valid elements and their values (0 elsewhere)
+    valid = fdata != fill_value
+    values = np.where(valid, fdata, 0.)
 
-    # Execute inline C code
-    err = weave.inline(
-        c_code,
-        ['fdata', 'filtered', 'fill_value', 'box_size', 'nrows', 'ncols'],
-        type_converters=weave.converters.blitz,
-        compiler="gcc"
-    )
-    if err != 0:
-        raise RuntimeError('Blitz failed with returncode {0}'.format(err))
+    # Box sums of values and valid elements: uniform_filter is a
+    # separable running mean, i.e. O(N) independent of box_size.
+    # Elements outside the image are 0 (mode='constant'), so only
+    # valid elements inside the image are taken into account.
+    box_vals = uniform_filter(values, size=box_size, mode='constant', cval=0.)
+    box_valid = uniform_filter(valid.astype('f8'), size=box_size,
+                               mode='constant', cval=0.)
+    nbox = np.rint(box_valid * box_size * box_size)
+
+    # Mean of valid elements, 0 if there is none
+    filtered = np.zeros(data.shape, dtype='f8')
+    good = nbox > 0
+    filtered[good] = box_vals[good] / box_valid[good]
 
     # Re-mask fill values
     return np.ma.masked_equal(filtered, fill_value)
@@ -97,6 +68,9 @@ def gridbox_std(data, box_size, fill_value):
         std = sqrt( mean(data^2) - mean(data)^2 )
 
     we can use L{gridbox_mean} to compute the standard deviation.
+    Tiny negative variances due to rounding are set to 0, i.e. the
+    standard deviation is 0 instead of masked (as in the former
+    weave implementation) for boxes of (nearly) constant values.
 
     @param data: 2D masked array
     @param fill_value: Value to be used to fill masked elements
@@ -106,7 +80,62 @@ def gridbox_std(data, box_size, fill_value):
     """
     mean_squared = np.square(gridbox_mean(data, box_size=box_size, fill_value=fill_value))
     squared_mean = gridbox_mean(np.square(data), box_size=box_size, fill_value=fill_value)
-    return np.ma.sqrt(squared_mean - mean_squared)
+    return np.ma.sqrt(np.ma.maximum(squared_mean - mean_squared, 0.))
+
+
+def tsm_mask(tar1, tar2, tar4, tar5, box_size=3, fill_value=-9999.0):
+    """
+    Temporary scan motor issue detector.
+    Pixels are bad if the C{box_size} x C{box_size} standard deviation of
+    abs(ch1 - ch2) is larger than 0.02 and the one of 100*(ch4 - ch5)/ch5
+    is larger than 2.0. Both standard deviations are computed like
+    L{gridbox_std}, but the box sums of both differences, their squares
+    and their valid elements are filtered in one uniform_filter pass.
+
+    @param tar1: channel 1 (masked array)
+    @param tar2: channel 2 (masked array)
+    @param tar4: channel 4 (masked array)
+    @param tar5: channel 5 (masked array)
+    @param box_size: Box size
+    @param fill_value: Value to be used to fill masked elements
+    @return: bad pixel mask
+    @rtype: numpy.ndarray (bool)
+    """
+    if not box_size % 2 == 1:
+        raise ValueError('Box size must be odd.')
+
+    # absolute difference because ch1 is very similar to ch2
+    abs_d12 = abs(tar1 - tar2)
+    # relative difference because ch4 and ch5 differ
+    rel_d45 = 100.0*(tar4 - tar5)/tar5
+
+    nrows, ncols = abs_d12.shape
+    stack = np.zeros((6, nrows, ncols), dtype='f8')
+
+    for i, diff in enumerate((abs_d12, rel_d45)):
+        fdata = diff.astype('f8').filled(fill_value)
+        valid = fdata != fill_value
+        stack[i] = np.where(valid, fdata, 0.)
+        stack[i + 2] = np.square(stack[i])
+        stack[i + 4] = valid
+
+    # box means of [d12, d45, d12^2, d45^2, valid12, valid45]
+    stack = uniform_filter(stack, size=(1, box_size, box_size),
+                           mode='constant', cval=0.)
+
+    bad = None
+    for i, limit in ((0, 0.02), (1, 2.00)):
+        nbox = np.rint(stack[i + 4] * box_size * box_size)
+        good = nbox > 0
+        mean = np.zeros((nrows, ncols), dtype='f8')
+        sqmean = np.zeros((nrows, ncols), dtype='f8')
+        mean[good] = stack[i][good] / stack[i + 4][good]
+        sqmean[good] = stack[i + 2][good] / stack[i + 4][good]
+        var = np.maximum(sqmean - np.square(mean), 0.)
+        flag = np.sqrt(var) > limit
+        bad = flag if bad is None else np.logical_and(bad, flag)
+
+    return bad
 
 
 def get_stddev(data, size): 
@@ -139,16 +168,37 @@ def read_qualflags(fil):
 
 
 # first column in data is Scan Line Number, starting with 1 (not 0)
-def find_scanline_gaps(col, rows, qdata):
-    gap_list = list()
-    scanline_list = np.array(qdata[:, col].tolist())
+def find_scanline_gaps(col, rows, qdata, ranges=None):
+    """
+    Scanline numbers 1 ... rows which are missing in column col of qdata.
+    :param ranges: return run-length ranges (see L{scanline_ranges})
+                   instead of the flat list
+    :return: list of missing scanline numbers or ranges
+    """
+    scanline_list = np.asarray(qdata[:, col])
+    gaps = np.setdiff1d(np.arange(1, rows + 1), scanline_list)
+
+    if ranges:
+        return scanline_ranges(gaps)
 
-    for i in range(rows):
-        i += 1
-        if i not in scanline_list:
-            gap_list.append(i)
+    return gaps.tolist()
 
-    return gap_list
+
+def scanline_ranges(gaps):
+    """
+    Run-length encoding of sorted missing scanline numbers.
+    :param gaps: sorted list/array of missing scanline numbers
+    :return: list of [start, length]
+    """
+    gaps = np.asarray(gaps, dtype=np.int64)
+    if gaps.size == 0:
+        return list()
+
+    breaks = np.where(np.diff(gaps) != 1)[0] + 1
+    starts = np.concatenate(([0], breaks))
+    ends = np.concatenate((breaks, [gaps.size]))
+
+    return [[int(gaps[i]), int(j - i)] for i, j in zip(starts, ends)]
 
 
 def get_data_size(fil):
@@ -163,71 +213,132 @@ def get_data_size(fil):
                 return x, y
 
 
-def read_var(fil, var_str, unscaled=None):
+def read_rows(dset, rows=None):
+    """
+    Read all or a slice of scanlines (first dimension) of a h5 dataset.
+    Only the selected hyperslab is read from disk.
+    """
+    if rows is None:
+        return dset.value
+    return dset[rows]
+
+
+def get_dataset_index(fil):
+    """
+    Index of all variables in a h5 file provided by PyGAC, i.e.
+    top level groups (e.g. 'image1') and their subgroups (e.g. 'lat'
+    in 'where') having 'data' and 'what'. Top level groups take
+    precedence, as in the former search of L{read_var}.
+    :param fil: avhrr/sunsatangles/qualflags h5 file
+    :return: dict [variable] = L{ScaledVariable}
+    """
+    index = dict()
+    children = dict()
+
+    for key in fil.keys():
+        g = fil['/' + key + '/']
+        if not hasattr(g, 'keys'):
+            continue
+        if 'data' in g and 'what' in g:
+            index[key] = ScaledVariable(g)
+        for key2 in g.keys():
+            sub = g[key2]
+            if key2 not in children and hasattr(sub, 'keys') \
+                    and 'data' in sub and 'what' in sub:
+                children[key2] = sub
+
+    for key2 in children:
+        if key2 not in index:
+            index[key2] = ScaledVariable(children[key2])
+
+    return index
+
+
+class ScaledVariable(object):
+    """
+    Lazy view of a PyGAC variable (group with 'data' and 'what').
+    Nothing is read until the variable is sliced, then only the requested
+    rows are read and scaled with gain and offset. Missing data and
+    no data values are masked.
+
+        var = ScaledVariable(fil['image1'])
+        ch1 = var[1000:2000]                 # masked float64
+        ch1 = var.read(rows, dtype='f4')     # masked float32
+    """
+
+    def __init__(self, group):
+        what = group['what']
+        self.dataset = group['data']
+        self.gain = what.attrs["gain"]
+        self.offset = what.attrs["offset"]
+        self.nodata = what.attrs["nodata"]
+        self.missingdata = what.attrs["missingdata"]
+        self.name = what.attrs["dataset_name"]
+
+    @property
+    def shape(self):
+        return self.dataset.shape
+
+    def __getitem__(self, rows):
+        return self.read(rows)
+
+    def raw(self, rows=None):
+        """
+        Unscaled data of the selected rows.
+        """
+        return read_rows(self.dataset, rows)
+
+    def scale(self, unscaled, dtype=None):
+        """
+        Scale unscaled data, masking missing data and no data values.
+        Without dtype, the result type is the one of gain*data + offset.
+        """
+        if dtype is None:
+            dtype = (self.gain * unscaled[:0] + self.offset).dtype
+
+        mask = np.logical_or(unscaled == self.missingdata,
+                             unscaled == self.nodata)
+        scaled = unscaled.astype(dtype)
+        scaled *= self.gain
+        scaled += self.offset
+
+        return ma.array(scaled, mask=mask, copy=False)
+
+    def read(self, rows=None, dtype=None):
+        """
+        :param rows: slice of rows, default: all
+        :param dtype: output type, e.g. 'f4', default: see L{scale}
+        :return: scaled masked array
+        """
+        return self.scale(self.raw(rows), dtype)
+
+
+def read_var(fil, var_str, unscaled=None, rows=None, index=None, dtype=None):
     """
     Read h5 file provided by PyGAC.
     :param fil: avhrr/sunsatangles h5 file
     :param var_str: variable string, e.g. 'image1'
     :param unscaled: returns also the unscaled data along with missing_data attribute
+    :param rows: slice of scanlines to be read, default: all
+    :param index: dataset index of fil (L{get_dataset_index}), built if not given
+    :param dtype: type of scaled_var, e.g. 'f4', default: type of gain*data + offset
     :return: scaled_var, var_name, [unscaled_var, attr_missing_data]
     """
-    flg = False
-
-    unscaled_var = None
-    scaled_var = None
-    var_name = None
-    attr_missing_data = None
-
-    while not flg:
-        try:
-            for key in fil.keys():
-                g = fil['/' + key + '/']
-                if key == var_str:
-                    flg = True
-
-                    for att in g.attrs.keys():
-                        if att == "channel":
-                            chan_attr = g.attrs[att]
-                        if att == "description":
-                            desc_attr = g.attrs[att]
-
-                    add = fil[g.name + '/what']
-                    # how = fil[g.name+'/how'] #not in sunsatangles h5
-                    unscaled_var = fil[g.name + '/data'].value
-                    gain = add.attrs["gain"]
-                    offs = add.attrs["offset"]
-                    noda = add.attrs["nodata"]
-                    attr_missing_data = add.attrs["missingdata"]
-                    var_name = add.attrs["dataset_name"]
-                    mask = np.ma.logical_or(unscaled_var == attr_missing_data,
-                                            unscaled_var == noda)
-                    scaled_var = gain*np.ma.masked_where(mask, unscaled_var) + offs
-                    break
-
-            for key2 in g.keys():
-                if key2 == var_str:
-                    flg = True
-                    add = fil[g[key2].name + '/what']
-                    unscaled_var = fil[g[key2].name + '/data'].value
-                    gain = add.attrs["gain"]
-                    offs = add.attrs["offset"]
-                    noda = add.attrs["nodata"]
-                    attr_missing_data = add.attrs["missingdata"]
-                    var_name = add.attrs["dataset_name"]
-                    mask = np.ma.logical_or(unscaled_var == attr_missing_data,
-                                            unscaled_var == noda)
-                    scaled_var = gain*np.ma.masked_where(mask, unscaled_var) + offs
-                    break
-
-        finally:
-            if not flg:
-                raise VariableError(
-                    logger.info(" Variable {0} is not defined in {1} ".format(var_str, fil)))
-            else:
-                if unscaled:
-                    return scaled_var, var_name, unscaled_var, attr_missing_data
-                else:
-                    return scaled_var, var_name
+    if index is None:
+        index = get_dataset_index(fil)
+
+    if var_str not in index:
+        raise VariableError(
+            logger.info(" Variable {0} is not defined in {1} ".format(var_str, fil)))
+
+    var = index[var_str]
+    unscaled_var = var.raw(rows)
+    scaled_var = var.scale(unscaled_var, dtype)
+
+    if unscaled:
+        return scaled_var, var.name, unscaled_var, var.missingdata
+    else:
+        return scaled_var, var.name
 
 
 def read_latlon(f):
@@ -243,111 +354,300 @@ def read_latlon(f):
     return lat, lon
 
 
-def read_avhrrgac(f, a, tim, cha, tsm_corr=None):
+def read_ect(f, start_time_l1c, verbose):
+    """
+    Equator crossing time (local hour) of an orbit, see
+    L{subs.get_ect_local_hour}. Taken from the orbit cache if enabled.
+    :param f: opened avhrr h5 file
+    :rtype : datetime object or None
+    """
+    cache = orbit_cache.get_cache()
+    name = 'ect_' + start_time_l1c.strftime('%Y%m%dT%H%M%S%f')
+    fmt = '%Y-%m-%d %H:%M:%S'
 
-    # get angle and geolocation
-    sza, szanam = read_var(a, 'image1')
-    lat, latnam = read_var(f, 'lat')
-    lon, lonnam = read_var(f, 'lon')
+    if cache is not None:
+        res = cache.load([f.filename], name)
+        if res is not None:
+            ect = str(res['ect'])
+            if not ect:
+                return None
+            return datetime.datetime.strptime(ect, fmt)
 
-    # get measurement
-    # channel 1
-    tar1, tarname1 = read_var(f, 'image1')
-    tar1[:] = tar1 / 100.
-    # channel 2
-    tar2, tarname2 = read_var(f, 'image2')
-    tar2[:] = tar2 / 100.
-    # channel 3b
-    tar3, tarname3 = read_var(f, 'image3')
-    # channel 4
-    tar4, tarname4 = read_var(f, 'image4')
-    # channel 5
-    tar5, tarname5 = read_var(f, 'image5')
-    # channel 3a
-    tar6, tarname6 = read_var(f, 'image6')
-    tar6[:] = tar6 / 100.
-
-    # --- START temporary scan motor issue correction
-    if tsm_corr:
-        # absolute difference because ch1 is very similar to ch2
-        abs_d12 = abs(tar1 - tar2)
-        # relative difference because ch4 and ch5 differ
-        rel_d45 = 100.0*(tar4 - tar5)/tar5
-
-        # standard deviation of abs_d12 and rel_d45
-        box_size = 3
-        fill_value = -9999.0
-        std_d12 = gridbox_std(abs_d12, box_size, fill_value)
-        std_d45 = gridbox_std(rel_d45, box_size, fill_value)
-
-        # using ch1, ch2, ch4, ch5 in combination
-        # all channels seems to be affected throughout the whole orbit,
-        # independent of VIS and NIR or day and night
-        ind1 = np.where( (std_d12 > 0.02) & (std_d45 > 2.00) )
-        tar1[ind1] = -999.0
-        tar2[ind1] = -999.0
-        tar3[ind1] = -999.0
-        tar4[ind1] = -999.0
-        tar5[ind1] = -999.0
-        tar6[ind1] = -999.0
-    # --- END temporary scan motor issue correction
-
-    if cha == 'ch1':
-        tar = tar1
-        tarname = tarname1 
-    elif cha == 'ch2':
-        tar = tar2
-        tarname = tarname2
-    elif cha == 'ch3b':
-        tar = tar3
-        tarname = tarname3
-    elif cha == 'ch4':
-        tar = tar4
-        tarname = tarname4
-    elif cha == 'ch5':
-        tar = tar5
-        tarname = tarname5
-    elif cha == 'ch3a':
-        tar = tar6
-        tarname = tarname6
-
-    # some lat/lon fields are not fill_value although they should be
-    # lat/lon min/max outside realistic values
-    # fixed here in read_var
-    # but then tar and lat/lon do not have the same masked elements
-    # thus:
-    all_masks = [lat < -90., lat > 90., lon < -180., lon > 180.]
-    total_mask = reduce(np.logical_or, all_masks)
-    lat = ma.masked_where(total_mask, lat)
-    lon = ma.masked_where(total_mask, lon)
-    tar = ma.masked_where(total_mask, tar)
-    sza = ma.masked_where(total_mask, sza)
-
-    # select time
-    if tim == 'day_90sza':
-        # consider only daytime, i.e. sza < 90
-        lon = ma.masked_where(sza >= 90., lon)
-        lat = ma.masked_where(sza >= 90., lat)
-        tar = ma.masked_where(sza >= 90., tar)
-
-    if tim == 'day':
-        # consider only daytime, i.e. sza < 80
-        lon = ma.masked_where(sza >= 80., lon)
-        lat = ma.masked_where(sza >= 80., lat)
-        tar = ma.masked_where(sza >= 80., tar)
-
-    if tim == 'twilight':
-        # consider only twilight, i.e. 80 <= sza < 90
-        # mask everything outside the current sza range
-        omask = ma.mask_or(sza < 80, sza >= 90)
-        lon = ma.masked_where(omask, lon)
-        lat = ma.masked_where(omask, lat)
-        tar = ma.masked_where(omask, tar)
-
-    if tim == 'night':
-        # consider only night, i.e. sza >= 90
-        lon = ma.masked_where(sza < 90., lon)
-        lat = ma.masked_where(sza < 90., lat)
-        tar = ma.masked_where(sza < 90., tar)
-
-    return lat, lon, tar
+    lat, lon = read_latlon(f)
+    ect = subs.get_ect_local_hour(lat, lon, start_time_l1c, verbose)
+
+    if cache is not None:
+        cache.save([f.filename], name,
+                   ect=np.array(ect.strftime(fmt) if ect else ''))
+
+    return ect
+
+
+class AvhrrGacOrbit(object):
+    """
+    AVHRR GAC L1c orbit (avhrr and sunsatangles file) which decodes
+    every dataset only once. Lat, lon, sza and the six channels are
+    read and scaled on first access and kept for the lifetime of the
+    object. The geolocation mask and the day/night/twilight/day_90sza
+    selection masks are built once from lat/lon/SZA and shared by all
+    channels, i.e. L{get} hands out masked views of the decoded data
+    instead of copies. If the orbit cache is enabled (see
+    L{orbit_cache.get_cache}), these masks are stored on disk and
+    other tools or later runs touching the same orbit skip the decode.
+    """
+
+    def __init__(self, f, a=None, tsm_corr=None, keep_raw=False, rows=None,
+                 dtype=None):
+        """
+        :param f: opened avhrr h5 file
+        :param a: opened sunsatangles h5 file, only required for
+                  time selections other than 'all'
+        :param tsm_corr: apply temporary scan motor issue correction
+        :param keep_raw: keep the unscaled channel data, see L{raw}
+        :param rows: slice(start, stop) of scanlines to be read, default: all
+        :param dtype: type of the scaled data, e.g. 'f4' to halve memory,
+                      default: see L{ScaledVariable.scale}
+        """
+        self.f = f
+        self.a = a
+        self.tsm_corr = tsm_corr
+        self.keep_raw = keep_raw
+        self.rows = rows
+        self.dtype = dtype
+
+        # dataset index of each file, built once
+        self._f_index = get_dataset_index(f)
+        self._a_index = get_dataset_index(a) if a is not None else None
+
+        self._lat = None
+        self._lon = None
+        self._sza = None
+        self._geo_mask = None
+        self._tsm_mask = None
+        self._targets = dict()
+        self._target_names = dict()
+        self._raw = dict()
+        self._select_masks = dict()
+        self._base_masks = dict()
+
+        self._images = dict(zip(subs.get_channel_list(),
+                                subs.get_avhrr_h5image_list()))
+
+        self.cache = orbit_cache.get_cache()
+
+    def _cached(self, name, files, compute):
+        """
+        Boolean mask from the orbit cache or computed and stored there.
+        :param name: product name, e.g. 'geo_mask'
+        :param files: opened h5 files the product depends on
+        :param compute: function computing the mask
+        """
+        if self.cache is None or None in files:
+            return compute()
+
+        if self.rows is not None:
+            name += '_rows{0}-{1}'.format(self.rows.start, self.rows.stop)
+        # masks derived from float32 lat/lon/SZA may differ at the edges
+        if self.dtype is not None:
+            name += '_' + np.dtype(self.dtype).name
+
+        paths = [fil.filename for fil in files]
+        res = self.cache.load(paths, name)
+        if res is not None:
+            return res['mask']
+
+        mask = compute()
+        self.cache.save(paths, name, mask=mask)
+        return mask
+
+    @property
+    def lat(self):
+        if self._lat is None:
+            self._lat, latnam = read_var(self.f, 'lat', rows=self.rows,
+                                         index=self._f_index, dtype=self.dtype)
+        return self._lat
+
+    @property
+    def lon(self):
+        if self._lon is None:
+            self._lon, lonnam = read_var(self.f, 'lon', rows=self.rows,
+                                         index=self._f_index, dtype=self.dtype)
+        return self._lon
+
+    @property
+    def sza(self):
+        """
+        Solar zenith angle masked with the geolocation mask.
+        """
+        if self._sza is None:
+            if self.a is None:
+                raise VariableError(
+                    logger.info(" No sunsatangles file given for {0} ".
+                                format(self.f)))
+            sza, szanam = read_var(self.a, 'image1', rows=self.rows,
+                                   index=self._a_index, dtype=self.dtype)
+            self._sza = ma.masked_where(self.geo_mask, sza)
+        return self._sza
+
+    @property
+    def geo_mask(self):
+        """
+        Some lat/lon fields are not fill_value although they should be,
+        i.e. lat/lon min/max outside realistic values.
+        """
+        if self._geo_mask is None:
+            self._geo_mask = self._cached('geo_mask', [self.f],
+                                          self._compute_geo_mask)
+        return self._geo_mask
+
+    def _compute_geo_mask(self):
+        lat = self.lat
+        lon = self.lon
+        all_masks = [lat < -90., lat > 90., lon < -180., lon > 180.]
+        total_mask = reduce(np.logical_or, all_masks)
+        return ma.make_mask(total_mask, shrink=False)
+
+    def select_mask(self, tim):
+        """
+        Boolean mask of all pixels outside the selected time.
+        :param tim: day_90sza, day, twilight, night or all
+        :return: boolean array or numpy.ma.nomask
+        """
+        if tim not in self._select_masks:
+            if tim in ('day_90sza', 'day', 'twilight', 'night'):
+                self._select_masks[tim] = self._cached(
+                    'select_' + tim, [self.f, self.a],
+                    lambda: self._compute_select_mask(tim))
+            else:
+                self._select_masks[tim] = ma.nomask
+
+        return self._select_masks[tim]
+
+    def _compute_select_mask(self, tim):
+        sza = self.sza
+        if tim == 'day_90sza':
+            # consider only daytime, i.e. sza < 90
+            cond = sza >= 90.
+        elif tim == 'day':
+            # consider only daytime, i.e. sza < 80
+            cond = sza >= 80.
+        elif tim == 'twilight':
+            # consider only twilight, i.e. 80 <= sza < 90
+            # mask everything outside the current sza range
+            cond = ma.mask_or(sza < 80, sza >= 90)
+        else:
+            # consider only night, i.e. sza >= 90
+            cond = sza < 90.
+        return ma.make_mask(cond, shrink=False)
+
+    def _decode_channel(self, cha):
+        tar, tarname, unscaled, missing = read_var(self.f, self._images[cha],
+                                                   unscaled=True, rows=self.rows,
+                                                   index=self._f_index,
+                                                   dtype=self.dtype)
+        if self.keep_raw:
+            self._raw[cha] = (unscaled, missing)
+        # VIS reflectance between 0 and 1
+        if cha in ('ch1', 'ch2', 'ch3a'):
+            tar[:] = tar / 100.
+        self._targets[cha] = tar
+        self._target_names[cha] = tarname
+
+    @property
+    def tsm_mask(self):
+        """
+        Temporary scan motor issue mask (L{tsm_mask}), computed once
+        per orbit from ch1, ch2, ch4 and ch5. It is shared by all channels,
+        because all channels seem to be affected throughout the whole orbit,
+        independent of VIS and NIR or day and night.
+        """
+        if self._tsm_mask is None:
+            self._tsm_mask = self._cached('tsm_mask', [self.f],
+                                          self._compute_tsm_mask)
+        return self._tsm_mask
+
+    def _compute_tsm_mask(self):
+        tars = list()
+        for cha in ('ch1', 'ch2', 'ch4', 'ch5'):
+            if cha not in self._targets:
+                self._decode_channel(cha)
+            tars.append(self._targets[cha])
+        return tsm_mask(*tars)
+
+    def target(self, cha):
+        """
+        Decoded and scaled channel without geolocation or time selection.
+        If tsm_corr is set, the temporary scan motor issue mask is
+        added to the mask of the returned view.
+        :param cha: channel name, e.g. 'ch1'
+        :return: scaled_var, var_name
+        """
+        if cha not in self._targets:
+            self._decode_channel(cha)
+        tar = self._targets[cha]
+        if self.tsm_corr:
+            tar = ma.array(tar.data, copy=False,
+                           mask=np.logical_or(ma.getmaskarray(tar),
+                                              self.tsm_mask))
+        return tar, self._target_names[cha]
+
+    def raw(self, cha):
+        """
+        Unscaled channel data, only available if keep_raw is set.
+        :param cha: channel name, e.g. 'ch1'
+        :return: unscaled_var, attr_missing_data
+        """
+        self.target(cha)
+        return self._raw[cha]
+
+    def _base_mask(self, name):
+        """
+        Own mask of lat, lon or a channel combined with the geolocation mask.
+        """
+        if name not in self._base_masks:
+            if name == 'lat':
+                var = self.lat
+            elif name == 'lon':
+                var = self.lon
+            else:
+                var, varname = self.target(name)
+            self._base_masks[name] = np.logical_or(ma.getmaskarray(var),
+                                                   self.geo_mask)
+        return self._base_masks[name]
+
+    def get(self, cha, tim):
+        """
+        Masked views of lat, lon and channel for a time selection.
+        The returned arrays share their data with the decoded orbit,
+        only the masks are combined.
+        :param cha: channel name, e.g. 'ch1'
+        :param tim: day_90sza, day, twilight, night or all
+        :return: lat, lon, tar
+        """
+        sel_mask = self.select_mask(tim)
+        tar, tarname = self.target(cha)
+
+        lat_mask = self._base_mask('lat')
+        lon_mask = self._base_mask('lon')
+        tar_mask = self._base_mask(cha)
+
+        if sel_mask is not ma.nomask:
+            lat_mask = np.logical_or(lat_mask, sel_mask)
+            lon_mask = np.logical_or(lon_mask, sel_mask)
+            tar_mask = np.logical_or(tar_mask, sel_mask)
+
+        lat = ma.array(self.lat.data, mask=lat_mask, copy=False)
+        lon = ma.array(self.lon.data, mask=lon_mask, copy=False)
+        tar = ma.array(tar.data, mask=tar_mask, copy=False)
+
+        return lat, lon, tar
+
+
+def read_avhrrgac(f, a, tim, cha, tsm_corr=None):
+    """
+    Read lat, lon and one channel for a time selection.
+    Prefer L{AvhrrGacOrbit} when reading more than one channel or
+    time selection of the same orbit.
+    """
+    orbit = AvhrrGacOrbit(f, a, tsm_corr)
+    return orbit.get(cha, tim)
@@ -14,6 +14,7 @@ from subs_avhrrgac import str2upper, lite_satstring
 from subs_avhrrgac import pre_blacklist_reasons
 from subs_avhrrgac import proc_blacklist_reasons
 from subs_avhrrgac import post_blacklist_reasons
+from subs_avhrrgac import get_blacklist_counts, count_blacklisted
 from pycmsaf.avhrr_gac.database import AvhrrGacDatabase
 from pycmsaf.logger import setup_root_logger
 
@@ -41,66 +42,75 @@ def print_verbose(sqlres):
         logger.info("black_reason  : {0}\n".format(r['blacklist_reason']))
 
 
-def print_changes(db, reason, satname=None):
+def print_changes(counts, reason, satname=None):
     """
     PRINT results to screen.
+    :param counts: blacklist counts, see get_blacklist_counts
+    :param satname: list of satellites
     """
-    postdict = post_blacklist_reasons()
-    sqltxt = "SELECT COUNT(*) FROM vw_std WHERE "
     logtxt = "{0:26s} -> {1:8d} orbits "
 
-    if reason is 'all_l1b':
-        sqltxt = sqltxt + "filename is not null "
-    elif reason is 'all_blacklisted':
-        sqltxt = sqltxt + "filename is not null AND blacklist=1 "
-    elif reason is 'all_l1b_white':
-        sqltxt = sqltxt + "filename is not null AND blacklist=0 "
-    elif reason is 'all_l1c_white':
-        sqltxt = sqltxt + "start_time_l1c is not null AND blacklist=0 "
-    elif reason is 'all_l1c_missing':
-        sqltxt = sqltxt + "start_time_l1c is null AND blacklist=0 "
-
-    elif reason is 'pygac_failed':
-        sqltxt = sqltxt + "( start_time_l1c is null AND blacklist=0 "
-        if satname:
-            sqltxt = sqltxt + "AND satellite_name=\'{sat}\' "
-        for key in sorted(postdict):
-            if 'wrong' in postdict[key]:
-                continue
-            if 'indexerror' in postdict[key]:
-                continue
-            if 'along_track' in postdict[key]:
-                continue
-            sqltxt = sqltxt + ") OR ( start_time_l1c is null AND "
-            sqltxt = sqltxt + "blacklist_reason=\'{0}\' ".format(postdict[key])
-            if satname:
-                sqltxt = sqltxt + "AND satellite_name=\'{sat}\' "
-        sqltxt = sqltxt + ") "
-
-    elif reason is 'redundant':
-        sqltxt = sqltxt + "redundant=1 AND blacklist=1 AND blacklist_reason LIKE 'NSS%' "
+    if not reason.startswith('all_') and reason != 'pygac_failed':
         logtxt = logtxt + "blacklisted "
+
+    if satname:
+        logtxt = logtxt + "for {2}"
+        for sat in satname:
+            num = count_blacklisted(counts, reason, sat)
+            logger.info(logtxt.format(reason, num, sat))
     else:
-        sqltxt = sqltxt + "blacklist_reason=\'{0}\' ".format(reason)
-        logtxt = logtxt + "blacklisted "
+        num = count_blacklisted(counts, reason)
+        logger.info(logtxt.format(reason, num))
 
 
-    if sqltxt:
-        if satname:
-            sqltxt = sqltxt + "AND satellite_name=\'{sat}\'"
-            logtxt = logtxt + "for {2}"
-            for sat in satname:
-                cmd = sqltxt.format(sat=sat)
-                res = db.execute(cmd)
-                num = res[0]['COUNT(*)']
-                logger.info(logtxt.format(reason,num,sat))
-        else:
-            res = db.execute(sqltxt)
-            num = res[0]['COUNT(*)']
-            logger.info(logtxt.format(reason,num))
-    else:
-        logger.info("{0} case is not yet defined!".format(reason))
+def load_filenames(db, filenames):
+    """
+    Load L1b filenames into the temporary table blacklist_files
+    with one executemany, replacing its previous content.
+    """
+    db.execute("CREATE TEMP TABLE IF NOT EXISTS blacklist_files "
+               "(filename TEXT PRIMARY KEY)")
+    db.execute("DELETE FROM temp.blacklist_files")
+    db.curs.executemany("INSERT OR IGNORE INTO temp.blacklist_files "
+                        "(filename) VALUES (?)", [(fil,) for fil in filenames])
+
+
+def blacklist_filenames(db, black_reason, filenames, ver, only_white=True):
+    """
+    Blacklist a list of L1b orbits at once: the list is joined
+    by one UPDATE via a temporary table instead of one UPDATE
+    (and SELECT) per filename.
+    :param only_white: do not touch orbits already blacklisted
+    :return: dict [satellite_name] = number of orbits of the
+             listed satellites blacklisted due to black_reason
+    """
+    load_filenames(db, filenames)
+
+    upd = "UPDATE orbits SET blacklist=1, " \
+          "blacklist_reason=\'{blr}\' WHERE filename IN " \
+          "(SELECT filename FROM temp.blacklist_files) "
+    if only_white:
+        upd = upd + "AND blacklist=0 "
+    db.execute(upd.format(blr=black_reason))
+
+    if ver:
+        cmd = "SELECT * FROM vw_std WHERE filename IN " \
+              "(SELECT filename FROM temp.blacklist_files) " \
+              "ORDER BY start_time_l1b"
+        res = db.execute(cmd)
+        print_verbose(res)
+
+    cmd = "SELECT satellite_name, COUNT(*) FROM vw_std WHERE " \
+          "blacklist=1 AND blacklist_reason=\'{blr}\' AND " \
+          "satellite_id IN (SELECT o.satellite_id FROM orbits o " \
+          "JOIN temp.blacklist_files b ON o.filename = b.filename) " \
+          "GROUP BY satellite_name"
+    res = db.execute(cmd.format(blr=black_reason))
 
+    counts = dict()
+    for r in res:
+        counts[r['satellite_name']] = r['COUNT(*)']
+    return counts
 
 
 def blacklist_wrong_ydim(db, ver):
@@ -110,20 +120,10 @@ def blacklist_wrong_ydim(db, ver):
     along_track dimension is too large, i.e. ydim too long.
     """
     black_reason, blist = pb.list_along_track_too_long()
-    
-    for i in blist:
-        upd = "UPDATE orbits SET blacklist=1, " \
-              "blacklist_reason=\'{blr}\' " \
-              "WHERE filename=\'{fil}\' and blacklist=0 "
-        db.execute(upd.format(blr=black_reason, fil=i))
 
-    if ver:
-        cmd = "SELECT * FROM orbits WHERE " \
-              "blacklist_reason=\'{blr}\' "
-        res = db.execute(cmd.format(blr=black_reason))
-        print_verbose(res) 
+    blacklist_filenames(db, black_reason, blist, ver)
 
-    print_changes(db, black_reason)
+    print_changes(get_blacklist_counts(db), black_reason)
     logger.info("COMMIT CHANGES FOR \'{0}\'\n".format(black_reason))
     db.commit_changes()
 
@@ -142,19 +142,9 @@ def blacklist_pygac_indexerror(db, ver):
     """
     black_reason, blist = pb.list_indexerror()
 
-    for i in blist:
-        upd = "UPDATE orbits SET blacklist=1, " \
-              "blacklist_reason=\'{blr}\' " \
-              "WHERE filename=\'{fil}\' and blacklist=0 "
-        db.execute(upd.format(blr=black_reason, fil=i))
-
-    if ver:
-        cmd = "SELECT * FROM vw_std WHERE " \
-              "blacklist_reason=\'{blr}\' "
-        res = db.execute(cmd.format(blr=black_reason))
-        print_verbose(res) 
+    blacklist_filenames(db, black_reason, blist, ver)
 
-    print_changes(db, black_reason)
+    print_changes(get_blacklist_counts(db), black_reason)
     logger.info("COMMIT CHANGES FOR \'{0}\'\n".format(black_reason))
     db.commit_changes()
 
@@ -166,39 +156,85 @@ def blacklist_manually_selected_orbits(db, ver):
     Orbit list stored in: post_blacklist.txt
     """
     tfile = "post_blacklist.txt"
-    myset = set()
     black_reason, olist = pb.read_manually_selected_orbits( tfile )
 
     logger.info("Blacklist orbits based on \'{0}\'".format(tfile))
-    for fil in olist:
-        upd = "UPDATE orbits SET blacklist=1, " \
-              "blacklist_reason=\'{blr}\' WHERE filename=\'{fil}\' " \
-              "AND blacklist=0"
-        db.execute(upd.format(fil=fil, blr=black_reason))
-
-        cmd = "SELECT * FROM vw_std WHERE filename=\'{fil}\' "
-        res = db.execute(cmd.format(fil=fil))
-        sat = get_sat_name(res)
-        myset.add(sat)
-
-        if ver:
-            print_verbose(res) 
-
-    for sat in myset:
-        cmd = "SELECT COUNT(*) FROM vw_std WHERE " \
-              "satellite_name=\'{sat}\' AND " \
-              "blacklist=1 AND blacklist_reason=\'{blr}\' "
-        res = db.execute(cmd.format(sat=sat, blr=black_reason))
-        cnt = res[0]['COUNT(*)']
+    counts = blacklist_filenames(db, black_reason, olist, ver)
+
+    for sat in sorted(counts):
         logger.info("{0} orbits of {1} are blacklisted due to {2}".
-                    format(cnt, sat, black_reason))
+                    format(counts[sat], sat, black_reason))
 
-    print_changes(db, black_reason)
+    print_changes(get_blacklist_counts(db), black_reason)
     logger.info("COMMIT CHANGES BASED ON \'{1}\' FOR \'{0}\'\n".
                 format(black_reason, tfile))
     db.commit_changes()
 
 
+def load_intervals(db, intervals):
+    """
+    Load time intervals into the temporary table blacklist_intervals
+    with one executemany, replacing its previous content.
+    Satellite names are resolved to IDs by one UPDATE.
+    :param intervals: list of (satellite_name, start_time, end_time)
+    """
+    db.execute("CREATE TEMP TABLE IF NOT EXISTS blacklist_intervals "
+               "(satellite_name TEXT, satellite_id INTEGER, "
+               "start_time TIMESTAMP, end_time TIMESTAMP)")
+    db.execute("DELETE FROM temp.blacklist_intervals")
+    db.curs.executemany("INSERT INTO temp.blacklist_intervals "
+                        "(satellite_name, start_time, end_time) "
+                        "VALUES (?, ?, ?)", intervals)
+    db.execute("UPDATE temp.blacklist_intervals SET satellite_id = "
+               "(SELECT id FROM satellites WHERE name = satellite_name)")
+
+    # each interval is a range scan on this index
+    db.execute("CREATE INDEX IF NOT EXISTS idx_orbits_satellite_start "
+               "ON orbits (satellite_id, start_time_l1b)")
+
+
+def blacklist_intervals(db, black_reason, intervals, ver, only_unique=True):
+    """
+    Blacklist all orbits with start_time_l1b within one of the
+    intervals of the same satellite at once: the intervals are
+    joined by one UPDATE via a temporary table.
+    :param intervals: list of (satellite_name, start_time, end_time)
+    :param only_unique: do not touch redundant orbits
+    :return: list of (satellite_name, start_time) of intervals
+             without any orbit in the database
+    """
+    load_intervals(db, intervals)
+
+    upd = "UPDATE orbits SET blacklist=1, blacklist_reason=\'{blr}\' " \
+          "WHERE blacklist=0 AND id IN (SELECT o.id " \
+          "FROM temp.blacklist_intervals i JOIN orbits o " \
+          "ON o.satellite_id = i.satellite_id AND " \
+          "o.start_time_l1b BETWEEN i.start_time AND i.end_time) "
+    if only_unique:
+        upd = upd + "AND redundant=0 "
+    db.execute(upd.format(blr=black_reason))
+
+    if ver:
+        cmd = "SELECT DISTINCT v.* FROM temp.blacklist_intervals i " \
+              "JOIN vw_std v ON v.satellite_id = i.satellite_id AND " \
+              "v.start_time_l1b BETWEEN i.start_time AND i.end_time " \
+              "WHERE v.blacklist_reason=\'{blr}\' " \
+              "ORDER BY v.satellite_name, v.start_time_l1b"
+        res = db.execute(cmd.format(blr=black_reason))
+        print_verbose(res)
+
+    # security check: intervals without any orbit
+    cmd = "SELECT i.satellite_name, i.start_time, COUNT(o.id) AS norbits " \
+          "FROM temp.blacklist_intervals i LEFT JOIN orbits o " \
+          "ON o.satellite_id = i.satellite_id AND " \
+          "o.start_time_l1b BETWEEN i.start_time AND i.end_time " \
+          "GROUP BY i.rowid HAVING norbits = 0 " \
+          "ORDER BY i.satellite_name, i.start_time"
+    res = db.execute(cmd)
+
+    return [(r['satellite_name'], r['start_time']) for r in res]
+
+
 def blacklist_bad_l1c_quality(db, ver):
     """
     Blacklist all dates between sdate and edate for given satellite.
@@ -206,35 +242,19 @@ def blacklist_bad_l1c_quality(db, ver):
     """
     black_reason, bdict = pb.list_bad_l1c_quality()
 
-    for satkey in bdict.keys(): 
-
+    intervals = list()
+    for satkey in sorted(bdict.keys()):
         sdate = bdict[satkey]["sdate"]
         edate = bdict[satkey]["edate"]
-        satid = db._get_id_by_name(table='satellites', name=satkey)
-
         logger.info("Blacklist orbits between {0} & {1} for {2}".
                 format(sdate, edate, satkey))
+        intervals.append((satkey, sdate, edate))
 
-        upd = "UPDATE orbits SET blacklist=1, blacklist_reason=\'{blr}\' " \
-              "WHERE satellite_id = \'{satid}\' AND " \
-              "redundant=0 AND blacklist=0 AND " \
-              "start_time_l1b BETWEEN \'{sdate}\' AND \'{edate}\' "
-        db.execute(upd.format(blr=black_reason, satid=satid,
-                              sdate=sdate, edate=edate))
+    blacklist_intervals(db, black_reason, intervals, ver)
 
-        if ver: 
-            cmd = "SELECT * from vw_std WHERE " \
-                  "satellite_id = \'{satid}\' AND " \
-                  "blacklist_reason=\'{blr}\' AND " \
-                  "start_time_l1b BETWEEN \'{sdate}\' AND \'{edate}\' " \
-                  "ORDER BY start_time_l1b"
-            res = db.execute(cmd.format(satid=satid,blr=black_reason,
-                                        sdate=sdate,edate=edate))
-            print_verbose(res) 
-
-        print_changes(db, black_reason, [satkey])
-        logger.info("COMMIT CHANGES FOR \'{0}\'\n".format(black_reason))
-        db.commit_changes()
+    print_changes(get_blacklist_counts(db), black_reason, sorted(bdict.keys()))
+    logger.info("COMMIT CHANGES FOR \'{0}\'\n".format(black_reason))
+    db.commit_changes()
 
 
 def blacklist_ch3a_zero_reflectance(db, ver):
@@ -244,36 +264,21 @@ def blacklist_ch3a_zero_reflectance(db, ver):
     """
     black_reason, bdict = pb.list_ch3a_zero_reflectance()
 
-    for idx in bdict.keys():
+    intervals = list()
+    for idx in sorted(bdict.keys()):
         for satkey in bdict[idx]:
             sdate = bdict[idx][satkey]["sdate"]
             edate = bdict[idx][satkey]["edate"]
-            satid = db._get_id_by_name(table='satellites', name=satkey)
-
             logger.info("Blacklist orbits between {0} & {1} for {2}".
                     format(sdate, edate, satkey))
+            intervals.append((satkey, sdate, edate))
 
-            upd = "UPDATE orbits SET blacklist=1, blacklist_reason=\'{blr}\' " \
-                  "WHERE satellite_id = \'{satid}\' AND " \
-                  "redundant=0 AND blacklist=0 AND " \
-                  "start_time_l1b BETWEEN \'{sdate}\' AND \'{edate}\' "
-            db.execute(upd.format(blr=black_reason, satid=satid,
-                                  sdate=sdate, edate=edate))
-
-            if ver: 
-                cmd = "SELECT * from vw_std WHERE " \
-                      "satellite_id = \'{satid}\' AND " \
-                      "blacklist_reason=\'{blr}\' AND " \
-                      "start_time_l1b BETWEEN \'{sdate}\' AND \'{edate}\' " \
-                      "ORDER BY start_time_l1b"
-                res = db.execute(cmd.format(satid=satid,blr=black_reason,
-                                            sdate=sdate,edate=edate))
-                print_verbose(res) 
-
-            print_changes(db, black_reason, [satkey])
-            logger.info("COMMIT CHANGES FOR \'{0}\'\n".format(black_reason))
-            db.commit_changes()
+    blacklist_intervals(db, black_reason, intervals, ver)
 
+    print_changes(get_blacklist_counts(db), black_reason,
+                  sorted(set(i[0] for i in intervals)))
+    logger.info("COMMIT CHANGES FOR \'{0}\'\n".format(black_reason))
+    db.commit_changes()
 
 
 def blacklist_no_valid_l1c_data(db, ver):
@@ -282,69 +287,33 @@ def blacklist_no_valid_l1c_data(db, ver):
     """
     black_reason, bdict, slist = pb.list_no_valid_l1c_data()
 
+    # blacklist all orbits between
+    # start_date <= start_time_l1b <= end_date
+    intervals = list()
     for sat in slist:
-        try:
-            date_list = bdict[sat]
-            sat_id = db._get_id_by_name(table='satellites', name=sat)
-
-            for yyyymm in bdict[sat]:
-                y = int(yyyymm[0:4])
-                m = int(yyyymm[4:])
-                days = bdict[sat][yyyymm]
-
-                for d in days:
-                    dt = datetime.date(y,m,d)
-                    # blacklist all orbits between
-                    # start_date <= start_time_l1c <= end_date
-                    start_time = datetime.datetime(y, m, d, 0, 0, 0)
-                    end_time = datetime.datetime(y, m, d, 23, 59, 59)
-
-                    upd = "UPDATE orbits SET " \
-                          "blacklist=1, blacklist_reason=\'{blr}\' " \
-                          "WHERE blacklist=0 AND " \
-                          "satellite_id=\'{sat_id}\' AND " \
-                          "start_time_l1b BETWEEN " \
-                          "\'{start_time}\' AND \'{end_time}\' "
-                    db.execute(upd.format(blr=black_reason, sat_id=sat_id,
-                                          start_time=start_time, 
-                                          end_time=end_time))
-
-                    # security check
-                    cmd = "SELECT COUNT(*) from orbits " \
-                          "WHERE satellite_id=\'{sat_id}\' AND " \
-                          "start_time_l1b BETWEEN " \
-                          "\'{start_time}\' AND \'{end_time}\' " \
-                          "ORDER BY start_time_l1b"
-                    res = db.execute(cmd.format(sat_id=sat_id,
-                                                start_time=start_time,
-                                                end_time=end_time,
-                                                blr=black_reason))
-                    numcheck = res[0]['COUNT(*)']
-                    if numcheck == 0: 
-                        logger.info("WARNING: No orbits={0} for {1} and {2}".
-                                format(numcheck,dt,sat))
-
-                    if ver:
-                        cmd = "SELECT * from vw_std " \
-                              "WHERE satellite_id=\'{sat_id}\' AND " \
-                              "blacklist_reason=\'{blr}\' AND " \
-                              "start_time_l1b BETWEEN " \
-                              "\'{start_time}\' AND \'{end_time}\' " \
-                              "ORDER BY start_time_l1b"
-                        res = db.execute(cmd.format(sat_id=sat_id,
-                                                    start_time=start_time,
-                                                    end_time=end_time,
-                                                    blr=black_reason))
-                        print_verbose(res) 
-
-            print_changes(db, black_reason,[sat])
-
-        except KeyError:
+        if not bdict.get(sat):
             if ver:
                 logger.info("Nothing to blacklist for {0}!".format(sat))
-            pass
-
-    print_changes(db, black_reason)
+            continue
+
+        for yyyymm in sorted(bdict[sat]):
+            y = int(yyyymm[0:4])
+            m = int(yyyymm[4:])
+            for d in bdict[sat][yyyymm]:
+                start_time = datetime.datetime(y, m, d, 0, 0, 0)
+                end_time = datetime.datetime(y, m, d, 23, 59, 59)
+                intervals.append((sat, start_time, end_time))
+
+    empty = blacklist_intervals(db, black_reason, intervals, ver,
+                                only_unique=False)
+
+    for (sat, start_time) in empty:
+        logger.info("WARNING: No orbits=0 for {0} and {1}".
+                format(str(start_time)[0:10], sat))
+
+    counts = get_blacklist_counts(db)
+    print_changes(counts, black_reason, sorted(set(i[0] for i in intervals)))
+    print_changes(counts, black_reason)
     logger.info("COMMIT CHANGES FOR \'{0}\'\n".format(black_reason))
     db.commit_changes()
 
@@ -355,20 +324,9 @@ def blacklist_wrong_l1c_timestamp(db, ver):
     """
     black_reason, blist = pb.list_wrong_l1c_timestamp()
 
-    for fil in blist:
-
-        splits = fil.split('.')
+    blacklist_filenames(db, black_reason, blist, ver, only_white=False)
 
-        upd = "UPDATE orbits SET blacklist=1, " \
-              "blacklist_reason=\'{blr}\' WHERE filename=\'{fil}\'"
-        db.execute(upd.format(fil=fil, blr=black_reason))
-
-        if ver:
-            cmd = "SELECT * FROM vw_std WHERE filename=\'{fil}\' "
-            res = db.execute(cmd.format(fil=fil))
-            print_verbose(res) 
-
-    print_changes(db, black_reason)
+    print_changes(get_blacklist_counts(db), black_reason)
     logger.info("COMMIT CHANGES FOR \'{0}\'\n".format(black_reason))
     db.commit_changes()
 
@@ -555,31 +513,38 @@ if __name__ == '__main__':
         blacklist_manually_selected_orbits(dbfile, args.verbose)
 
 
+    # -- orbit counts for all listings at once
+    if args.show_all or args.show_all_blacklisted or args.show_l1b_whitelist or \
+            args.show_l1c_whitelist or args.show_l1c_missing or \
+            args.show_pygac_failed or args.show_pre or args.show_proc or \
+            args.show_post:
+        counts = get_blacklist_counts(dbfile)
+
     # -- show total listing
     if args.show_all: 
-        print_changes(dbfile, 'all_l1b', satlist)
+        print_changes(counts, 'all_l1b', satlist)
     if args.show_all_blacklisted: 
-        print_changes(dbfile, 'all_blacklisted', satlist)
+        print_changes(counts, 'all_blacklisted', satlist)
     if args.show_l1b_whitelist: 
-        print_changes(dbfile, 'all_l1b_white', satlist)
+        print_changes(counts, 'all_l1b_white', satlist)
     if args.show_l1c_whitelist: 
-        print_changes(dbfile, 'all_l1c_white', satlist)
+        print_changes(counts, 'all_l1c_white', satlist)
     if args.show_l1c_missing: 
-        print_changes(dbfile, 'all_l1c_missing', satlist) 
+        print_changes(counts, 'all_l1c_missing', satlist) 
     if args.show_pygac_failed:
-        print_changes(dbfile, 'pygac_failed', satlist)
+        print_changes(counts, 'pygac_failed', satlist)
 
 
     # -- show blacklistings
     sumup = 0
     if args.show_pre: 
         for key in sorted(predict):
-            print_changes(dbfile, predict[key], satlist)
+            print_changes(counts, predict[key], satlist)
     if args.show_proc: 
         for key in sorted(procdict):
-            print_changes(dbfile, procdict[key], satlist)
+            print_changes(counts, procdict[key], satlist)
     if args.show_post: 
         for key in sorted(postdict):
-            print_changes(dbfile, postdict[key], satlist)
+            print_changes(counts, postdict[key], satlist)
 
     logger.info("%s finished\n\n" % os.path.basename(__file__))
@@ -5,11 +5,22 @@
 #
 
 import subprocess
+import threading
+import Queue
 import subs_avhrrgac as subs
 import quick_l1c_analysis as quick
+import sqlite_writer as sqlwriter
 
+import config_run_pygac as cfg
 from config_run_pygac import *
 
+# -- settings missing in older config files
+pygac_workers = getattr(cfg, 'pygac_workers', 1)
+pygac_timeout = getattr(cfg, 'pygac_timeout', None)
+pygac_mode = getattr(cfg, 'pygac_mode', 'all')
+sql_writer_socket = getattr(cfg, 'sql_writer_socket', None)
+sql_writer_authkey = getattr(cfg, 'sql_writer_authkey', None)
+
 from pycmsaf.logger import setup_root_logger
 logdir = os.path.join(os.getcwd(), 'log')
 logger = setup_root_logger(name='root', logdir=logdir, append=False, logfile=True)
@@ -36,10 +47,104 @@ def def_pygac_cfg(fil, out):
         logger.info("FAILED: {0}".format(e))
 
 
+def parse_pygac_output(std_lines):
+    """
+    Collect information from pygac STDOUT & STDERR.
+    :param std_lines: list of output lines
+    :return: l1c file, pygac runtime [s], errors, warnings
+    """
+    ifile_l1c = None
+    pygac_took = None
+    p_warnings = list()
+    p_errors = list()
+
+    for line in std_lines:
+        if "warning" in line.lower():
+            p_warnings.append(line)
+        elif "error" in line.lower():
+            p_errors.append(line)
+        elif "Filename: "+pygac_prefix+"_avhrr" in line:
+            line_list = line.split()
+            ret = filter(lambda x: '.h5' in x, line_list)[0]
+            ifile_l1c = os.path.join(out_path, ret)
+        elif "pygac took" in line.lower():
+            ll = line.split()
+            from datetime import datetime, timedelta
+            t = datetime.strptime(ll[-1], "%H:%M:%S.%f")
+            pygac_took = timedelta(hours=t.hour, minutes=t.minute, seconds=t.second,
+                                   microseconds=t.microsecond).total_seconds()
+        else:
+            continue
+
+    return ifile_l1c, pygac_took, p_errors, p_warnings
+
+
+def run_pygac(ifile):
+    """
+    Run PyGAC for one L1b file, log its output while it is running
+    and kill it if it takes longer than pygac_timeout seconds.
+    :param ifile: L1b file
+    :return: l1c file, pygac runtime [s], errors, warnings
+    """
+    logger.info("Working on {0}".format(ifile))
+    base = os.path.basename(ifile)
+
+    c3 = ["python", pygac_runtool, ifile, "0", "0"]
+    p3 = subprocess.Popen(c3, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+    # Popen.communicate has no timeout in python 2.7
+    timer = None
+    timed_out = threading.Event()
+    if pygac_timeout:
+        def kill():
+            timed_out.set()
+            p3.kill()
+        timer = threading.Timer(pygac_timeout, kill)
+        timer.start()
+
+    std_lines = list()
+    try:
+        for line in iter(p3.stdout.readline, ''):
+            line = line.rstrip("\n")
+            std_lines.append(line)
+            logger.info("{0}: {1}".format(base, line))
+        p3.wait()
+    finally:
+        if timer:
+            timer.cancel()
+
+    (ifile_l1c, pygac_took, p_errors, p_warnings) = parse_pygac_output(std_lines)
+
+    if timed_out.is_set():
+        p_errors.append("pygac killed after timeout of {0} seconds".
+                        format(pygac_timeout))
+        # -- output of a killed run may be incomplete
+        remove_l1c_files(ifile_l1c)
+        ifile_l1c = None
+
+    return ifile_l1c, pygac_took, p_errors, p_warnings
+
+
+def remove_l1c_files(ifile_l1c):
+    """
+    Remove the avhrr, sunsatangles and qualflags file of an orbit.
+    :param ifile_l1c: avhrr L1c file or None
+    """
+    if not ifile_l1c:
+        return
+
+    for name in ("avhrr", "sunsatangles", "qualflags"):
+        fil = ifile_l1c.replace(pygac_prefix + "_avhrr_", pygac_prefix + "_" + name + "_")
+        if os.path.isfile(fil):
+            logger.info("Remove incomplete {0}".format(fil))
+            os.remove(fil)
+
+
 def call_pygac(file_list):
     """
-    Run PyGAC over each file in list.
+    Run PyGAC over each file in list, pygac_workers orbits at once.
     Collect information about logfile and L1c File content for later analysis.
+    The SQLite database is written by one thread only.
     :param file_list: L1b file list
     :return:
     """
@@ -51,63 +156,86 @@ def call_pygac(file_list):
     def_pygac_cfg(cfg_file, out_path)
     os.putenv('PYGAC_CONFIG_FILE', cfg_file)
 
-    logger.info("call {0}".format(os.path.basename(pygac_runtool)))
+    logger.info("call {0} ({1} workers, timeout {2} s)".
+                format(os.path.basename(pygac_runtool), pygac_workers, pygac_timeout))
+
+    jobs = Queue.Queue()
+    results = Queue.Queue()
 
-    # -- loop over files
     for ifile in file_list:
-        logger.info("Working on {0}".format(ifile))
+        jobs.put(ifile)
 
-        c3 = ["python", pygac_runtool, ifile, "0", "0"]
-        p3 = subprocess.Popen(c3, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout, stderr = p3.communicate()
-        stdout_lines = stdout.split("\n")
-        stderr_lines = stderr.split("\n")
-        std_lines = stdout_lines + stderr_lines
+    def worker():
+        while True:
+            try:
+                ifile = jobs.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                results.put((ifile, run_pygac(ifile)))
+            except Exception as e:
+                logger.info("FAILED: {0}: {1}".format(ifile, e))
+                results.put((ifile, (None, None, [str(e)], list())))
 
-        logger.info("PyGAC STDOUT")
-        for line in stdout_lines:
-            print line
+    def writer():
+        # -- records are either sent to sqlite_writer.py or written directly
+        client = None
+        if sql_writer_socket:
+            client = sqlwriter.WriterClient(sql_writer_socket, sql_writer_authkey)
 
-        logger.info("PyGAC STDERR:")
-        for line in stderr_lines:
-            print line
+        while True:
+            res = results.get()
+            if res is None:
+                break
+            (ifile, (ifile_l1c, pygac_took, p_errors, p_warnings)) = res
 
-        ifile_l1c = None
-        pygac_took = None
-        p_warnings = list()
-        p_errors = list()
-
-        logger.info("collect information from STDOUT & STDERR")
-        for line in std_lines:
-            if "warning" in line.lower():
-                p_warnings.append(line)
-            elif "error" in line.lower():
-                p_errors.append(line)
-            elif "Filename: "+pygac_prefix+"_avhrr" in line:
-                line_list = line.split()
-                ret = filter(lambda x: '.h5' in x, line_list)[0]
-                ifile_l1c = os.path.join(out_path, ret)
-            elif "pygac took" in line.lower():
-                ll = line.split()
-                from datetime import datetime, timedelta
-                t = datetime.strptime(ll[-1], "%H:%M:%S.%f")
-                pygac_took = timedelta(hours=t.hour, minutes=t.minute, seconds=t.second,
-                                       microseconds=t.microsecond).total_seconds()
-            else:
-                continue
-
-        logger.info("L1c File: {0}".format(ifile_l1c))
-        logger.info("Errors  : {0}".format(p_errors))
-        logger.info("Warnings: {0}".format(p_warnings))
-        logger.info("RunTime : {0}".format(pygac_took))
-
-        logger.info("Collect records for quick L1c analysis\n")
-        quick.collect_records(l1b_file=ifile+'.gz', l1c_file=ifile_l1c,
-                              sql_file=sql_quick_output, pygac_version=pygac_commit,
-                              pygac_took=pygac_took, pygac_errors=p_errors, pygac_warnings=p_warnings)
-
-        if ifile_l1c is None:
-            failed_l1b_orbits.append(ifile)
+            logger.info("L1c File: {0}".format(ifile_l1c))
+            logger.info("Errors  : {0}".format(p_errors))
+            logger.info("Warnings: {0}".format(p_warnings))
+            logger.info("RunTime : {0}".format(pygac_took))
+
+            logger.info("Collect records for quick L1c analysis\n")
+            try:
+                quick.collect_records(l1b_file=ifile+'.gz', l1c_file=ifile_l1c,
+                                      sql_file=sql_quick_output, pygac_version=pygac_commit,
+                                      pygac_took=pygac_took, pygac_errors=p_errors,
+                                      pygac_warnings=p_warnings, writer=client)
+            except Exception as e:
+                logger.info("FAILED: collect records for {0}: {1}".format(ifile, e))
+                # -- record the orbit as failed, i.e. pygac_mode 'failed' retries it
+                p_errors = p_errors + ["quick analysis failed: {0}".format(e)]
+                ifile_l1c = None
+                try:
+                    quick.collect_records(l1b_file=ifile+'.gz', l1c_file=None,
+                                          sql_file=sql_quick_output, pygac_version=pygac_commit,
+                                          pygac_took=pygac_took, pygac_errors=p_errors,
+                                          pygac_warnings=p_warnings, writer=client)
+                except Exception as e:
+                    logger.info("FAILED: record failed orbit {0}: {1}".format(ifile, e))
+
+            if ifile_l1c is None:
+                failed_l1b_orbits.append(ifile)
+
+        if client:
+            (ncommitted, errors) = client.sync()
+            client.close()
+            logger.info("{0} orbits committed by {1}".
+                        format(ncommitted, sql_writer_socket))
+            for err in errors:
+                logger.info("FAILED: {0}".format(err))
+
+    db_thread = threading.Thread(target=writer)
+    db_thread.start()
+
+    workers = [threading.Thread(target=worker)
+               for i in range(max(1, min(pygac_workers, len(file_list))))]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+
+    results.put(None)
+    db_thread.join()
 
     if len(failed_l1b_orbits) > 0:
         logger.info("PYGAC FAILED {0} time(s):".format(len(failed_l1b_orbits)))
@@ -115,6 +243,35 @@ def call_pygac(file_list):
             logger.info("{0}".format(failed))
 
 
+def select_orbits(file_list):
+    """
+    Skip orbits already processed with this pygac version, see pygac_mode.
+    :param file_list: L1b file list
+    :return: L1b files to be processed
+    """
+    if pygac_mode == 'all':
+        return file_list
+
+    db = quick.QuickDatabase(dbfile=sql_quick_output, timeout=36000, create=True)
+    (done, failed) = db.get_processed_orbits(pygac_commit)
+    db.close()
+
+    logger.info("{0} orbits successfully and {1} orbits not successfully "
+                "processed with {2}".format(len(done), len(failed), pygac_commit))
+
+    selected = list()
+    for ifile in file_list:
+        # orbit names are stored as original (zipped) L1b file names
+        orbit = os.path.basename(ifile) + '.gz'
+        if pygac_mode == 'failed':
+            if orbit in failed:
+                selected.append(ifile)
+        elif orbit not in done:
+            selected.append(ifile)
+
+    return selected
+
+
 if __name__ == '__main__':
 
     logger.info("{0} started for ".format(os.path.basename(__file__)))
@@ -123,11 +280,20 @@ if __name__ == '__main__':
     logger.info("PyGAC Input  : {0}".format(inp_path))
     logger.info("PyGAC Output : {0}".format(out_path))
     logger.info("SQL database : {0}".format(sql_quick_output))
+    logger.info("SQL writer   : {0}".format(sql_writer_socket))
+    logger.info("PyGAC Workers: {0}".format(pygac_workers))
+    logger.info("PyGAC Timeout: {0}".format(pygac_timeout))
+    logger.info("PyGAC Mode   : {0}".format(pygac_mode))
 
     # -- Get AVHRR GAC l1b file list
     file_list = subs.find("NSS*", inp_path)
     logger.info("{0} files found".format(len(file_list)))
 
+    # -- skip orbits already processed
+    file_list = select_orbits(file_list)
+    logger.info("{0} files will be processed (mode: {1})".
+                format(len(file_list), pygac_mode))
+
     # -- Call PyGAC and make quick analysis of each orbit
     call_pygac(file_list)
 
@@ -13,47 +13,55 @@ import sqlite3
 import datetime
 import subs_avhrrgac as mysub
 import read_avhrrgac_h5 as rh5
-from multiprocessing import Pool
-from numpy.core.umath_tests import inner1d
+import sqlite_writer as sqlwriter
+from multiprocessing import Pool, cpu_count
+from dateutil.rrule import rrule, DAILY
 from pycmsaf.logger import setup_root_logger
 
 logger = setup_root_logger(name='root')
 
 
-def readfiles(tup):
-    idx, ifil = tup
-
-    global zone_size
-    global nzones
-
-    # initialize global mean, stdv, nobs parameters
-    # saving output for each orbit
-    gmean = dict()
-    gstdv = dict()
-    gnobs = dict()
-    zmean = dict()
-    zstdv = dict()
-    znobs = dict()
+def init_moments(cha_list, sel_list, nzones):
+    """
+    Initialize empty global and zonal moments for all
+    channels and time selections.
+    :return: global moments, zonal moments (dicts [channel][select])
+    """
+    gmoms = dict()
+    zmoms = dict()
 
     for chan in cha_list:
-        gmean[chan] = dict()
-        gstdv[chan] = dict()
-        gnobs[chan] = dict()
-        zmean[chan] = dict()
-        zstdv[chan] = dict()
-        znobs[chan] = dict()
+        gmoms[chan] = dict()
+        zmoms[chan] = dict()
 
         for sele in sel_list:
-            gmean[chan][sele] = 0.
-            gstdv[chan][sele] = 0.
-            gnobs[chan][sele] = 0.
-            zmean[chan][sele] = np.ma.zeros(nzones)
-            zstdv[chan][sele] = np.ma.zeros(nzones)
-            znobs[chan][sele] = np.ma.zeros(nzones)
+            gmoms[chan][sele] = mysub.Moments()
+            zmoms[chan][sele] = mysub.Moments.zeros(nzones)
 
             if chan is 'ch1' or chan is 'ch2' or chan is 'ch3a':
                 break
 
+    return gmoms, zmoms
+
+
+def readfiles(tup):
+    """
+    Compute global and zonal moments of one orbit for all
+    channels and time selections.
+    :param tup: (key of the day, avhrr L1c file, channel list,
+                 select list, zone size, base zone size or None)
+    :return: key of the day, global moments, zonal moments, base zone moments
+             (dicts [channel][select], base zone moments are None
+             without base zone size), moments are None if the input is fishy
+    """
+    idx, ifil, cha_list, sel_list, zone_size, base_size = tup
+
+    # initialize global and zonal moments
+    # saving output for each orbit
+    nzones = len(mysub.get_zone_centers(zone_size))
+    (gmoms, zmoms) = init_moments(cha_list, sel_list, nzones)
+    bmoms = init_base_moments(cha_list, sel_list, base_size)
+
     # get angles file for ahvrr file
     afil = ifil.replace("ECC_GAC_avhrr_", "ECC_GAC_sunsatangles_")
 
@@ -61,6 +69,12 @@ def readfiles(tup):
     f = h5py.File(ifil, "r+")
     a = h5py.File(afil, "r+")
 
+    # decode orbit only once for all channels and selections
+    orbit = rh5.AvhrrGacOrbit(f, a)
+    # latitudinal zone index, shared by all channels and selections
+    zones = None
+    base_zones = None
+
     # cha_list  = ['ch1', 'ch2', 'ch3b', 'ch4', 'ch5', 'ch3a']
     for channel in cha_list:
 
@@ -69,50 +83,52 @@ def readfiles(tup):
 
             try:
                 # noinspection PyUnusedLocal
-                check_availability = global_mean[channel][select]
+                check_availability = gmoms[channel][select]
 
                 try:
-                    # (lat, lon, tar) = rh5.read_avhrrgac(f, a, select, channel)
-                    (lat, lon, tar) = rh5.read_avhrrgac(f, a, select, channel)
+                    (lat, lon, tar) = orbit.get(channel, select)
 
                     # check is channel is filled with measurements
                     if np.ma.count(tar) == 0:
                         break
 
                     # global statistics
-                    glob_n = tar.count()
-                    glob_m = tar.mean(dtype=np.float64)
-                    glob_s = tar.std(dtype=np.float64)
+                    glob = mysub.Moments.from_data(tar)
 
                     # zonal statistics
-                    (zonal_m, zonal_s, zonal_n) = mysub.cal_zonal_means(lat, tar, zone_size)
+                    if zones is None:
+                        zones = mysub.get_zone_index(orbit.lat, zone_size)
+                    (zn, zs, zss) = mysub.cal_zonal_moments(zones[0], zones[1], [tar])
+                    zonal = mysub.Moments.from_sums(zn[0], zs[0], zss[0])
 
-                    if zonal_n.sum() != glob_n:
+                    if zonal.nobs.sum() != glob.nobs:
                         logger.info("Input is fishy due to: {0} "
                                     "(zonal nobs) != {1} (global nobs) ".
-                                    format(int(zonal_n.sum()), glob_n))
+                                    format(int(zonal.nobs.sum()), int(glob.nobs)))
                         logger.info("Fil: {0}".format(os.path.basename(ifil)))
                         logger.info("Afil: {0}".format(os.path.basename(afil)))
                         logger.info("Cha/Sel: {0}/{1} ".format(channel, select))
-                        return None
+                        return idx, None, None, None
 
-                    gmean[channel][select] = glob_m
-                    gstdv[channel][select] = glob_s
-                    gnobs[channel][select] = glob_n
+                    gmoms[channel][select] = glob
+                    zmoms[channel][select] = zonal
 
-                    zmean[channel][select] = zonal_m
-                    zstdv[channel][select] = zonal_s
-                    znobs[channel][select] = zonal_n
+                    # additive moments on the fine base grid
+                    if bmoms is not None:
+                        if base_zones is None:
+                            base_zones = mysub.get_zone_index(orbit.lat, base_size)
+                        (bn, bs, bss) = mysub.cal_zonal_moments(base_zones[0], base_zones[1], [tar])
+                        bmoms[channel][select] = mysub.Moments.from_sums(bn[0], bs[0], bss[0])
 
                     # clear variables
-                    del (glob_m, glob_s, glob_n, zonal_m, zonal_s, zonal_n)
+                    del (glob, zonal, zn, zs, zss)
 
                 except (IndexError, ValueError, RuntimeError, Exception) as err:
                     logger.info("FAILED: {0}".format(err))
                     logger.info("Fil: {0}".format(os.path.basename(ifil)))
                     logger.info("Afil: {0}".format(os.path.basename(afil)))
                     logger.info("Cha/Sel: {0}/{1} ".format(channel, select))
-                    return None
+                    return idx, None, None, None
 
             except KeyError:
                 break
@@ -122,7 +138,320 @@ def readfiles(tup):
     f.close()
 
     # return pro orbit=file
-    return idx, gmean, gstdv, gnobs, zmean, zstdv, znobs
+    return idx, gmoms, zmoms, bmoms
+
+
+def init_base_moments(cha_list, sel_list, base_size):
+    """
+    Initialize empty moments of the base zones, see L{init_moments}.
+    :return: dict [channel][select] or None without base zone size
+    """
+    if not base_size:
+        return None
+    nbase = len(mysub.get_zone_centers(base_size))
+    return init_moments(cha_list, sel_list, nbase)[1]
+
+
+def merge_moments(daily, moms):
+    """
+    Merge moments of one orbit into the daily moments (dicts [channel][select]).
+    """
+    if daily is None:
+        return
+    for cha in daily:
+        for sel in daily[cha]:
+            daily[cha][sel].merge(moms[cha][sel])
+
+
+def process_orbits(pool, files, cha_list, sel_list, zone_size, base_size=None):
+    """
+    Compute daily global and zonal moments of several days at once.
+    The orbits of all days are scheduled across the given pool and
+    merged into the moments of their day as they arrive.
+    :param files: dict [key] = orbit files of one day, the key is
+                  e.g. a date or a (satellite, date) tuple
+    :param base_size: zone size of additional base zone moments
+    :return: dict [key] = (quality flag (False if any orbit is fishy),
+             daily global moments, daily zonal moments,
+             daily base zone moments (None without base_size))
+    """
+    nzones = len(mysub.get_zone_centers(zone_size))
+
+    days = dict()
+    arglist = list()
+    for key in files:
+        (daily_global, daily_zonal) = init_moments(cha_list, sel_list, nzones)
+        daily_base = init_base_moments(cha_list, sel_list, base_size)
+        days[key] = (True, daily_global, daily_zonal, daily_base)
+        for fil in files[key]:
+            arglist.append((key, fil, cha_list, sel_list, zone_size, base_size))
+
+    for (key, gmoms, zmoms, bmoms) in pool.imap_unordered(readfiles, arglist):
+        (qflag, daily_global, daily_zonal, daily_base) = days[key]
+        if gmoms is None:
+            days[key] = (False, daily_global, daily_zonal, daily_base)
+        elif qflag is True:
+            merge_moments(daily_global, gmoms)
+            merge_moments(daily_zonal, zmoms)
+            merge_moments(daily_base, bmoms)
+
+    return days
+
+
+def process_day(pool, fil_list, cha_list, sel_list, zone_size, verbose=False,
+                base_size=None):
+    """
+    Compute daily global and zonal moments of all orbits of one day,
+    see L{process_orbits}.
+    :return: quality flag, daily global moments, daily zonal moments,
+             daily base zone moments (None without base_size)
+    """
+    if verbose:
+        logger.info("{0} orbits will be processed".format(len(fil_list)))
+
+    days = process_orbits(pool, {0: fil_list}, cha_list, sel_list,
+                          zone_size, base_size)
+    return days[0]
+
+
+def has_observations(daily_zonal):
+    """
+    True if any channel and time selection of a day has observations,
+    i.e. L{write_statistics} stores at least one record.
+    """
+    for cha in daily_zonal:
+        for sel in daily_zonal[cha]:
+            if daily_zonal[cha][sel].nobs.sum() > 0:
+                return True
+    return False
+
+
+def init_statistics_db(db, zone_centers, layout='wide'):
+    """
+    Create all tables needed for the statistics if not yet available.
+    :param layout: 'wide' (one column per latitudinal belt) or
+                   'blob' (zonal statistics as blobs, see statistics_blob)
+    """
+    tab_sat = 'satellites'
+    tab_cha = 'channels'
+    tab_sel = 'selects'
+    tab_lat = 'latitudes'
+    tab_sta = 'statistics'
+
+    cursor = db.cursor()
+
+    # -- create table for satellites
+    res = mysub.check_if_table_exists(cursor, tab_sat)
+    if res is 0:
+        mysub.create_id_name_table(db, tab_sat, mysub.get_satellite_list())
+
+    # -- create table for channels  
+    res = mysub.check_if_table_exists(cursor, tab_cha)
+    if res is 0:
+        mysub.create_id_name_table(db, tab_cha, mysub.get_channel_list())
+
+    # -- create table for selected times
+    res = mysub.check_if_table_exists(cursor, tab_sel)
+    if res is 0:
+        mysub.create_id_name_table(db, tab_sel, mysub.get_pystat_select_list())
+
+    # -- zone size is stored with each record
+    if layout == 'blob':
+        mysub.create_statistics_blob_table(db)
+        return
+
+    # -- create table for latitudinal belts
+    res = mysub.check_if_table_exists(cursor, tab_lat)
+    if res is 0:
+        mysub.create_id_name_table(db, tab_lat, zone_centers)
+
+    # -- create table for statistics
+    res = mysub.check_if_table_exists(cursor, tab_sta)
+    if res is 0:
+        mysub.create_statistics_table(db)
+        mysub.alter_statistics_table(db, zone_centers)
+
+
+def get_name_id(db, table, name):
+    """
+    Get id of name in table, e.g. satellites, channels, selects.
+    """
+    get_id = "SELECT id FROM {0} " \
+             "WHERE name = \'{1}\'".format(table, name)
+    results = db.execute(get_id)
+    for item in results:
+        return item["id"]
+    return None
+
+
+def store_day(db, zone_centers, date, satellite, nfiles, daily_global,
+              daily_zonal, cha_list, sel_list, fill_value=-9999., verbose=False,
+              layout='wide', daily_base=None, base_size=None):
+    """
+    Create tables if not yet available and add daily statistics
+    of one satellite. Also used as job of sqlite_writer.py.
+    :param daily_base: daily base zone moments of base_size or None
+    """
+    init_statistics_db(db, zone_centers, layout)
+    write_statistics(db, date, satellite, nfiles, daily_global, daily_zonal,
+                     cha_list, sel_list, fill_value, verbose, layout)
+    if daily_base is not None:
+        write_base_moments(db, date, satellite, nfiles, daily_base,
+                           cha_list, sel_list, base_size)
+
+
+def write_base_moments(db, date, satellite, nfiles, daily_base,
+                       cha_list, sel_list, base_size):
+    """
+    Add daily count, sum and sum of squares of the base zones of
+    one satellite to the base_moments table. Transaction handling
+    is up to the caller.
+    :param date: date string, e.g. 20090126
+    :param satellite: satellite name, e.g. NOAA18
+    """
+    mysub.create_base_moments_table(db)
+
+    lite_datstr = datetime.datetime.strptime(date, '%Y%m%d').date()
+    sat_id = get_name_id(db, 'satellites', mysub.full_sat_name(satellite)[2])
+
+    sql_query = "INSERT OR REPLACE INTO base_moments " \
+                "(satelliteID, date, channelID, selectID, binsize, " \
+                "OrbitCount, ZonalNobs, ZonalSum, ZonalSumSq) " \
+                "VALUES(?,?,?,?,?,?,?,?,?)"
+
+    for chakey in cha_list:
+        for selkey in sel_list:
+            try:
+                (nobs, sums, sumsq) = daily_base[chakey][selkey].get_sums()
+            except KeyError:
+                break
+
+            if nobs.sum() == 0:
+                continue
+
+            db.execute(sql_query, [sat_id, lite_datstr,
+                                   get_name_id(db, 'channels', chakey),
+                                   get_name_id(db, 'selects', selkey),
+                                   float(base_size), nfiles,
+                                   mysub.array_to_blob(nobs, '<i8'),
+                                   mysub.array_to_blob(sums, '<f8'),
+                                   mysub.array_to_blob(sumsq, '<f8')])
+
+
+def write_statistics(db, date, satellite, nfiles, daily_global, daily_zonal,
+                     cha_list, sel_list, fill_value=-9999., verbose=False,
+                     layout='wide'):
+    """
+    Add daily global and zonal statistics of one satellite to
+    the statistics table. Transaction handling is up to the caller.
+    :param date: date string, e.g. 20090126
+    :param satellite: satellite name, e.g. NOAA18
+    :param layout: 'wide' (statistics) or 'blob' (statistics_blob)
+    """
+    tab_sat = 'satellites'
+    tab_cha = 'channels'
+    tab_sel = 'selects'
+    tab_sta = 'statistics'
+
+    lite_datstr = datetime.datetime.strptime(date, '%Y%m%d').date()
+    lite_satstr = mysub.full_sat_name(satellite)[2]
+
+    # -- get satID
+    sat_id = get_name_id(db, tab_sat, lite_satstr)
+
+    for chakey in cha_list:
+        for selkey in sel_list:
+            try:
+                glob = daily_global[chakey][selkey]
+                zonal = daily_zonal[chakey][selkey]
+
+                if zonal.nobs.sum() == 0:
+                    if verbose: 
+                        logger.info("No db entry for: {0}/{1}".
+                                format(chakey,selkey))
+                    continue
+
+                if verbose:
+                    logger.info("{0} ({1})".format(
+                        mysub.full_cha_name(chakey), selkey))
+
+                zm = zonal.get_mean()
+                zn = zonal.nobs
+                gn = glob.nobs
+                gm = glob.mean
+                gmean_check = np.ma.dot(zm, zn) / gn
+
+                # sanity check
+                if gmean_check != gm:
+                    gdiff = abs(gmean_check - gm)
+                    logger.info("WARNING: Global mean based on zonal means: "
+                                "{0} != {1} (global), difference={2}".
+                                format(gmean_check, gm, gdiff))
+                if verbose: 
+                    logger.info("OK: Global mean based on zonal means: " 
+                                "{0} == {1} (global)".format(gmean_check, gm))
+                # sanity check
+                if np.sum(zn) != gn:
+                    gdiff = abs(np.sum(zn) - gn)
+                    logger.info("WARNING: Global nobs based on zonal nobs: "
+                                "{0} != {1} (global), difference={2}".
+                                format(np.sum(zn), gn, gdiff))
+                if verbose: 
+                    logger.info("OK: Global nobs based on zonal nobs: " 
+                                "{0} == {1} (global)".format(np.sum(zn), gn))
+
+                # -- get chaID
+                cha_id = get_name_id(db, tab_cha, chakey)
+
+                # -- get selID
+                sel_id = get_name_id(db, tab_sel, selkey)
+
+                # -- set bad records to fill_value
+                (glm, gls, gln,
+                 mean, stdv, nobs) = mysub.set_fillvalue(
+                    fill_value, zm, zonal.get_stdv(), zn,
+                    gm, np.ma.getdata(glob.get_stdv()), gn)
+
+                if layout == 'blob':
+                    # zones cover -90 to 90 degrees
+                    binsize = 180. / len(mean)
+                    sql_query = "INSERT OR REPLACE INTO statistics_blob " \
+                                "(satelliteID, date, channelID, selectID, binsize, " \
+                                "OrbitCount, GlobalMean, GlobalStdv, GlobalNobs, " \
+                                "ZonalMean, ZonalStdv, ZonalNobs) " \
+                                "VALUES(?,?,?,?,?,?,?,?,?,?,?,?)"
+                    db.execute(sql_query, [sat_id, lite_datstr, cha_id, sel_id, binsize,
+                                           nfiles, glm, gls, gln,
+                                           mysub.array_to_blob(mean, '<f4'),
+                                           mysub.array_to_blob(stdv, '<f4'),
+                                           mysub.array_to_blob(nobs, '<i4')])
+                    continue
+
+                # -- convert numpy arrays to lists
+                zonal_mean_list = mean.tolist()
+                zonal_stdv_list = stdv.tolist()
+                zonal_nobs_list = nobs.tolist()
+
+                # -- add statistics to db
+                prim_list = [sat_id, lite_datstr, cha_id, sel_id]
+                base_list = prim_list + [nfiles, glm, gls, gln]
+                full_list = base_list + zonal_mean_list + zonal_stdv_list + zonal_nobs_list
+                tuple_len = len(full_list)
+                holders = ','.join('?' * tuple_len)
+
+                # sql_query = "INSERT OR ABORT INTO %s "\
+                # "VALUES({0})".format(holders) % tab_sta
+                sql_query = "INSERT OR REPLACE INTO %s " \
+                            "VALUES({0})".format(holders) % tab_sta
+
+                if verbose:
+                    logger.info("sql_query: {0}".format(sql_query))
+                    logger.info("full_list: {0}".format(full_list))
+
+                db.execute(sql_query, full_list)
+
+            except KeyError:
+                break
 
 
 if __name__ == '__main__':
@@ -133,13 +462,22 @@ if __name__ == '__main__':
     For the VIS channels, statistics is based on daytime observations only,
     i.e. SZA less than 80. For the IR channels day/twilight/night 
     observations are considered. Statistics are stored in a sqlite db.
-    Orbits are processed in parallel mode.''' % os.path.basename(__file__))
+    Orbits are processed in parallel mode. Either a single date (-d) or
+    a date range (-sd/-ed) for one or more satellites can be processed
+    with one pool of worker processes.''' % os.path.basename(__file__))
 
     parser.add_argument('-d', '--date', type=mysub.datestring,
-                        help='Date String, e.g. 20090126', required=True)
+                        help='Date String, e.g. 20090126')
+
+    parser.add_argument('-sd', '--start_date', type=mysub.datestring,
+                        help='Start Date String, e.g. 20090101')
+
+    parser.add_argument('-ed', '--end_date', type=mysub.datestring,
+                        help='End Date String, e.g. 20091231')
 
     parser.add_argument('-s', '--satellite', type=mysub.pygac_satstring,
-                        help='Satellite, e.g. metop02', required=True)
+                        help='Satellite(s), e.g. NOAA18 METOPA',
+                        nargs='+', required=True)
 
     parser.add_argument('-i', '--inpdir',
                         help='Path, e.g. /path/to/input', required=True)
@@ -150,6 +488,26 @@ if __name__ == '__main__':
     parser.add_argument('-b', '--binsize',
                         help='Define binsize for latitudinal belts', default=5)
 
+    parser.add_argument('-lay', '--layout', choices=['wide', 'blob'], default='wide',
+                        help='Store zonal statistics in one column per belt (wide) '
+                             'or as blobs allowing several binsizes (blob)')
+
+    parser.add_argument('-bb', '--base_binsize', type=float,
+                        help='Also store count, sum and sum of squares on this '
+                             'fine latitude grid, e.g. 1 (table base_moments)')
+
+    parser.add_argument('-w', '--workers', type=int,
+                        help='Number of worker processes, '
+                             'default: number of CPUs', default=cpu_count())
+
+    parser.add_argument('-ws', '--writer_socket',
+                        help='Send statistics to sqlite_writer.py listening '
+                             'on this Unix socket instead of locking the database')
+
+    parser.add_argument('-wk', '--writer_authkey',
+                        help='Shared secret of sqlite_writer.py, default: '
+                             'environment variable ' + sqlwriter.AUTHKEY_ENV)
+
     parser.add_argument('-t', '--test',
                         help='Run test with reduced channel and select list',
                         action="store_true")
@@ -159,19 +517,19 @@ if __name__ == '__main__':
 
     args = parser.parse_args()
 
+    # -- date list
+    if args.date:
+        date_list = [args.date]
+    elif args.start_date and args.end_date:
+        sdt = datetime.datetime.strptime(args.start_date, '%Y%m%d')
+        edt = datetime.datetime.strptime(args.end_date, '%Y%m%d')
+        date_list = [dt.strftime('%Y%m%d') for dt in
+                     rrule(DAILY, dtstart=sdt, until=edt)]
+    else:
+        parser.error("Either -d or -sd and -ed are required")
+
     # -- some settings
     fill_value = -9999.
-    pattern = 'ECC_GAC_avhrr*' + args.satellite + '*' + args.date + 'T*'
-    fil_list = mysub.find(pattern, args.inpdir)
-    nfiles = len(fil_list)
-    message = "No files available for " + args.date + ", " + args.satellite
-    qflag = True  # quality flag if input data is not fishy
-
-    if nfiles == 0:
-        logger.info(message)
-        sys.exit(0)
-    else:
-        fil_list.sort()
 
     # -- lists for generating total arrays
     if args.test is True:
@@ -184,344 +542,108 @@ if __name__ == '__main__':
         sel_list = mysub.get_pystat_select_list()
 
     # -- define latitudinal zone size:
-    global zone_size
-    global nzones
     zone_size = float(args.binsize)
-    zone_rad = zone_size / 2.0
 
     # -- determine zone centers:
-    zone_centers = np.arange(-90 + zone_rad, 90 + zone_rad, zone_size)
+    zone_centers = mysub.get_zone_centers(zone_size)
     nzones = len(zone_centers)
 
     # -- make some screen output if wanted
     if args.verbose:
         logger.info("Parameter passed")
         logger.info("TEST       : %s" % args.test)
-        logger.info("Date       : %s" % args.date)
-        logger.info("Satellite  : %s" % args.satellite)
+        logger.info("Dates      : %s - %s" % (date_list[0], date_list[-1]))
+        logger.info("Satellites : %s" % args.satellite)
         logger.info("ChanList   : %s" % cha_list)
         logger.info("SelectList : %s" % sel_list)
         logger.info("Input Path : %s" % args.inpdir)
         logger.info("Binsize    : %s" % args.binsize)
         logger.info("Nzones     : %s" % nzones)
+        logger.info("Layout     : %s" % args.layout)
+        logger.info("BaseBinsize: %s" % args.base_binsize)
+        logger.info("Workers    : %s" % args.workers)
         logger.info("Verbose    : %s" % args.verbose)
         logger.info("DB_Sqlite3 : %s" % args.gsqlite)
-
-    # -- initialize global mean, stdv, nobs parameters
-    # saving output for each orbit
-    global_mean = dict()
-    global_stdv = dict()
-    global_nobs = dict()
-    zonal_mean = dict()
-    zonal_stdv = dict()
-    zonal_nobs = dict()
-
-    # saving mean values based on all orbits/day
-    all_global_mean = dict()
-    all_global_stdv = dict()
-    all_global_nobs = dict()
-    all_zonal_mean = dict()
-    all_zonal_stdv = dict()
-    all_zonal_nobs = dict()
-
-    for cha in cha_list:
-        global_mean[cha] = dict()
-        global_stdv[cha] = dict()
-        global_nobs[cha] = dict()
-        zonal_mean[cha] = dict()
-        zonal_stdv[cha] = dict()
-        zonal_nobs[cha] = dict()
-
-        all_global_mean[cha] = dict()
-        all_global_stdv[cha] = dict()
-        all_global_nobs[cha] = dict()
-        all_zonal_mean[cha] = dict()
-        all_zonal_stdv[cha] = dict()
-        all_zonal_nobs[cha] = dict()
-
-        for sel in sel_list:
-            global_mean[cha][sel] = np.ma.zeros(nfiles)
-            global_stdv[cha][sel] = np.ma.zeros(nfiles)
-            global_nobs[cha][sel] = np.ma.zeros(nfiles)
-            zonal_mean[cha][sel] = np.ma.zeros((nfiles, nzones))
-            zonal_stdv[cha][sel] = np.ma.zeros((nfiles, nzones))
-            zonal_nobs[cha][sel] = np.ma.zeros((nfiles, nzones))
-
-            all_global_mean[cha][sel] = 0.
-            all_global_stdv[cha][sel] = 0.
-            all_global_nobs[cha][sel] = 0.
-            all_zonal_mean[cha][sel] = np.ma.zeros(nzones)
-            all_zonal_stdv[cha][sel] = np.ma.zeros(nzones)
-            all_zonal_nobs[cha][sel] = np.ma.zeros(nzones)
-
-            if cha is 'ch1' or cha is 'ch2' or cha is 'ch3a':
-                break
-
-    # -- creating jobs as tuple
-    arglist = list()
-    for pos, fil in enumerate(fil_list):
-        arglist.append((pos, fil))
-
-    if args.verbose: 
-        logger.info("{0} orbits will be processed".format(nfiles))
-    pool = Pool(processes=nfiles)
-    results = pool.map(func=readfiles, iterable=arglist)
-
-    for pos, out in enumerate(results):
-        if out is None:
-            qflag = False
-        else:
-            for cha in cha_list:
-                for sel in sel_list:
-                    try:
-                        check = global_mean[cha][sel]
-                        global_mean[cha][sel][out[0]] = out[1][cha][sel]
-                        global_stdv[cha][sel][out[0]] = out[2][cha][sel]
-                        global_nobs[cha][sel][out[0]] = out[3][cha][sel]
-                        zonal_mean[cha][sel][out[0], :] = out[4][cha][sel]
-                        zonal_stdv[cha][sel][out[0], :] = out[5][cha][sel]
-                        zonal_nobs[cha][sel][out[0], :] = out[6][cha][sel]
-                    except KeyError:
-                        break
-
-    # -- only store good data
-    if qflag is True:
-
-        # -- create lists of mean, stdv, nobs for globa/zonal
-        global_list = [global_mean, global_stdv, global_nobs]
-        all_global_list = [all_global_mean, all_global_stdv, all_global_nobs]
-
-        # -- Global means/stdv/nobs
-        for position, item in enumerate(global_list):
-            for chakey in item:
-                for selkey, selval in item[chakey].items():
-                    # working on
-                    data_vec = item[chakey][selkey]
-                    nobs_vec = global_nobs[chakey][selkey]
-                    sum_nobs = np.ma.sum(nobs_vec)
-                    # if nobs, then sum up only == sum_nobs
-                    if position is 2:
-                        ave = np.ma.sum(data_vec)
-                    # else mean & stdv: weight average with nobs
-                    else:
-                        ave = np.ma.dot(data_vec,nobs_vec)/sum_nobs
-                    # store result in list
-                    try:
-                        all_item = all_global_list[position]
-                        check = all_item[chakey][selkey]
-                        all_item[chakey][selkey] = ave
-                        del ave
-                    except KeyError:
-                        break
-
-        # -- create lists of mean, stdv, nobs for globa/zonal
-        zonal_list = [zonal_mean, zonal_stdv, zonal_nobs]
-        all_zonal_list = [all_zonal_mean, all_zonal_stdv, all_zonal_nobs]
-
-        # -- Zonal means/stdv/nobs 
-        # axis=0 -> row: nfiles results
-        # axis=1 -> col: belt zones
-        for position, item in enumerate(zonal_list):
-            for chakey in item:
-                for selkey, selval in item[chakey].items():
-                    # Working on
-                    #data_vec = item[chakey][selkey]
-                    #nobs_vec = zonal_nobs[chakey][selkey]
-                    data_vec = np.ma.filled(item[chakey][selkey], 0.)
-                    nobs_vec = np.ma.filled(zonal_nobs[chakey][selkey], 0.)
-                    sum_nobs = np.ma.sum(nobs_vec, axis=0)
-                    # if nobs, then sum up only == sum_nobs
-                    if position is 2:
-                        ave = np.ma.sum(data_vec, axis=0)
-                    # else mean & stdv: weight average with nobs
-                    else:
-                        data_trans = data_vec.transpose()
-                        nobs_trans = nobs_vec.transpose()
-                        # inner1d: np.dot of multi-dim matrix
-                        inn = inner1d(data_trans,nobs_trans)
-                        with np.errstate(divide='ignore', invalid='ignore'): 
-                            ave_unmasked = inn/sum_nobs
-                        # mask all nan elements
-                        ave = np.ma.masked_invalid(ave_unmasked)
-                    # store result in list
-                    try:
-                        all_item = all_zonal_list[position]
-                        check = all_item[chakey][selkey]
-                        all_item[chakey][selkey][:] = ave
-                        del ave
-                    except KeyError:
-                        break
-
-        # -- save output
-        if args.verbose:
-            logger.info("Write global/zonal output into {0} ".
-                        format(args.gsqlite))
-
-        lite_datstr = datetime.datetime.strptime(args.date, '%Y%m%d').date()
-        lite_satstr = mysub.full_sat_name(args.satellite)[2]
-
-        all_satellites = mysub.get_satellite_list()
-        all_channels = mysub.get_channel_list()
-        all_selects = mysub.get_pystat_select_list()
-
-        tab_sat = 'satellites'
-        tab_cha = 'channels'
-        tab_sel = 'selects'
-        tab_lat = 'latitudes'
-        tab_sta = 'statistics'
-
-        try:
-            global db
-            db = sqlite3.connect(args.gsqlite,
-                                 detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
-                                 timeout=36000)
-
-            db.row_factory = mysub.dict_factory
-
-            db.isolation_level = 'EXCLUSIVE'
-            db.execute('BEGIN EXCLUSIVE')
-
-            cursor = db.cursor()
-
-            # -- create table for satellites
-            res = mysub.check_if_table_exists(cursor, tab_sat)
-            if res is 0:
-                mysub.create_id_name_table(db, tab_sat, all_satellites)
-
-            # -- create table for channels  
-            res = mysub.check_if_table_exists(cursor, tab_cha)
-            if res is 0:
-                mysub.create_id_name_table(db, tab_cha, all_channels)
-
-            # -- create table for selected times
-            res = mysub.check_if_table_exists(cursor, tab_sel)
-            if res is 0:
-                mysub.create_id_name_table(db, tab_sel, all_selects)
-
-            # -- create table for latitudinal belts
-            res = mysub.check_if_table_exists(cursor, tab_lat)
-            if res is 0:
-                mysub.create_id_name_table(db, tab_lat, zone_centers)
-
-            # -- create table for statistics
-            res = mysub.check_if_table_exists(cursor, tab_sta)
-            if res is 0:
-                mysub.create_statistics_table(db)
-                mysub.alter_statistics_table(db, zone_centers)
-
-            # -- get satID
-            get_id = "SELECT id FROM {0} " \
-                     "WHERE name = \'{1}\'".format(tab_sat, lite_satstr)
-            results = db.execute(get_id)
-            for item in results:
-                sat_id = item["id"]
-
-            for chakey in cha_list:
-                for selkey in sel_list:
-                    try:
-                        check = all_zonal_mean[chakey][selkey]
-
-                        if np.ma.count(check) == 0:
-                            if args.verbose: 
-                                logger.info("No db entry for: {0}/{1}".
-                                        format(chakey,selkey))
-                            continue
-
-                        if args.verbose:
-                            logger.info("{0} ({1})".format(
-                                mysub.full_cha_name(chakey), selkey))
-
-                        zm = all_zonal_list[0][chakey][selkey]
-                        zn = all_zonal_list[2][chakey][selkey]
-                        gn = all_global_list[2][chakey][selkey]
-                        gmean_check = np.ma.dot(zm, zn) / gn
-
-                        # sanity check
-                        if gmean_check != all_global_list[0][chakey][selkey]:
-                            gdiff = abs(gmean_check - all_global_list[0][chakey][selkey])
-                            logger.info("WARNING: Global mean based on zonal means: "
-                                        "{0} != {1} (global), difference={2}".
-                                        format(gmean_check,all_global_list[0][chakey][selkey],
-                                               gdiff))
-                        if args.verbose: 
-                            logger.info("OK: Global mean based on zonal means: " 
-                                        "{0} == {1} (global)".format(gmean_check, 
-                                            all_global_list[0][chakey][selkey]))
-                        # sanity check
-                        if np.ma.sum(zn) != gn:
-                            gdiff = abs(np.ma.sum(zn) - gn)
-                            logger.info("WARNING: Global nobs based on zonal nobs: "
-                                        "{0} != {1} (global), difference={2}".
-                                        format(np.ma.sum(zn), gn, gdiff))
-                        if args.verbose: 
-                            logger.info("OK: Global nobs based on zonal nobs: " 
-                                        "{0} == {1} (global)".format(np.ma.sum(zn), gn))
-
-                        # -- get chaID
-                        get_id = "SELECT id FROM {0} " \
-                                 "WHERE name = \'{1}\'".format(tab_cha, chakey)
-                        results = db.execute(get_id)
-                        for item in results:
-                            cha_id = item["id"]
-
-                        # -- get selID
-                        get_id = "SELECT id FROM {0} " \
-                                 "WHERE name = \'{1}\'".format(tab_sel, selkey)
-                        results = db.execute(get_id)
-                        for item in results:
-                            sel_id = item["id"]
-
-                        # -- set bad records to fill_value
-                        (glm, gls, gln,
-                         mean, stdv, nobs) = mysub.set_fillvalue(
-                            fill_value, all_zonal_list[0][chakey][selkey],
-                            all_zonal_list[1][chakey][selkey],
-                            all_zonal_list[2][chakey][selkey],
-                            all_global_list[0][chakey][selkey],
-                            all_global_list[1][chakey][selkey],
-                            all_global_list[2][chakey][selkey])
-
-                        # -- convert numpy arrays to lists
-                        zonal_mean_list = mean.tolist()
-                        zonal_stdv_list = stdv.tolist()
-                        zonal_nobs_list = nobs.tolist()
-
-                        # -- add statistics to args.gsqlite db
-                        # noinspection PyUnboundLocalVariable,PyUnboundLocalVariable,PyUnboundLocalVariable
-                        prim_list = [sat_id, lite_datstr, cha_id, sel_id]
-                        base_list = prim_list + [nfiles, glm, gls, gln]
-                        full_list = base_list + zonal_mean_list + zonal_stdv_list + zonal_nobs_list
-                        tuple_len = len(full_list)
-                        holders = ','.join('?' * tuple_len)
-
-                        # sql_query = "INSERT OR ABORT INTO %s "\
-                        # "VALUES({0})".format(holders) % tab_sta
-                        sql_query = "INSERT OR REPLACE INTO %s " \
-                                    "VALUES({0})".format(holders) % tab_sta
-
-                        if args.verbose:
-                            logger.info("sql_query: {0}".format(sql_query))
-                            logger.info("full_list: {0}".format(full_list))
-
-                        db.execute(sql_query, full_list)
-
-                    except KeyError:
-                        break
-
-        except sqlite3.Error, e:
-            if db:
-                db.rollback()
-                logger.info("ERROR: {0}".format(e.args[0]))
-                sys.exit(1)
-
-        finally:
-            if db:
-                db.commit()
-                db.close()
-
-    else:
-        logger.info("FAILED: No output for {0} on {1} "
-                    "due to fishy input !".format(args.satellite, args.date))
-
-    logger.info("{0} finished for {1} and {2}\n".
-                format(sys.argv[0], args.satellite, args.date))
+        logger.info("Writer     : %s" % args.writer_socket)
+
+    # -- statistics are either written by sqlite_writer.py or directly
+    writer = None
+    if args.writer_socket:
+        writer = sqlwriter.WriterClient(args.writer_socket, args.writer_authkey)
+
+    # -- one pool for all dates and satellites
+    pool = Pool(processes=args.workers)
+
+    for date in date_list:
+        for satellite in args.satellite:
+
+            pattern = 'ECC_GAC_avhrr*' + satellite + '*' + date + 'T*'
+            fil_list = mysub.find(pattern, args.inpdir)
+            nfiles = len(fil_list)
+
+            if nfiles == 0:
+                logger.info("No files available for " + date + ", " + satellite)
+                continue
+            else:
+                fil_list.sort()
+
+            (qflag, daily_global, daily_zonal, daily_base) = process_day(
+                pool, fil_list, cha_list, sel_list, zone_size, args.verbose,
+                args.base_binsize)
+
+            # -- only store good data
+            if qflag is not True:
+                logger.info("FAILED: No output for {0} on {1} "
+                            "due to fishy input !".format(satellite, date))
+                continue
+
+            # -- save output
+            if writer:
+                writer.submit(store_day, zone_centers, date, satellite, nfiles,
+                              daily_global, daily_zonal, cha_list, sel_list,
+                              fill_value, args.verbose, args.layout,
+                              daily_base, args.base_binsize)
+                continue
+
+            if args.verbose:
+                logger.info("Write global/zonal output into {0} ".
+                            format(args.gsqlite))
+
+            db = None
+            try:
+                db = sqlite3.connect(args.gsqlite,
+                                     detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+                                     timeout=36000)
+
+                db.row_factory = mysub.dict_factory
+
+                db.isolation_level = 'EXCLUSIVE'
+                db.execute('BEGIN EXCLUSIVE')
+
+                store_day(db, zone_centers, date, satellite, nfiles,
+                          daily_global, daily_zonal, cha_list, sel_list,
+                          fill_value, args.verbose, args.layout,
+                          daily_base, args.base_binsize)
+
+            except sqlite3.Error, e:
+                if db:
+                    db.rollback()
+                    logger.info("ERROR: {0}".format(e.args[0]))
+                    sys.exit(1)
+
+            finally:
+                if db:
+                    db.commit()
+                    db.close()
+
+    pool.close()
+    pool.join()
+
+    if writer:
+        (ncommitted, errors) = writer.sync()
+        writer.close()
+        logger.info("{0} days committed by {1}".format(ncommitted, args.writer_socket))
+        for err in errors:
+            logger.info("FAILED: {0}".format(err))
+        if errors:
+            sys.exit(1)
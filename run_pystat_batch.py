@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Batch driver for run_pystat_add2sqlite.py:
+# process a date range and a list of satellites with one process pool.
+#
+
+import os
+import sys
+import argparse
+import fnmatch
+import sqlite3
+import datetime
+import subs_avhrrgac as mysub
+import run_pystat_add2sqlite as pystat
+import sqlite_writer as sqlwriter
+from multiprocessing import Pool, cpu_count
+from dateutil.rrule import rrule, DAILY
+from pycmsaf.logger import setup_root_logger
+
+logger = setup_root_logger(name='root')
+
+
+def scan_inpdir(inpdir, sat_list, date_list):
+    """
+    Scan input directory once and sort AVHRR GAC L1c files
+    by satellite and date. As in run_pystat_add2sqlite.py, an orbit
+    belongs to the date of its first and of its last scanline.
+    :return: dict [(satellite, date)] = sorted file list
+    """
+    dates = set(date_list)
+    files = dict()
+
+    for root, dirs, names in os.walk(inpdir):
+        for name in names:
+            if not fnmatch.fnmatch(name, 'ECC_GAC_avhrr*'):
+                continue
+
+            split_string = mysub.split_filename(name)
+            if len(split_string) < 7:
+                continue
+
+            sat = split_string[3]
+            if sat not in sat_list:
+                continue
+
+            fil = os.path.join(root, name)
+            for dstr in set([split_string[5][0:8], split_string[6][0:8]]):
+                if dstr in dates:
+                    files.setdefault((sat, dstr), list()).append(fil)
+
+    for key in files:
+        files[key].sort()
+
+    return files
+
+
+def get_committed_days(dbfile, sat_list, sdate, edate, layout='wide', binsize=None):
+    """
+    Days between sdate and edate stored in the statistics table,
+    i.e. earlier or missing days within the range are processed
+    again when backfilling. Days not stored because of fishy input
+    or missing observations are not recorded and are processed again
+    by every resumed run.
+    :param sdate: start date string, e.g. 20090101
+    :param edate: end date string, e.g. 20091231
+    :param layout: 'wide' (statistics) or 'blob' (statistics_blob
+                   records of the given binsize)
+    :return: set of (satellite, date string), e.g. ('NOAA18', '20090126')
+    """
+    committed = set()
+
+    if not os.path.isfile(dbfile):
+        return committed
+
+    db = sqlite3.connect(dbfile, timeout=36000)
+    db.row_factory = mysub.dict_factory
+    cursor = db.cursor()
+
+    table = 'statistics'
+    where = ''
+    if layout == 'blob':
+        table = 'statistics_blob'
+        where = ' AND binsize = {0}'.format(float(binsize))
+
+    if mysub.check_if_table_exists(cursor, table) is 0:
+        db.close()
+        return committed
+
+    (sd, ed) = [datetime.datetime.strptime(dt, '%Y%m%d').date() for dt in (sdate, edate)]
+
+    for sat in sat_list:
+        lite_satstr = mysub.full_sat_name(sat)[2]
+        sat_id = pystat.get_name_id(db, 'satellites', lite_satstr)
+        if sat_id is None:
+            continue
+        cursor.execute("SELECT DISTINCT date FROM {0} WHERE satelliteID = ? "
+                       "AND date BETWEEN ? AND ?{1}".format(table, where),
+                       (sat_id, str(sd), str(ed)))
+        for res in cursor.fetchall():
+            committed.add((sat, str(res['date'])[0:10].replace('-', '')))
+
+    db.close()
+    return committed
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='''%s
+    calculates daily zonal and global statistics of AVHRR GAC L1c data
+    for a date range and a list of satellites like run_pystat_add2sqlite.py,
+    but scans the input directory only once, schedules the orbits of
+    several days across one process pool and writes the statistics in
+    batched transactions. Already committed days are skipped, i.e.
+    an interrupted run can simply be restarted. Days not stored due to
+    fishy input or missing observations are processed again.''' % os.path.basename(__file__))
+
+    parser.add_argument('-sd', '--start_date', type=mysub.datestring,
+                        help='Start Date String, e.g. 20090101', required=True)
+
+    parser.add_argument('-ed', '--end_date', type=mysub.datestring,
+                        help='End Date String, e.g. 20091231', required=True)
+
+    parser.add_argument('-s', '--satellite', type=mysub.pygac_satstring,
+                        help='Satellite(s), e.g. NOAA18 METOPA',
+                        nargs='+', required=True)
+
+    parser.add_argument('-i', '--inpdir',
+                        help='Path, e.g. /path/to/input', required=True)
+
+    parser.add_argument('-g', '--gsqlite',
+                        help='/path/to/AVHRR_GAC_L1c_pystat.sqlite3', required=True)
+
+    parser.add_argument('-b', '--binsize',
+                        help='Define binsize for latitudinal belts', default=5)
+
+    parser.add_argument('-lay', '--layout', choices=['wide', 'blob'], default='wide',
+                        help='Store zonal statistics in one column per belt (wide) '
+                             'or as blobs allowing several binsizes (blob)')
+
+    parser.add_argument('-bb', '--base_binsize', type=float,
+                        help='Also store count, sum and sum of squares on this '
+                             'fine latitude grid, e.g. 1 (table base_moments)')
+
+    parser.add_argument('-w', '--workers', type=int,
+                        help='Number of worker processes, '
+                             'default: number of CPUs', default=cpu_count())
+
+    parser.add_argument('-bd', '--batch_days', type=int,
+                        help='Number of days per transaction', default=10)
+
+    parser.add_argument('-nr', '--no_resume',
+                        help='Do not skip days already in the database',
+                        action="store_true")
+
+    parser.add_argument('-ws', '--writer_socket',
+                        help='Send statistics to sqlite_writer.py listening '
+                             'on this Unix socket instead of locking the database')
+
+    parser.add_argument('-wk', '--writer_authkey',
+                        help='Shared secret of sqlite_writer.py, default: '
+                             'environment variable ' + sqlwriter.AUTHKEY_ENV)
+
+    parser.add_argument('-t', '--test',
+                        help='Run test with reduced channel and select list',
+                        action="store_true")
+
+    parser.add_argument('-v', '--verbose',
+                        help='increase output verbosity', action="store_true")
+
+    args = parser.parse_args()
+
+    # -- some settings
+    fill_value = -9999.
+
+    if args.test is True:
+        cha_list = ['ch4']
+        sel_list = ['day_90sza', 'day', 'night', 'twilight']
+    else:
+        cha_list = mysub.get_channel_list()
+        sel_list = mysub.get_pystat_select_list()
+
+    zone_size = float(args.binsize)
+    zone_centers = mysub.get_zone_centers(zone_size)
+
+    sdt = datetime.datetime.strptime(args.start_date, '%Y%m%d')
+    edt = datetime.datetime.strptime(args.end_date, '%Y%m%d')
+    date_list = [dt.strftime('%Y%m%d') for dt in
+                 rrule(DAILY, dtstart=sdt, until=edt)]
+
+    if args.verbose:
+        logger.info("Parameter passed")
+        logger.info("TEST       : %s" % args.test)
+        logger.info("Dates      : %s - %s" % (date_list[0], date_list[-1]))
+        logger.info("Satellites : %s" % args.satellite)
+        logger.info("Input Path : %s" % args.inpdir)
+        logger.info("Binsize    : %s" % args.binsize)
+        logger.info("Layout     : %s" % args.layout)
+        logger.info("BaseBinsize: %s" % args.base_binsize)
+        logger.info("Workers    : %s" % args.workers)
+        logger.info("BatchDays  : %s" % args.batch_days)
+        logger.info("DB_Sqlite3 : %s" % args.gsqlite)
+        logger.info("Writer     : %s" % args.writer_socket)
+
+    # -- one directory scan for all dates and satellites
+    files = scan_inpdir(args.inpdir, args.satellite, date_list)
+    logger.info("Found {0} orbit files for {1} satellite days".format(
+        sum(len(v) for v in files.values()), len(files)))
+
+    # -- skip days already committed
+    if args.no_resume:
+        committed = set()
+    else:
+        # binsize as stored by write_statistics
+        committed = get_committed_days(args.gsqlite, args.satellite,
+                                       date_list[0], date_list[-1], args.layout,
+                                       180. / len(zone_centers))
+        for sat in args.satellite:
+            ndone = len([key for key in committed if key[0] == sat])
+            if ndone > 0:
+                logger.info("Resume {0}: {1} days already committed".format(sat, ndone))
+
+    todo = list()
+    for date in date_list:
+        for sat in args.satellite:
+            if (sat, date) not in files:
+                continue
+            if (sat, date) in committed:
+                continue
+            todo.append((sat, date))
+
+    ndays = len(todo)
+    logger.info("{0} satellite days will be processed".format(ndays))
+
+    writer = None
+    if args.writer_socket:
+        writer = sqlwriter.WriterClient(args.writer_socket, args.writer_authkey)
+
+    pool = Pool(processes=args.workers)
+    done = 0
+
+    for ib in range(0, ndays, args.batch_days):
+        batch = todo[ib:ib + args.batch_days]
+        days = pystat.process_orbits(pool, dict((key, files[key]) for key in batch),
+                                     cha_list, sel_list, zone_size, args.base_binsize)
+
+        db = None
+        try:
+            if writer is None:
+                db = sqlite3.connect(args.gsqlite,
+                                     detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+                                     timeout=36000)
+
+                db.row_factory = mysub.dict_factory
+
+                db.isolation_level = 'EXCLUSIVE'
+                db.execute('BEGIN EXCLUSIVE')
+
+            # write in date order
+            for key in batch:
+                (sat, date) = key
+                (qflag, daily_global, daily_zonal, daily_base) = days[key]
+                done += 1
+
+                # -- skipped days are processed again on resume
+                if qflag is not True:
+                    logger.info("{0}/{1} {2} {3}: input is fishy, "
+                                "not stored".format(done, ndays, date, sat))
+                    continue
+
+                if not pystat.has_observations(daily_zonal):
+                    logger.info("{0}/{1} {2} {3}: no observations, "
+                                "not stored".format(done, ndays, date, sat))
+                    continue
+
+                store_args = (zone_centers, date, sat, len(files[key]),
+                              daily_global, daily_zonal,
+                              cha_list, sel_list, fill_value, args.verbose,
+                              args.layout, daily_base, args.base_binsize)
+                if writer:
+                    writer.submit(pystat.store_day, *store_args)
+                else:
+                    pystat.store_day(db, *store_args)
+
+                logger.info("{0}/{1} {2} {3}: {4} orbits".format(
+                    done, ndays, date, sat, len(files[key])))
+
+            if writer:
+                # wait for the commit of the batch, resume relies on it
+                (ncommitted, errors) = writer.sync()
+                for err in errors:
+                    logger.info("FAILED: {0}".format(err))
+                if errors:
+                    sys.exit(1)
+            else:
+                db.commit()
+            logger.info("Committed up to {0}".format(batch[-1][1]))
+
+        except sqlite3.Error, e:
+            if db:
+                db.rollback()
+            logger.info("ERROR: {0}".format(e.args[0]))
+            sys.exit(1)
+
+        finally:
+            if db:
+                db.close()
+
+    pool.close()
+    pool.join()
+
+    if writer:
+        writer.close()
@@ -0,0 +1,444 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Single writer for SQLite databases:
+# one daemon owns the write connection, jobs are sent over a Unix socket.
+#
+
+import os
+import sys
+import time
+import signal
+import argparse
+import stat
+import sqlite3
+import importlib
+import threading
+import Queue
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+import subs_avhrrgac as mysub
+from pycmsaf.logger import setup_root_logger
+
+logger = setup_root_logger(name='root')
+
+# commit after this number of jobs ...
+BATCH_SIZE = 100
+# ... or after this number of seconds, whatever comes first
+FLUSH_INTERVAL = 5.
+
+# shared secret of writer and clients if not given as option
+AUTHKEY_ENV = 'AVHRRGAC_WRITER_KEY'
+
+# functions clients may run in the writer: (module, name)
+JOB_FUNCTIONS = [('run_pystat_add2sqlite', 'store_day'),
+                 ('quick_l1c_analysis', 'store_records')]
+
+
+def get_authkey(authkey=None):
+    """
+    Shared secret of writer and clients: authkey or the environment
+    variable AVHRRGAC_WRITER_KEY. Messages are unpickled by the
+    writer, i.e. it never accepts unauthenticated clients.
+    """
+    if not authkey:
+        authkey = os.environ.get(AUTHKEY_ENV)
+    if not authkey:
+        raise ValueError("no authkey given, set {0}".format(AUTHKEY_ENV))
+    return authkey.encode('utf-8') if not isinstance(authkey, bytes) else authkey
+
+
+class Producer(object):
+    """
+    State of one connected client: jobs waiting for the next commit
+    and error messages not yet reported by a sync.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.pending = 0
+        self.committed = 0
+        self.errors = list()
+
+
+class SqliteWriter(object):
+    """
+    Daemon owning the only write connection of a SQLite database.
+    Clients submit jobs, i.e. a module level function and its arguments,
+    see L{WriterClient}. Only functions of JOB_FUNCTIONS are run and
+    clients must know the authkey. The function is called with the connection as
+    first argument. Jobs are executed in arrival order by one thread,
+    each in its own savepoint, and committed in groups of batch_size
+    jobs or after flush_interval seconds. The database is switched to
+    WAL mode, i.e. readers are not blocked during ingestion.
+    """
+
+    def __init__(self, dbfile, address, batch_size=BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, authkey=None):
+        self.dbfile = dbfile
+        self.address = address
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.authkey = get_authkey(authkey)
+        self.jobs = Queue.Queue()
+        self.stopped = threading.Event()
+        self.functions = dict()
+        # error message once the writer thread has failed
+        self.failed = None
+        self.lock = threading.Lock()
+
+    def open_db(self):
+        """
+        Open write connection, transactions are handled explicitly.
+        """
+        db = sqlite3.connect(self.dbfile,
+                             detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+                             timeout=36000)
+        db.row_factory = mysub.dict_factory
+        db.isolation_level = None
+
+        res = db.execute('PRAGMA journal_mode=WAL').fetchone()
+        db.execute('PRAGMA synchronous=NORMAL')
+        logger.info("Journal mode of {0}: {1}".format(self.dbfile, res['journal_mode']))
+        return db
+
+    def get_function(self, module, name):
+        """
+        Import job function, modules are imported once.
+        """
+        key = (module, name)
+        if key not in JOB_FUNCTIONS:
+            raise ValueError("job function not allowed")
+        if key not in self.functions:
+            self.functions[key] = getattr(importlib.import_module(module), name)
+        return self.functions[key]
+
+    def serve(self):
+        """
+        Accept clients until a client sends a stop request.
+        Remaining jobs are committed before returning.
+        """
+        if os.path.exists(self.address):
+            os.remove(self.address)
+
+        # socket is only accessible by its owner, also while binding
+        umask = os.umask(0o177)
+        try:
+            listener = Listener(self.address, family='AF_UNIX', authkey=self.authkey)
+        finally:
+            os.umask(umask)
+        os.chmod(self.address, stat.S_IRUSR | stat.S_IWUSR)
+        writer = threading.Thread(target=self._write_loop)
+        writer.start()
+        logger.info("Listening on {0}".format(self.address))
+
+        try:
+            while not self.stopped.is_set():
+                try:
+                    conn = listener.accept()
+                except (IOError, EOFError, AuthenticationError) as err:
+                    logger.info("FAILED: accept client: {0}".format(err))
+                    continue
+                receiver = threading.Thread(target=self._receive, args=(conn,))
+                receiver.daemon = True
+                receiver.start()
+        finally:
+            listener.close()
+            self.jobs.put(None)
+            writer.join()
+            if os.path.exists(self.address):
+                os.remove(self.address)
+
+    def stop(self):
+        """
+        Stop serving, wakes up the blocking accept with a dummy client.
+        """
+        self.stopped.set()
+        try:
+            Client(self.address, family='AF_UNIX', authkey=self.authkey).close()
+        except (IOError, EOFError, AuthenticationError):
+            pass
+
+    def _receive(self, conn):
+        """
+        Read messages of one client and queue them for the writer thread.
+        """
+        producer = Producer(conn)
+        while True:
+            try:
+                msg = conn.recv()
+            except (IOError, EOFError):
+                break
+            except Exception as err:
+                self._queue(producer, ('error', str(err)))
+                continue
+
+            if msg[0] == 'stop':
+                self.stop()
+                break
+            self._queue(producer, msg)
+
+    def _run_job(self, db, producer, module, name, args, kwargs):
+        """
+        Execute one job in a savepoint, a failing job is rolled back
+        without affecting other jobs of the same transaction.
+        """
+        db.execute('SAVEPOINT job')
+        try:
+            func = self.get_function(module, name)
+            func(db, *args, **kwargs)
+        except Exception as err:
+            db.execute('ROLLBACK TO job')
+            db.execute('RELEASE job')
+            message = "{0}.{1}: {2}".format(module, name, err)
+            producer.errors.append(message)
+            logger.info("FAILED: {0}".format(message))
+        else:
+            db.execute('RELEASE job')
+            producer.pending += 1
+
+    def _commit(self, db, producers):
+        """
+        Commit current transaction, i.e. all jobs of the given producers.
+        """
+        try:
+            db.execute('COMMIT')
+            for producer in producers:
+                producer.committed += producer.pending
+        except sqlite3.Error as err:
+            try:
+                db.execute('ROLLBACK')
+            except sqlite3.Error:
+                # transaction already rolled back by SQLite
+                pass
+            for producer in producers:
+                producer.errors.append("{0} jobs lost: {1}".
+                                       format(producer.pending, err))
+            logger.info("FAILED: commit: {0}".format(err))
+        for producer in producers:
+            producer.pending = 0
+
+    def _reply(self, producer):
+        """
+        Answer the sync request of a producer.
+        """
+        try:
+            producer.conn.send((producer.committed, producer.errors))
+        except (IOError, EOFError):
+            pass
+        producer.committed = 0
+        producer.errors = list()
+
+    def _write_loop(self):
+        """
+        Execute queued jobs and commit them in groups.
+        """
+        batch = set()
+        syncs = list()
+        njobs = 0
+        started = 0.
+        running = True
+
+        try:
+            db = self.open_db()
+        except Exception as err:
+            self._fail(syncs, err)
+            return
+
+        try:
+            while running:
+                timeout = None
+                if njobs > 0:
+                    timeout = max(self.flush_interval - (time.time() - started), 0.)
+
+                try:
+                    item = self.jobs.get(timeout=timeout)
+                except Queue.Empty:
+                    item = False
+
+                if item is None:
+                    running = False
+                elif item:
+                    (producer, msg) = item
+                    if msg[0] == 'job':
+                        if njobs == 0:
+                            db.execute('BEGIN IMMEDIATE')
+                            started = time.time()
+                        self._run_job(db, producer, *msg[1:])
+                        batch.add(producer)
+                        njobs += 1
+                    elif msg[0] == 'sync':
+                        syncs.append(producer)
+                    elif msg[0] == 'error':
+                        producer.errors.append(msg[1])
+
+                if njobs > 0 and (not item or syncs or njobs >= self.batch_size):
+                    self._commit(db, batch)
+                    logger.info("Committed {0} jobs".format(njobs))
+                    batch = set()
+                    njobs = 0
+
+                for producer in syncs:
+                    self._reply(producer)
+                syncs = list()
+        except Exception as err:
+            self._fail(syncs, err)
+        finally:
+            db.close()
+
+    def _queue(self, producer, msg):
+        """
+        Queue a message for the writer thread, or reject it if the
+        writer thread has failed.
+        """
+        with self.lock:
+            if self.failed is None:
+                self.jobs.put((producer, msg))
+            else:
+                self._reject(producer, msg)
+
+    def _reject(self, producer, msg):
+        """
+        Handle a message after a fatal error of the writer thread:
+        jobs are dropped and syncs are answered with the error.
+        """
+        if msg[0] == 'job':
+            producer.pending += 1
+        elif msg[0] == 'sync':
+            if producer.pending > 0:
+                producer.errors.append("{0} jobs lost: {1}".
+                                       format(producer.pending, self.failed))
+                producer.pending = 0
+            producer.errors.append(self.failed)
+            self._reply(producer)
+        elif msg[0] == 'error':
+            producer.errors.append(msg[1])
+
+    def _fail(self, syncs, err):
+        """
+        Fatal error of the writer thread, e.g. the database cannot be
+        opened: reject waiting and queued messages and stop serving,
+        i.e. clients never wait forever for a sync.
+        :param syncs: producers waiting for a sync
+        """
+        message = "writer stopped: {0}".format(err)
+        logger.info("FAILED: {0}".format(message))
+
+        with self.lock:
+            self.failed = message
+            for producer in syncs:
+                self._reject(producer, ('sync',))
+            while True:
+                try:
+                    item = self.jobs.get_nowait()
+                except Queue.Empty:
+                    break
+                if item is not None:
+                    self._reject(*item)
+
+        self.stop()
+
+
+class WriterClient(object):
+    """
+    Connection to a running L{SqliteWriter}. Jobs are sent without
+    waiting for the database, use L{sync} to wait for their commit.
+    """
+
+    def __init__(self, address, authkey=None):
+        """
+        :param authkey: shared secret, see L{get_authkey}
+        """
+        self.conn = Client(address, family='AF_UNIX', authkey=get_authkey(authkey))
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue a job: func(db, *args, **kwargs) is called by the writer.
+        :param func: module level function of JOB_FUNCTIONS, modules are
+                     imported by the writer
+        """
+        module = func.__module__
+        if module == '__main__':
+            # job function defined in the calling script
+            main = sys.modules['__main__'].__file__
+            module = os.path.splitext(os.path.basename(main))[0]
+        self.conn.send(('job', module, func.__name__, args, kwargs))
+
+    def sync(self):
+        """
+        Wait until all submitted jobs are committed.
+        :return: number of committed jobs, list of error messages
+        """
+        self.conn.send(('sync',))
+        return self.conn.recv()
+
+    def stop(self):
+        """
+        Ask the writer to commit all jobs and to shut down.
+        """
+        self.conn.send(('stop',))
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='''%s
+    owns the write connection of a SQLite database. Producers, e.g.
+    run_pystat_add2sqlite.py or run_pygac.py, send their records over
+    a Unix socket instead of locking the database. Records are committed
+    in batched transactions and the database is switched to WAL mode,
+    i.e. readers like the plotting tools keep working during ingestion.
+    ''' % os.path.basename(__file__))
+
+    parser.add_argument('-g', '--gsqlite',
+                        help='/path/to/database.sqlite3')
+
+    parser.add_argument('-sock', '--socket', required=True,
+                        help='Unix socket, e.g. /tmp/pystat_writer.sock')
+
+    parser.add_argument('-bs', '--batch_size', type=int, default=BATCH_SIZE,
+                        help='Commit after this number of jobs')
+
+    parser.add_argument('-fi', '--flush_interval', type=float, default=FLUSH_INTERVAL,
+                        help='Commit after this number of seconds')
+
+    parser.add_argument('-key', '--authkey',
+                        help='Shared secret of writer and clients, '
+                             'default: environment variable ' + AUTHKEY_ENV)
+
+    parser.add_argument('-stop', '--stop', action="store_true",
+                        help='Stop the writer listening on socket')
+
+    args = parser.parse_args()
+
+    try:
+        authkey = get_authkey(args.authkey)
+    except ValueError as err:
+        parser.error(str(err))
+
+    if args.stop:
+        client = WriterClient(args.socket, authkey)
+        client.stop()
+        client.close()
+        sys.exit(0)
+
+    if not args.gsqlite:
+        parser.error("-g is required to start a writer")
+
+    logger.info("{0} started for {1}".format(os.path.basename(__file__), args.gsqlite))
+
+    # commit remaining jobs on kill
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    server = SqliteWriter(args.gsqlite, args.socket,
+                          batch_size=args.batch_size,
+                          flush_interval=args.flush_interval,
+                          authkey=authkey)
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        pass
+
+    logger.info("{0} finished!".format(os.path.basename(__file__)))
@@ -8,6 +8,8 @@ import fnmatch
 import datetime
 import string
 import time
+import struct
+import sqlite3
 import numpy as np
 import logging
 import calendar
@@ -18,6 +20,10 @@ from datetime import timedelta
 logger = logging.getLogger('root')
 
 
+# header of zonal statistics blobs: dtype string, number of values
+BLOB_HEADER = struct.Struct('<4sI')
+
+
 class ColumnError(Exception):
     pass
 
@@ -321,6 +327,82 @@ def post_blacklist_reasons():
             'post7':'temporary_scan_motor_issue'}
 
 
+def get_blacklist_counts(db):
+    """
+    read_avhrrgac_sql.py, plot_blacklisting_hist.py:
+    count orbits of vw_std per blacklist reason and satellite
+    with one grouped query. Additionally, the summary categories
+    'all_l1b', 'all_blacklisted', 'all_l1b_white', 'all_l1c_white',
+    'all_l1c_missing', 'pygac_failed' and 'redundant' (redundant
+    orbits blacklisted due to a L1b file) are derived.
+    :return: dict [reason][satellite_name] = number of orbits
+    """
+    cmd = "SELECT satellite_name, blacklist_reason, blacklist, redundant, " \
+          "filename IS NOT NULL AS l1b, start_time_l1c IS NOT NULL AS l1c, " \
+          "COUNT(*) AS cnt FROM vw_std GROUP BY satellite_name, " \
+          "blacklist_reason, blacklist, redundant, l1b, l1c"
+    res = db.execute(cmd)
+
+    # post-processing reasons of orbits, where pygac provided no L1c
+    failed = [reason for reason in post_blacklist_reasons().values()
+              if 'wrong' not in reason and 'indexerror' not in reason
+              and 'along_track' not in reason]
+
+    reasons = dict()
+    summary = dict()
+
+    def add(cdict, key, sat, cnt):
+        cdict.setdefault(key, dict())
+        cdict[key][sat] = cdict[key].get(sat, 0) + cnt
+
+    for r in res:
+        sat = r['satellite_name']
+        reason = r['blacklist_reason']
+        cnt = r['cnt']
+        white = r['blacklist'] == 0
+        black = r['blacklist'] == 1
+
+        if reason is not None:
+            add(reasons, reason, sat, cnt)
+        if r['l1b']:
+            add(summary, 'all_l1b', sat, cnt)
+            if black:
+                add(summary, 'all_blacklisted', sat, cnt)
+            if white:
+                add(summary, 'all_l1b_white', sat, cnt)
+        if white:
+            if r['l1c']:
+                add(summary, 'all_l1c_white', sat, cnt)
+            else:
+                add(summary, 'all_l1c_missing', sat, cnt)
+        if not r['l1c'] and (white or reason in failed):
+            add(summary, 'pygac_failed', sat, cnt)
+        if r['redundant'] == 1 and black and reason is not None \
+                and reason[0:3].upper() == 'NSS':
+            add(summary, 'redundant', sat, cnt)
+
+    # 'redundant' is counted differently than other reasons
+    reasons.pop('redundant', None)
+    for key in ('all_l1b', 'all_blacklisted', 'all_l1b_white', 'all_l1c_white',
+                'all_l1c_missing', 'pygac_failed', 'redundant'):
+        reasons[key] = summary.get(key, dict())
+
+    return reasons
+
+
+def count_blacklisted(counts, reason, satellite=None):
+    """
+    read_avhrrgac_sql.py, plot_blacklisting_hist.py:
+    number of orbits of get_blacklist_counts for a reason,
+    either for one satellite or for all satellites.
+    """
+    if reason not in counts:
+        return 0
+    if satellite:
+        return counts[reason].get(satellite, 0)
+    return sum(counts[reason].values())
+
+
 def split_filename(fil):
     # dirname  = os.path.dirname(fil)
     basename = os.path.basename(fil)
@@ -538,6 +620,87 @@ def alter_statistics_table(db, belts):
             db.execute(act)
 
 
+def create_statistics_blob_table(db):
+    """
+    run_pystat_add2sqlite.py: create statistics table keeping the zonal
+    statistics as blobs (see L{array_to_blob}) next to the global ones.
+    The zone size is part of the primary key, i.e. statistics of
+    several zone sizes can be stored in the same table.
+    """
+    act = "CREATE TABLE IF NOT EXISTS statistics_blob ( " \
+          "satelliteID INTEGER, date DATE, " \
+          "channelID INTEGER, selectID INTEGER, binsize FLOAT, " \
+          "OrbitCount INTEGER, GlobalMean FLOAT, " \
+          "GlobalStdv FLOAT, GlobalNobs INTEGER, " \
+          "ZonalMean BLOB, ZonalStdv BLOB, ZonalNobs BLOB, " \
+          "FOREIGN KEY (satelliteID) REFERENCES satellites (id), " \
+          "FOREIGN KEY (channelID) REFERENCES channels (id), " \
+          "FOREIGN KEY (selectID) REFERENCES selects (id), " \
+          "PRIMARY KEY (satelliteID, date, channelID, selectID, binsize) )"
+    db.execute(act)
+
+
+def create_base_moments_table(db):
+    """
+    run_pystat_add2sqlite.py: create table of additive zonal moments
+    (count, sum and sum of squares) on a fine base grid, from which
+    the statistics of coarser zones or latitude bands are derived,
+    see L{merge_base_zones} and L{merge_base_band}.
+    """
+    act = "CREATE TABLE IF NOT EXISTS base_moments ( " \
+          "satelliteID INTEGER, date DATE, " \
+          "channelID INTEGER, selectID INTEGER, binsize FLOAT, " \
+          "OrbitCount INTEGER, " \
+          "ZonalNobs BLOB, ZonalSum BLOB, ZonalSumSq BLOB, " \
+          "FOREIGN KEY (satelliteID) REFERENCES satellites (id), " \
+          "FOREIGN KEY (channelID) REFERENCES channels (id), " \
+          "FOREIGN KEY (selectID) REFERENCES selects (id), " \
+          "PRIMARY KEY (satelliteID, date, channelID, selectID, binsize) )"
+    db.execute(act)
+
+
+def array_to_blob(arr, dtype):
+    """
+    Encode a 1-d array as blob: header (dtype string, number of values)
+    followed by the raw values.
+    :param dtype: e.g. '<f4' (zonal mean/stdv) or '<i4' (zonal nobs)
+    """
+    arr = np.ascontiguousarray(arr, dtype=dtype).ravel()
+    header = BLOB_HEADER.pack(arr.dtype.str.encode('ascii'), arr.size)
+    return sqlite3.Binary(header + arr.tobytes())
+
+
+def blob_header(blob):
+    """
+    :return: dtype and number of values of a blob
+    """
+    (dtype, size) = BLOB_HEADER.unpack_from(blob)
+    return np.dtype(str(dtype.rstrip(b'\0').decode('ascii'))), size
+
+
+def blob_to_array(blob):
+    """
+    Decode a blob of L{array_to_blob} without copying, i.e.
+    the returned array is read-only.
+    """
+    (dtype, size) = blob_header(blob)
+    return np.frombuffer(blob, dtype=dtype, count=size, offset=BLOB_HEADER.size)
+
+
+def blobs_to_array(blobs):
+    """
+    Decode blobs of the same dtype and length into one read-only
+    array of shape (len(blobs), length) with a single np.frombuffer.
+    """
+    headers = set(BLOB_HEADER.unpack_from(blob) for blob in blobs)
+    if len(headers) != 1:
+        raise ValueError("blobs differ in dtype or length: {0}".format(sorted(headers)))
+
+    (dtype, size) = blob_header(blobs[0])
+    data = b''.join(blob[BLOB_HEADER.size:] for blob in blobs)
+    return np.frombuffer(data, dtype=dtype).reshape(len(blobs), size)
+
+
 def create_id_name_table(db, table, lst):
     """
     run_pystat_add2sqlite.py: create new table.
@@ -560,55 +723,264 @@ def create_id_name_table(db, table, lst):
             db.execute(act)
 
 
-def cal_zonal_means(lat, tar, zone_size):
+class Moments(object):
     """
-    Calculation of daily zonal means.
-    Called in run_pystat_add2sqlite.py
-    S. Finkensieper, July 2014
+    Mergeable accumulator of count, mean and M2 (sum of squared
+    deviations from the mean) for pooled statistics (Chan et al.).
+    All attributes are numpy arrays, i.e. a scalar accumulator holds
+    0-d arrays (global statistics), a zonal one holds one element per
+    latitudinal zone. Merging two accumulators gives the exact
+    statistics of the union of their observations.
+    """
+
+    def __init__(self, nobs=0, mean=0., m2=0.):
+        self.nobs = np.array(nobs, dtype=np.int64)
+        self.mean = np.array(mean, dtype=np.float64)
+        self.m2 = np.array(m2, dtype=np.float64)
+
+    @classmethod
+    def zeros(cls, shape=()):
+        return cls(np.zeros(shape), np.zeros(shape), np.zeros(shape))
+
+    @classmethod
+    def from_data(cls, tar):
+        """
+        Moments of all valid elements of a masked array.
+        """
+        values = np.ma.compressed(tar).astype(np.float64)
+        if values.size == 0:
+            return cls()
+        mean = values.mean()
+        return cls(values.size, mean, np.square(values - mean).sum())
+
+    @classmethod
+    def from_sums(cls, nobs, sums, sumsq):
+        """
+        Moments from count, sum and sum of squares, e.g.
+        the output of L{cal_zonal_moments}.
+        """
+        nobs = np.asarray(nobs)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = np.where(nobs > 0, sums / nobs, 0.)
+        m2 = sumsq - sums * mean
+        # rounding may produce tiny negative M2
+        m2 = np.where(m2 < 0., 0., m2)
+        return cls(nobs, mean, m2)
+
+    @classmethod
+    def from_stats(cls, mean, stdv, nobs, fill_value=None):
+        """
+        Moments from stored mean, (population) standard deviation
+        and number of observations, e.g. daily pystat records.
+        Elements with nobs <= 0 or fill_value are treated as empty.
+        """
+        mean = np.asarray(mean, dtype=np.float64)
+        stdv = np.asarray(stdv, dtype=np.float64)
+        nobs = np.asarray(nobs, dtype=np.float64)
+        empty = ~(nobs > 0) | ~np.isfinite(mean) | ~np.isfinite(stdv)
+        if fill_value is not None:
+            empty |= (mean == fill_value) | (stdv == fill_value)
+        nobs = np.where(empty, 0, nobs)
+        return cls(nobs, np.where(empty, 0., mean),
+                   np.where(empty, 0., stdv * stdv * nobs))
+
+    def merge(self, other):
+        """
+        Merge other moments into this accumulator (in place).
+        :return: self
+        """
+        nobs = self.nobs + other.nobs
+        delta = other.mean - self.mean
+        with np.errstate(divide='ignore', invalid='ignore'):
+            frac = np.where(nobs > 0, other.nobs / nobs.astype(np.float64), 0.)
+        self.m2 = self.m2 + other.m2 + delta * delta * self.nobs * frac
+        self.mean = self.mean + delta * frac
+        self.nobs = nobs
+        return self
+
+    def get_mean(self):
+        """
+        Mean, masked where there are no observations.
+        """
+        return np.ma.masked_where(self.nobs == 0, self.mean)
+
+    def get_stdv(self):
+        """
+        Pooled (population) standard deviation, masked where
+        there are no observations.
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            var = np.where(self.nobs > 0, self.m2 / self.nobs, 0.)
+        return np.ma.masked_where(self.nobs == 0, np.sqrt(var))
+
+    def get_sums(self):
+        """
+        Additive moments: count, sum and sum of squares.
+        """
+        sums = self.mean * self.nobs
+        return self.nobs, sums, self.m2 + self.mean * sums
+
+
+def get_zone_centers(zone_size):
+    """
+    Centers of the latitudinal zones for a given zone size.
     """
-    # define latitudinal zone size :
     zone_rad = zone_size / 2.0
+    return np.arange(-90 + zone_rad, 90 + zone_rad, zone_size)
+
 
-    # determine zone centers:
-    zone_centers = np.arange(-90 + zone_rad, 90 + zone_rad, zone_size)
+def get_zone_index(lat, zone_size):
+    """
+    Latitudinal zone index of each pixel, computed once per orbit
+    and shared by all channels and time selections.
+    Zone edges are the same as in the former per-zone loop:
+    the left boundary is included for the first zone and excluded
+    for all remaining zones, the right boundary is always included.
+    Masked pixels and pixels outside of all zones get -1.
+    :param lat: masked latitude array
+    :param zone_size: latitudinal zone size in degrees
+    :return: zone index array (same shape as lat), number of zones
+    """
+    zone_rad = zone_size / 2.0
+    zone_centers = get_zone_centers(zone_size)
     nzones = len(zone_centers)
+    lower = zone_centers - zone_rad
+    upper = zone_centers + zone_rad
 
-    # initialize array holding zonal means and the number of observations:
-    zonal_means = np.ma.zeros(nzones)
-    zonal_stdev = np.ma.zeros(nzones)
-    nobs = np.ma.zeros(nzones)
+    lat_data = np.ma.getdata(lat)
+    lat_mask = np.ma.getmaskarray(lat)
 
-    # calculate zonal means:
-    for zone_center, izone in zip(zone_centers, range(nzones)):
+    # first zone with lat <= upper boundary
+    zone_index = np.searchsorted(upper, lat_data, side='left')
+    inside = zone_index < nzones
+    zone_index[~inside] = 0
 
-        # mask everything outside the current zone:
-        if izone == 0:
-            # include left boundary for the first interval
-            zonal_mask = np.ma.mask_or(lat < (zone_center - zone_rad),
-                                       lat > (zone_center + zone_rad))
-        else:
-            # exclude left boundary for all remaining intervals:
-            zonal_mask = np.ma.mask_or(lat <= (zone_center - zone_rad),
-                                       lat > (zone_center + zone_rad))
+    # check left boundary: included only for the first interval
+    left = lower[zone_index]
+    inside &= np.where(zone_index == 0, lat_data >= left, lat_data > left)
+    inside &= ~lat_mask
+
+    zone_index[~inside] = -1
+    return zone_index, nzones
+
+
+def get_base_factor(base_size, zone_size):
+    """
+    Number of base zones merged into one zone.
+    :raise ValueError: zone_size is not a multiple of base_size
+    """
+    factor = zone_size / float(base_size)
+    nfac = int(round(factor))
+    nbase = len(get_zone_centers(base_size))
+    if nfac < 1 or abs(factor - nfac) > 1e-6 or nbase % nfac != 0:
+        raise ValueError("zone size {0} is not a multiple of "
+                         "base zone size {1}".format(zone_size, base_size))
+    return nfac
+
+
+def merge_base_zones(nobs, sums, sumsq, base_size, zone_size):
+    """
+    Exact count, sum and sum of squares of zones of zone_size
+    merged from base zones of base_size (last axis).
+    Zone edges are the same as for zones computed from the orbits,
+    see L{get_zone_index}.
+    """
+    nfac = get_base_factor(base_size, zone_size)
+
+    def merge(arr):
+        arr = np.asarray(arr)
+        return arr.reshape(arr.shape[:-1] + (arr.shape[-1] // nfac, nfac)).sum(axis=-1)
 
-        # cut data:
-        zonal_data = np.ma.masked_where(zonal_mask, tar)
+    return merge(nobs), merge(sums), merge(sumsq)
 
-        # calculate mean:
-        zonal_mean = zonal_data.mean(dtype=np.float64)
 
-        # calculate standard deviation
-        zonal_stdv = zonal_data.std(dtype=np.float64)
+def get_band_slice(base_size, lat_min, lat_max):
+    """
+    Base zones of base_size covering the latitude band
+    lat_min to lat_max, i.e. band edges must be zone edges.
+    """
+    nbase = len(get_zone_centers(base_size))
+    first = (lat_min + 90.) / base_size
+    last = (lat_max + 90.) / base_size
+
+    if abs(first - round(first)) > 1e-6 or abs(last - round(last)) > 1e-6 or \
+            not 0 <= round(first) < round(last) <= nbase:
+        raise ValueError("latitude band {0} to {1} does not match the "
+                         "base zones of {2}".format(lat_min, lat_max, base_size))
+
+    return slice(int(round(first)), int(round(last)))
+
+
+def merge_base_band(nobs, sums, sumsq, base_size, lat_min, lat_max):
+    """
+    Exact count, sum and sum of squares of a latitude band
+    merged from base zones of base_size (last axis).
+    """
+    band = get_band_slice(base_size, lat_min, lat_max)
+    return (np.asarray(nobs)[..., band].sum(axis=-1),
+            np.asarray(sums)[..., band].sum(axis=-1),
+            np.asarray(sumsq)[..., band].sum(axis=-1))
+
+
+def cal_zonal_moments(zone_index, nzones, targets):
+    """
+    Binned reduction of several targets over latitudinal zones.
+    Count, sum and sum of squares of each zone are computed with
+    one np.bincount pass per target over the shared zone index.
+    :param zone_index: zone index array, see L{get_zone_index}
+    :param nzones: number of zones
+    :param targets: list of masked arrays (e.g. channels) on the same grid
+    :return: nobs, sums, sumsq; arrays of shape (len(targets), nzones)
+    """
+    ntargets = len(targets)
+    nobs = np.zeros((ntargets, nzones), dtype=np.int64)
+    sums = np.zeros((ntargets, nzones), dtype=np.float64)
+    sumsq = np.zeros((ntargets, nzones), dtype=np.float64)
 
-        # get number of observations used to calculate this mean:
-        n = np.ma.count(zonal_data)
+    in_zone = zone_index >= 0
+
+    for itar, tar in enumerate(targets):
+        valid = in_zone & ~np.ma.getmaskarray(tar)
+        zones = zone_index[valid]
+        data = np.ma.getdata(tar)[valid].astype(np.float64)
+        nobs[itar] = np.bincount(zones, minlength=nzones)
+        sums[itar] = np.bincount(zones, weights=data, minlength=nzones)
+        sumsq[itar] = np.bincount(zones, weights=data * data,
+                                  minlength=nzones)
+
+    return nobs, sums, sumsq
+
+
+def moments_to_mean_stdv(nobs, sums, sumsq):
+    """
+    Mean and (population) standard deviation from count, sum and
+    sum of squares. Elements without observations are masked.
+    """
+    empty = nobs == 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = sums / nobs
+        var = sumsq / nobs - mean * mean
+    # rounding may produce tiny negative variances
+    var = np.where(var < 0., 0., var)
+    mean = np.ma.masked_where(empty, mean)
+    stdv = np.ma.masked_where(empty, np.sqrt(var))
+    return mean, stdv
+
+
+def cal_zonal_means(lat, tar, zone_size, zones=None):
+    """
+    Calculation of daily zonal means.
+    Called in run_pystat_add2sqlite.py
+    S. Finkensieper, July 2014
+    :param zones: optional (zone_index, nzones) of L{get_zone_index}
+    """
+    if zones is None:
+        zones = get_zone_index(lat, zone_size)
 
-        # save results:
-        zonal_means[izone] = zonal_mean
-        zonal_stdev[izone] = zonal_stdv
-        nobs[izone] = n
+    (nobs, sums, sumsq) = cal_zonal_moments(zones[0], zones[1], [tar])
+    (zonal_means, zonal_stdev) = moments_to_mean_stdv(nobs[0], sums[0], sumsq[0])
 
-    return zonal_means, zonal_stdev, nobs
+    return zonal_means, zonal_stdev, np.ma.array(nobs[0], dtype=np.float64)
 
 
 def set_fillvalue(fill_value, zonal_mean, zonal_stdv, zonal_nobs,
@@ -19,12 +19,11 @@ logger = logging.getLogger('root')
 warnings.filterwarnings("ignore")
 
 
-def slice_data(longitude, latitude, target, xdim, ydim, filecount, 
-               halforbit, sline, eline, region, overlap_off=None): 
-
-    start_x = 0
-    end_x = xdim
-
+def get_row_window(ydim, filecount, halforbit, sline, eline, 
+                   region, overlap_off=None): 
+    """
+    Scanlines [start_y, end_y) of an orbit which are plotted.
+    """
     # without overlap correction
     if overlap_off:
         start_y = 0
@@ -50,14 +49,9 @@ def slice_data(longitude, latitude, target, xdim, ydim, filecount,
                 end_y = halforbit
 
     #logger.info("FileCount = {0}".format(filecount))
-    #logger.info("Slice data along x-axis {0}:{1}".format(start_x, end_x))
     #logger.info("Slice data along y-axis {0}:{1}".format(start_y, end_y))
 
-    lon = longitude[start_y:end_y, start_x:end_x]
-    lat = latitude[start_y:end_y, start_x:end_x]
-    tar = target[start_y:end_y, start_x:end_x]
-
-    return lon, lat, tar
+    return start_y, end_y
 
 
 def isEven(number): 
@@ -303,36 +297,54 @@ def map_avhrrgac_l1c(flist, args):
         # halforbit if overlap option
         cut = int(el / 2.)
 
+        # scanlines to be plotted, computed before reading,
+        # so that only this hyperslab is read from disk
+        start_y, end_y = get_row_window(ydim, cnt, cut, sl, el, 
+                                        args.region, args.overlap_off)
+
+        # box filters (std, TSM) need a margin of box radius scanlines,
+        # which is cut off after filtering
+        box_size = 3
+        if args.standard_deviation or args.scan_motor_correction:
+            margin = (box_size - 1) / 2
+        else:
+            margin = 0
+        read_start = max(start_y - margin, 0)
+        read_end = min(end_y + margin, ydim)
+
         # read file
         afil = fil.replace("ECC_GAC_avhrr_", "ECC_GAC_sunsatangles_")
         f = h5py.File(fil, "r+")
         a = h5py.File(afil, "r+")
+        # float32 is precise enough for plotting and halves memory
+        orbit = rh5.AvhrrGacOrbit(f, a, args.scan_motor_correction,
+                                  rows=slice(read_start, read_end),
+                                  dtype='f4')
         if diff_plot: 
             if args.delta_ch1_ch2: 
                 #ctable = 'hot_r', 'gist_rainbow'
                 ctable = 'Paired'
-                (la, lo, ch1) = rh5.read_avhrrgac(f, a, args.time, 'ch1', args.scan_motor_correction)
-                (la, lo, ch2) = rh5.read_avhrrgac(f, a, args.time, 'ch2', args.scan_motor_correction)
+                (la, lo, ch1) = orbit.get('ch1', args.time)
+                (la, lo, ch2) = orbit.get('ch2', args.time)
                 # absolute difference because ch1 is very similar to ch2
                 ta = abs(ch1 - ch2)
                 tarmin = 0.0 
                 tarmax = 0.5
             elif args.delta_ch4_ch5:
                 ctable = 'bwr'
-                (la, lo, ch4) = rh5.read_avhrrgac(f, a, args.time, 'ch4', args.scan_motor_correction)
-                (la, lo, ch5) = rh5.read_avhrrgac(f, a, args.time, 'ch5', args.scan_motor_correction)
+                (la, lo, ch4) = orbit.get('ch4', args.time)
+                (la, lo, ch5) = orbit.get('ch5', args.time)
                 # relative difference because ch4 and ch5 differ
                 ta = 100.0*(ch4 - ch5)/ch5
                 tarmin = -20.0
                 tarmax = 20.0
         else: 
             ctable = 'jet'
-            (la, lo, ta) = rh5.read_avhrrgac(f, a, args.time, args.channel, args.scan_motor_correction)
+            (la, lo, ta) = orbit.get(args.channel, args.time)
         a.close()
         f.close()
 
         if args.standard_deviation: 
-            box_size = 3
             fill_value = -9999.0
             #std = rh5.get_stddev(ta, box_size) # OLD
             std = rh5.gridbox_std(ta, box_size, fill_value)
@@ -349,10 +361,9 @@ def map_avhrrgac_l1c(flist, args):
                 #tarmax = 0.5
                 #tarmax = 1.0 # d12: absolute difference
 
-        # slice data
-        lon, lat, tar = slice_data(lo, la, ta, xdim, ydim, 
-                                   cnt, cut, sl, el, 
-                                   args.region, args.overlap_off) 
+        # cut off margin
+        cut_y = slice(start_y - read_start, end_y - read_start)
+        lon, lat, tar = lo[cut_y, 0:xdim], la[cut_y, 0:xdim], ta[cut_y, 0:xdim]
 
 
         if args.verbose:
@@ -4,6 +4,7 @@
 
 import os
 import numpy as np
+import h5py
 import datetime
 import math
 import matplotlib.pyplot as plt
@@ -62,100 +63,539 @@ def read_zonal_stats(sat, cha, sel, dt, sql):
     Read sqlite database (sql):
     return daily zonal statistics for a given satellite (sat),
     channel (cha), time selection (sel) and date (dt).
+    Use L{ZonalStatsReader} for more than one day.
     """
+    (dates, mean, stdv, nobs, lats) = ZonalStatsReader(sql).read_range(sat, cha, sel, dt, dt)
 
-    mean_list = list()
-    stdv_list = list()
-    nobs_list = list()
+    if len(dates) == 0:
+        return list(), list(), list(), lats.tolist()
+
+    return mean[0].tolist(), stdv[0].tolist(), nobs[0].tolist(), lats.tolist()
+
+
+def get_mean_range(cha):
+    """
+    Range of valid global means of a channel.
+    """
+    # reflectance
+    if cha == "ch1" or cha == "ch2" or cha == "ch3a":
+        return 0., 1.5
+    # brightness temperature
+    return 140., 350.
+
+
+def get_id_filter(sat, cha, sel, alias=None):
+    """
+    WHERE clause selecting satellite, channel and time selection
+    by name, i.e. IDs are resolved within the statistics query.
+    """
+    prefix = alias + '.' if alias else ''
+    return "{0}satelliteID=(SELECT id FROM satellites WHERE name=\'{1}\') AND " \
+           "{0}channelID=(SELECT id FROM channels WHERE name=\'{2}\') AND " \
+           "{0}selectID=(SELECT id FROM selects WHERE name=\'{3}\')".format(prefix, sat,
+                                                                            cha, sel)
+
+
+class ZonalStatsReader(object):
+    """
+    Reader of the zonal pystat statistics. The IDs of satellites,
+    channels and selects and the latitudinal belts are read once,
+    i.e. one reader should be used for the life of the connection.
+    A date range is read with one query into arrays of shape
+    (dates, zones), which can be sliced for daily zonal plots or
+    Hovmoeller diagrams.
+    Both layouts of run_pystat_add2sqlite.py are read: statistics
+    (one column per belt) and statistics_blob, which is used if a
+    binsize is given or if the database has no wide table.
+    Additive moments of fine base zones (base_moments) are merged into
+    any coarser zones or latitude bands, see L{read_merged_range}
+    and L{read_band_range}.
+    """
 
     zonal_list = ("ZonalMean", "ZonalStdv", "ZonalNobs")
 
-    sat_id = get_id("satellites", "id", sat, sql)
-    cha_id = get_id("channels", "id", cha, sql)
-    sel_id = get_id("selects", "id", sel, sql)
+    def __init__(self, sql, binsize=None):
+        self.sql = sql
+        self._ids = dict()
+        self._belts = None
+        self._binsize = binsize
+        self._layout = None
+
+    def get_id(self, table, name):
+        """
+        ID of name in an id/name table, None if name is unknown.
+        """
+        if table not in self._ids:
+            self._ids[table] = dict((item['name'], item['id']) for item in
+                                    self.sql.execute("SELECT id, name FROM {0}".format(table)))
+        return self._ids[table].get(name)
+
+    @property
+    def layout(self):
+        """
+        'wide' or 'blob'
+        """
+        if self._layout is None:
+            if self._binsize is None and subs.check_if_table_exists(self.sql, 'statistics') != 0:
+                self._layout = 'wide'
+            else:
+                self._layout = 'blob'
+        return self._layout
+
+    @property
+    def binsize(self):
+        """
+        Zone size of the blob layout, if not given the only
+        zone size stored in statistics_blob.
+        """
+        if self._binsize is None:
+            sizes = [item['binsize'] for item in
+                     self.sql.execute("SELECT DISTINCT binsize FROM statistics_blob")]
+            if len(sizes) != 1:
+                raise ValueError("binsize required, statistics_blob "
+                                 "holds binsizes {0}".format(sizes))
+            self._binsize = sizes[0]
+        return self._binsize
+
+    @property
+    def belts(self):
+        """
+        IDs and latitudes of the latitudinal belts.
+        """
+        if self._belts is None:
+            if self.layout == 'blob':
+                lats = subs.get_zone_centers(self.binsize)
+                self._belts = (range(len(lats)), lats.tolist())
+            else:
+                self._belts = get_lat_belts("latitudes", self.sql)
+        return self._belts
+
+    def read_range(self, sat, cha, sel, sd, ed):
+        """
+        Daily zonal statistics for a given satellite (sat), channel (cha)
+        and time selection (sel) between start_date (sd) and end_date (ed).
+        Blobs are decoded with one np.frombuffer per statistic, i.e. the
+        arrays are read-only and keep the stored dtypes (float32/int32).
+        :return: array of dates, mean, stdv and nobs arrays of shape
+                 (dates, zones) and array of latitudinal belts
+        """
+        (lat_id, lats) = self.belts
+        nzones = len(lat_id)
+
+        if self.layout == 'blob':
+            table = "statistics_blob"
+            full_list = list(self.zonal_list)
+            where = " AND binsize={0}".format(self.binsize)
+        else:
+            table = "statistics"
+            full_list = [zon + str(idx) for zon in self.zonal_list for idx in lat_id]
+            where = ""
+
+        (dates, rows) = self._read_rows(table, full_list, sat, cha, sel, sd, ed, where)
+
+        if self.layout == 'wide':
+            data = np.array([[item[i] for i in full_list] for item in rows],
+                            dtype=float).reshape(len(rows), 3, nzones)
+            cubes = [data[:, pos, :] for pos in range(3)]
+        elif rows:
+            cubes = [subs.blobs_to_array([item[zon] for item in rows])
+                     for zon in self.zonal_list]
+        else:
+            cubes = [np.zeros((0, nzones)) for zon in self.zonal_list]
+
+        return dates, cubes[0], cubes[1], cubes[2], np.array(lats)
+
+    def _read_rows(self, table, columns, sat, cha, sel, sd, ed, where=""):
+        """
+        Records of a satellite, channel and time selection between
+        start_date (sd) and end_date (ed) ordered by date.
+        :return: array of dates, list of records
+        """
+        ids = (self.get_id("satellites", sat),
+               self.get_id("channels", cha),
+               self.get_id("selects", sel))
+
+        rows = list()
+        if None not in ids:
+            sql_query = "SELECT date, {0} FROM {1} WHERE " \
+                        "satelliteID={2} AND channelID={3} AND selectID={4} AND " \
+                        "date>=\'{5}\' AND date<=\'{6}\'{7} " \
+                        "ORDER BY date".format(', '.join(columns), table, ids[0],
+                                               ids[1], ids[2], sd, ed, where)
+            rows = self.sql.execute(sql_query).fetchall()
+
+        dates = list()
+        for item in rows:
+            dt = item['date']
+            if not isinstance(dt, datetime.date):
+                dt = datetime.datetime.strptime(str(dt)[:10], '%Y-%m-%d').date()
+            dates.append(dt)
+
+        return np.array(dates, dtype=object), rows
+
+    def get_base_size(self, base_size=None):
+        """
+        Base zone size, if not given the only one stored in base_moments.
+        """
+        if base_size is None:
+            sizes = [item['binsize'] for item in
+                     self.sql.execute("SELECT DISTINCT binsize FROM base_moments")]
+            if len(sizes) != 1:
+                raise ValueError("base_size required, base_moments "
+                                 "holds binsizes {0}".format(sizes))
+            base_size = sizes[0]
+        return base_size
+
+    def read_base_range(self, sat, cha, sel, sd, ed, base_size=None):
+        """
+        Daily count, sum and sum of squares of the base zones
+        (run_pystat_add2sqlite.py -bb) between start_date (sd)
+        and end_date (ed).
+        :return: array of dates, nobs, sums and sumsq arrays of shape
+                 (dates, base zones), base zone size
+        """
+        base_size = self.get_base_size(base_size)
+        nbase = len(subs.get_zone_centers(base_size))
+        columns = ["ZonalNobs", "ZonalSum", "ZonalSumSq"]
+
+        (dates, rows) = self._read_rows("base_moments", columns, sat, cha, sel, sd, ed,
+                                        " AND binsize={0}".format(base_size))
+
+        if rows:
+            cubes = [subs.blobs_to_array([item[col] for item in rows]) for col in columns]
+        else:
+            cubes = [np.zeros((0, nbase)) for col in columns]
+
+        return dates, cubes[0], cubes[1], cubes[2], base_size
+
+    def read_merged_range(self, sat, cha, sel, sd, ed, binsize, base_size=None):
+        """
+        Exact daily zonal statistics for any zone size (binsize) being
+        a multiple of the base zone size, merged from base zones.
+        :return: array of dates, mean and stdv (masked where empty) and
+                 nobs arrays of shape (dates, zones), array of latitudinal belts
+        """
+        (dates, nobs, sums, sumsq, base_size) = self.read_base_range(sat, cha, sel, sd, ed,
+                                                                     base_size)
+        (nobs, sums, sumsq) = subs.merge_base_zones(nobs, sums, sumsq, base_size, binsize)
+        (mean, stdv) = subs.moments_to_mean_stdv(nobs, sums, sumsq)
+
+        return dates, mean, stdv, nobs, subs.get_zone_centers(binsize)
+
+    def read_band_range(self, sat, cha, sel, sd, ed, lat_min, lat_max, base_size=None):
+        """
+        Exact daily statistics of the latitude band lat_min to lat_max,
+        band edges must be edges of the base zones.
+        :return: array of dates, arrays of mean and stdv (masked where
+                 empty) and nobs
+        """
+        (dates, nobs, sums, sumsq, base_size) = self.read_base_range(sat, cha, sel, sd, ed,
+                                                                     base_size)
+        (nobs, sums, sumsq) = subs.merge_base_band(nobs, sums, sumsq, base_size,
+                                                   lat_min, lat_max)
+        (mean, stdv) = subs.moments_to_mean_stdv(nobs, sums, sumsq)
+
+        return dates, mean, stdv, nobs
+
+
+def get_global_table(sql):
+    """
+    Table holding the daily global statistics: statistics or, if the
+    database only has the blob layout, the records of one binsize of
+    statistics_blob (global statistics do not depend on the binsize).
+    """
+    if subs.check_if_table_exists(sql, 'statistics') != 0:
+        return "statistics"
+    return "(SELECT * FROM statistics_blob WHERE " \
+           "binsize=(SELECT MIN(binsize) FROM statistics_blob))"
+
+
+def map_dataset(dataset):
+    """
+    Memory-map a HDF5 dataset stored contiguously without filters
+    (e.g. after h5repack -f NONE -l CONTI), otherwise return the
+    dataset itself, which reads only the chunks of a slice.
+    """
+    offset = dataset.id.get_offset()
+    if dataset.chunks is None and offset is not None and dataset.dtype.kind != 'O':
+        return np.memmap(dataset.file.filename, mode='r', dtype=dataset.dtype,
+                         shape=dataset.shape, offset=offset)
+    return dataset
+
+
+def load_columns(filename, table):
+    """
+    Columns of a quick analysis table (procs or stats) written by
+    export_columnar.py, see L{ColumnTable}.
+    """
+    return ColumnTable(filename, table)
+
+
+class ColumnTable(object):
+    """
+    Columns of a quick analysis table written by export_columnar.py,
+    e.g. table['satellite'], see L{map_dataset}. Times are microseconds
+    since 1970-01-01, e.g.
+    np.asarray(table['start_time_l1c']).astype('datetime64[us]').
+    The file stays open until L{close}, use it as context manager.
+    """
+
+    def __init__(self, filename, table):
+        self.h5 = h5py.File(filename, 'r')
+        self.columns = dict((name, map_dataset(dataset)) for (name, dataset) in
+                            self.h5['quick'][table].items())
 
-    (lat_id, lats) = get_lat_belts("latitudes", sql)
+    def __getitem__(self, name):
+        return self.columns[name]
 
-    mean_str = list()
-    stdv_str = list()
-    nobs_str = list()
+    def keys(self):
+        return self.columns.keys()
 
-    for idx in lat_id:
-        mean_str.append(zonal_list[0] + str(idx))
-        stdv_str.append(zonal_list[1] + str(idx))
-        nobs_str.append(zonal_list[2] + str(idx))
+    def close(self):
+        self.columns = dict()
+        self.h5.close()
 
-    full_list = mean_str + stdv_str + nobs_str
-    get_cols = ', '.join(full_list)
-    sql_query = "SELECT {0} FROM statistics WHERE " \
-                "satelliteID={1} AND channelID={2} AND " \
-                "selectID={3} AND date=\'{4}\'".format(get_cols, sat_id,
-                                                       cha_id, sel_id, dt)
-    results = sql.execute(sql_query)
+    def __enter__(self):
+        return self
 
-    for item in results:
-        for i in full_list:
-            if i.startswith(zonal_list[0]):
-                mean_list.append(item[i])
-            if i.startswith(zonal_list[1]):
-                stdv_list.append(item[i])
-            if i.startswith(zonal_list[2]):
-                nobs_list.append(item[i])
+    def __exit__(self, *args):
+        self.close()
 
-    return mean_list, stdv_list, nobs_list, lats
 
+class StatisticsCube(object):
+    """
+    Reader of the pystat cubes written by export_columnar.py, i.e.
+    arrays of shape (satellites, channels, selects, dates[, zones]).
+    It provides read_range of L{ZonalStatsReader} and is accepted as
+    sql by L{read_global_series} and L{read_global_difference}, i.e.
+    the plotting functions work on the cubes instead of SQLite.
+    Only the requested slices are read, see L{map_dataset}.
+    """
 
-def read_global_newstats(sat, cha, sel, sd, ed, sql):
+    def __init__(self, filename):
+        self.h5 = h5py.File(filename, 'r')
+        self.grp = self.h5['pystat']
+        self.first_date = int(self.grp.attrs['first_date'])
+        self.lats = self.grp['lats'][:].astype(float)
+        self._index = dict((axis, dict((name.decode('ascii'), pos) for pos, name in
+                                       enumerate(self.grp[axis][:])))
+                           for axis in ('satellites', 'channels', 'selects'))
+        self._cubes = dict()
+
+    def close(self):
+        self._cubes = dict()
+        self.h5.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get_cube(self, name):
+        if name not in self._cubes:
+            self._cubes[name] = map_dataset(self.grp[name])
+        return self._cubes[name]
+
+    def _read(self, names, sat, cha, sel, sd, ed):
+        """
+        Cube slices of a satellite, channel and time selection between
+        start_date (sd) and end_date (ed), days without record included.
+        :return: array of dates, record flags, list of arrays
+        """
+        idx = (self._index['satellites'].get(sat),
+               self._index['channels'].get(cha),
+               self._index['selects'].get(sel))
+        d0 = max(sd.toordinal() - self.first_date, 0)
+        d1 = min(ed.toordinal() - self.first_date + 1, self.get_cube('dates').shape[0])
+
+        if None in idx or d1 <= d0:
+            return (np.array([], dtype=object), np.zeros(0, dtype=bool),
+                    [np.zeros((0,) + self.get_cube(name).shape[4:]) for name in names])
+
+        (i, j, k) = idx
+        dates = np.array([datetime.date.fromordinal(self.first_date + day)
+                          for day in range(d0, d1)], dtype=object)
+        record = np.asarray(self.get_cube('record')[i, j, k, d0:d1]) > 0
+        return dates, record, [np.asarray(self.get_cube(name)[i, j, k, d0:d1])
+                               for name in names]
+
+    def read_range(self, sat, cha, sel, sd, ed):
+        """
+        Daily zonal statistics, see L{ZonalStatsReader.read_range}.
+        """
+        (dates, record, cubes) = self._read(('zonal_mean', 'zonal_stdv', 'zonal_nobs'),
+                                            sat, cha, sel, sd, ed)
+        return (dates[record], cubes[0][record], cubes[1][record],
+                cubes[2][record], self.lats)
+
+    def _read_global(self, sat, cha, sel, sd, ed):
+        (minval, maxval) = get_mean_range(cha)
+        (dates, record, cubes) = self._read(('global_mean', 'global_stdv',
+                                             'global_nobs', 'orbit_count'),
+                                            sat, cha, sel, sd, ed)
+        with np.errstate(invalid='ignore'):
+            valid = record & (cubes[0] >= minval) & (cubes[0] <= maxval)
+        return dates, valid, [cube.astype(float) for cube in cubes]
+
+    def read_global_series(self, sat, cha, sel, sd, ed):
+        """
+        Global statistics, see L{read_global_series}.
+        """
+        (dates, valid, cubes) = self._read_global(sat, cha, sel, sd, ed)
+        return tuple([dates[valid]] + [cube[valid] for cube in cubes])
+
+    def read_global_difference(self, sat, cha1, cha2, sel, sd, ed):
+        """
+        Global statistics of two channels, see L{read_global_difference}.
+        """
+        (dates, valid1, cubes1) = self._read_global(sat, cha1, sel, sd, ed)
+        (dates, valid2, cubes2) = self._read_global(sat, cha2, sel, sd, ed)
+        valid = valid1 & valid2
+        return tuple([dates[valid]] + [cube[valid] for pair in zip(cubes1[0:3], cubes2[0:3])
+                                       for cube in pair])
+
+
+def read_global_series(sat, cha, sel, sd, ed, sql):
     """
-    Read sqlite database (sql): 
-    return global statistics for a given satellite (sat), 
-    channel (cha), time selection (sel) between 
+    Read sqlite database (sql) in one query:
+    return global statistics for a given satellite (sat),
+    channel (cha), time selection (sel) between
     start_date (sd) and end_date (ed).
+    :return: arrays of date, mean, stdv, nobs and orbit count
     """
+    if isinstance(sql, StatisticsCube):
+        return sql.read_global_series(sat, cha, sel, sd, ed)
 
-    # reflectance
-    if cha == "ch1" or cha == "ch2" or cha == "ch3a":
-        minval = 0.
-        maxval = 1.5
-    # brightness temperature
-    else:
-        minval = 140.
-        maxval = 350.
-
-    glob_list = ("OrbitCount", "GlobalMean", "GlobalStdv", "GlobalNobs")
-    mean_list = list()
-    stdv_list = list()
-    nobs_list = list()
-    date_list = list()
-    orbs_cnts = list()
-
-    sat_id = get_id("satellites", "id", sat, sql)
-    cha_id = get_id("channels", "id", cha, sql)
-    sel_id = get_id("selects", "id", sel, sql)
-
-    get_data = "SELECT date, {0}, {1}, {2}, {3} " \
-               "FROM statistics WHERE satelliteID={4} AND " \
-               "channelID={5} AND selectID={6} AND " \
-               "date>=\'{7}\' AND date<=\'{8}\' AND " \
-               "GlobalMean >= {9} AND GlobalMean <= {10} " \
-               "ORDER BY date".format(glob_list[0], glob_list[1],
-                                      glob_list[2], glob_list[3],
-                                      sat_id, cha_id, sel_id, sd, ed,
-                                      minval, maxval)
-    # print get_data
-    results = sql.execute(get_data)
-
-    for result in results:
-        if result['date'] is not None:
-            date_list.append(result['date'])
-            orbs_cnts.append(result[glob_list[0]])
-            mean_list.append(result[glob_list[1]])
-            stdv_list.append(result[glob_list[2]])
-            nobs_list.append(result[glob_list[3]])
-        else:
-            return None
+    (minval, maxval) = get_mean_range(cha)
+
+    get_data = "SELECT date, GlobalMean, GlobalStdv, GlobalNobs, OrbitCount " \
+               "FROM {0} WHERE {1} AND " \
+               "date>=\'{2}\' AND date<=\'{3}\' AND " \
+               "GlobalMean >= {4} AND GlobalMean <= {5} " \
+               "ORDER BY date".format(get_global_table(sql),
+                                      get_id_filter(sat, cha, sel),
+                                      sd, ed, minval, maxval)
+    rows = sql.execute(get_data).fetchall()
+
+    return (np.array([r['date'] for r in rows], dtype=object),
+            np.array([r['GlobalMean'] for r in rows], dtype=float),
+            np.array([r['GlobalStdv'] for r in rows], dtype=float),
+            np.array([r['GlobalNobs'] for r in rows], dtype=float),
+            np.array([r['OrbitCount'] for r in rows], dtype=float))
+
+
+def read_global_difference(sat, cha1, cha2, sel, sd, ed, sql):
+    """
+    Read sqlite database (sql) in one query:
+    return global statistics of two channels (cha1, cha2) for a given
+    satellite (sat) and time selection (sel) between start_date (sd)
+    and end_date (ed), collocated by date.
+    :return: arrays of date, mean1, mean2, stdv1, stdv2, nobs1, nobs2
+    """
+    if isinstance(sql, StatisticsCube):
+        return sql.read_global_difference(sat, cha1, cha2, sel, sd, ed)
+
+    (minval1, maxval1) = get_mean_range(cha1)
+    (minval2, maxval2) = get_mean_range(cha2)
+
+    get_data = "SELECT s1.date AS date, " \
+               "s1.GlobalMean AS mean1, s2.GlobalMean AS mean2, " \
+               "s1.GlobalStdv AS stdv1, s2.GlobalStdv AS stdv2, " \
+               "s1.GlobalNobs AS nobs1, s2.GlobalNobs AS nobs2 " \
+               "FROM {table} s1 JOIN {table} s2 ON s2.date = s1.date " \
+               "WHERE {0} AND {1} AND " \
+               "s1.date>=\'{2}\' AND s1.date<=\'{3}\' AND " \
+               "s1.GlobalMean >= {4} AND s1.GlobalMean <= {5} AND " \
+               "s2.GlobalMean >= {6} AND s2.GlobalMean <= {7} " \
+               "ORDER BY s1.date".format(get_id_filter(sat, cha1, sel, 's1'),
+                                         get_id_filter(sat, cha2, sel, 's2'),
+                                         sd, ed, minval1, maxval1,
+                                         minval2, maxval2,
+                                         table=get_global_table(sql))
+    rows = sql.execute(get_data).fetchall()
+
+    dates = np.array([r['date'] for r in rows], dtype=object)
+    cols = [np.array([r[c] for r in rows], dtype=float) for c in
+            ('mean1', 'mean2', 'stdv1', 'stdv2', 'nobs1', 'nobs2')]
+
+    return tuple([dates] + cols)
+
+
+def read_pooled_stats(sat, cha, sel, sd, ed, sql, period='month', reader=None):
+    """
+    Read sqlite database (sql):
+    return monthly or yearly global and zonal statistics for a given
+    satellite (sat), channel (cha), time selection (sel) between
+    start_date (sd) and end_date (ed). Daily records are merged with
+    the pooled variance (subs.Moments), i.e. the spread between the
+    daily means is included in the standard deviation.
+    Both layouts and exported cubes are read, see L{ZonalStatsReader};
+    global records are selected like in L{read_global_series}.
+    Note: records written before the pooled merge of orbits was
+    introduced carry a nobs-weighted average of orbit standard deviations.
+    :param period: 'month' or 'year'
+    :param reader: L{ZonalStatsReader} of sql, created if not given
+    :return: list of period start dates, list of global moments,
+             list of zonal moments, latitudinal belts
+    """
+    fill_value = -9999.
 
-    return date_list, mean_list, stdv_list, nobs_list, orbs_cnts
+    if isinstance(sql, StatisticsCube):
+        reader = sql
+    elif reader is None:
+        reader = ZonalStatsReader(sql)
+
+    (gdates, gmean, gstdv, gnobs) = read_global_series(sat, cha, sel, sd, ed, sql)[0:4]
+    (zdates, zmean, zstdv, znobs, lats) = reader.read_range(sat, cha, sel, sd, ed)
+
+    def get_period(dt):
+        if not isinstance(dt, datetime.date):
+            dt = datetime.datetime.strptime(str(dt)[:10], '%Y-%m-%d').date()
+        if period == 'year':
+            return datetime.date(dt.year, 1, 1)
+        return datetime.date(dt.year, dt.month, 1)
+
+    gkeys = [get_period(dt) for dt in gdates]
+    zkeys = [get_period(dt) for dt in zdates]
+
+    period_list = sorted(set(gkeys) | set(zkeys))
+    index = dict((key, pos) for pos, key in enumerate(period_list))
+    glob_list = [subs.Moments() for key in period_list]
+    zonal_list = [subs.Moments.zeros(len(lats)) for key in period_list]
+
+    for pos, key in enumerate(gkeys):
+        glob_list[index[key]].merge(subs.Moments.from_stats(
+            gmean[pos], gstdv[pos], gnobs[pos], fill_value=fill_value))
+
+    for pos, key in enumerate(zkeys):
+        zonal_list[index[key]].merge(subs.Moments.from_stats(
+            zmean[pos], zstdv[pos], znobs[pos], fill_value=fill_value))
+
+    return period_list, glob_list, zonal_list, list(lats)
+
+
+def get_orbits_per_day(satellite, sdate, edate, db):
+    """
+    get number of valid orbits per day for a specific
+    satellite between sdate and edate from the archive database
+    containing the L1B and L1C information of AVHRR GAC.
+    Days without valid orbits are not returned.
+    :return: arrays of dates and orbit counts
+    """
+    get_data = "SELECT date(start_time_l1c) AS day, COUNT(*) AS cnt " \
+               "FROM vw_std WHERE blacklist=0 AND " \
+               "satellite_name=\'{satellite}\' AND " \
+               "start_time_l1c >= \'{sdt}\' AND start_time_l1c < \'{edt}\' " \
+               "GROUP BY day ORDER BY day".format(satellite=satellite, sdt=sdate,
+                                                  edt=edate + datetime.timedelta(days=1))
+    rows = db.execute(get_data).fetchall()
+
+    dates = np.array([datetime.datetime.strptime(r['day'], '%Y-%m-%d').date()
+                      for r in rows], dtype=object)
+    counts = np.array([r['cnt'] for r in rows], dtype=int)
+
+    return dates, counts
 
 
 def get_number_of_orbits_per_day(satellite, date_list, db):
@@ -163,25 +603,18 @@ def get_number_of_orbits_per_day(satellite, date_list, db):
     get number of valid orbits per day for a specific
     satellite from the archive database containing
     the L1B and L1C information of AVHRR GAC.
+    Days without valid orbits are skipped.
     """
-    orbit_cnt_list = []
-
-    for sdt in date_list:
-        edt = sdt + datetime.timedelta(days=1)
+    if len(date_list) == 0:
+        return []
 
-        get_data = "SELECT COUNT(*) " \
-                   "FROM vw_std WHERE blacklist=0 AND " \
-                   "satellite_name=\'{satellite}\' AND " \
-                   "start_time_l1c BETWEEN " \
-                   "\'{sdt}\' AND \'{edt}\' ".format(satellite=satellite,
-                                                     sdt=sdt, edt=edt)
+    (dates, counts) = get_orbits_per_day(satellite, min(date_list), max(date_list), db)
+    day_counts = dict(zip(dates, counts))
 
-        for row in db.execute(get_data):
-            if row['COUNT(*)']:
-                nums = int(row['COUNT(*)'])
-                orbit_cnt_list.append(nums)
+    days = [sdt.date() if isinstance(sdt, datetime.datetime) else sdt
+            for sdt in date_list]
 
-    return orbit_cnt_list
+    return [int(day_counts[day]) for day in days if day in day_counts]
 
 
 def pystat_channel_difference(cha_list, sat_list, sza_time, cursor,
@@ -226,50 +659,19 @@ def pystat_channel_difference(cha_list, sat_list, sza_time, cursor,
         # get color for satellite
         satcolor = subs.color_satstring(satellite)
 
-        # read pystat results
-        (datelst_1, meanlst_1, stdvlst_1,
-         nobslst_1, orb_cnts_lst_1) = read_global_newstats(satellite, cha_list[0],
-                                                           sza_time, sdate, edate, cursor)
-        (datelst_2, meanlst_2, stdvlst_2,
-         nobslst_2, orb_cnts_lst_2) = read_global_newstats(satellite, cha_list[1],
-                                                           sza_time, sdate, edate, cursor)
-
-        collocate = False
-        if len(datelst_1) != len(datelst_2):
-            logger.info(" --- Both date lists do not have the same length.")
-            logger.info(" ====> collocate both data sets!")
-            collocate = True
-        else:
-            for cnt, idx in enumerate(datelst_1):
-                if datelst_1[cnt] != datelst_2[cnt]:
-                    logger.info(" --- Both date lists have the same length but do not match.")
-                    logger.info("     Date List 1: {0}".format(datelst_1[cnt]))
-                    logger.info("     Date List 2: {0}".format(datelst_2[cnt]))
-                    logger.info(" ====> collocate both data sets!")
-                    collocate = True
-                    break
-
-        if collocate:
-            (dates, mean1, mean2, stdv1, stdv2,
-             nobs1, nobs2) = collocte_pystat_lists(datelst_1, meanlst_1, stdvlst_1, nobslst_1,
-                                                   datelst_2, meanlst_2, stdvlst_2, nobslst_2)
-        else:
-            dates = datelst_1
-            nobs1 = nobslst_1
-            nobs2 = nobslst_2
-            mean1 = meanlst_1
-            mean2 = meanlst_2
-            stdv1 = stdvlst_1
-            stdv2 = stdvlst_2
+        # read pystat results of both channels collocated by date
+        (dates, mean1, mean2, stdv1, stdv2,
+         nobs1, nobs2) = read_global_difference(satellite, cha_list[0], cha_list[1],
+                                                sza_time, sdate, edate, cursor)
 
         if len(dates) > 1:
             isdata_cnt += 1
             sat_cnt += 1
-            dat = np.asarray(dates)
-            ob1 = np.asarray(nobs1)
-            ob2 = np.asarray(nobs2)
-            ave = np.asarray(mean1) - np.asarray(mean2)
-            std = np.asarray(stdv1) - np.asarray(stdv2)
+            dat = dates
+            ob1 = nobs1
+            ob2 = nobs2
+            ave = mean1 - mean2
+            std = stdv1 - stdv2
             ax_val.plot(dat, ave, linesty, label=satellite, color=satcolor, alpha=0.8, markersize=5)
             ax_std.plot(dat, std, linesty, label=satellite, color=satcolor, alpha=0.8, markersize=5)
             if sat_cnt <= 1:
@@ -364,8 +766,8 @@ def plot_time_series(sat_list, channel, select, start_date, end_date, outpath,
 
         # read pystat results
         (datelst, meanlst, stdvlst,
-         nobslst, orb_cnts_lst) = read_global_newstats(satellite, channel, select,
-                                                       start_date, end_date, cursor)
+         nobslst, orb_cnts_lst) = read_global_series(satellite, channel, select,
+                                                     start_date, end_date, cursor)
         if len(datelst) > 1:
             isdata_cnt += 1
             ax_val.plot(datelst, meanlst, linesty, label=satellite, color=satcolor, alpha=0.8, markersize=5)
@@ -462,8 +864,8 @@ def plot_time_series_linfit(sat_list, channel, select, start_date, end_date,
 
         # read statistics from SQL file
         (datelst, meanlst, stdvlst,
-         nobslst, orb_cnts_lst) = read_global_newstats(satellite, channel, select,
-                                                       start_date, end_date, cursor)
+         nobslst, orb_cnts_lst) = read_global_series(satellite, channel, select,
+                                                     start_date, end_date, cursor)
 
         if len(datelst) > 10:
             plot_label = "Daily global statistics for AVHRR " + satellite + \
@@ -476,13 +878,12 @@ def plot_time_series_linfit(sat_list, channel, select, start_date, end_date,
             # initialize plot
             (ax_val, ax_std, ax_rec) = init_pystat_plot()
 
-            # list to array
-            ave = np.asarray(meanlst)
-            std = np.asarray(stdvlst)
+            ave = meanlst
+            std = stdvlst
 
             # convert date list to a set of numbers counting
             # the number of days having passed from the first day of the file
-            x = [(e - min(datelst)).days for e in datelst]
+            x = np.array([(e - datelst[0]).days for e in datelst])
 
             # linear regression
             (slope, intercept, r_value, p_value, std_err) = stats.linregress(x, ave)
@@ -538,6 +939,90 @@ def plot_time_series_linfit(sat_list, channel, select, start_date, end_date,
     return
 
 
+def plot_pooled_series(sat_list, channel, select, start_date, end_date, outpath,
+                       cursor, period, show_fig, linesty, reader=None):
+    """
+    Plot monthly or yearly global statistics merged from the daily
+    pystat results with the pooled variance, see L{read_pooled_stats}.
+    :param period: 'month' or 'year'
+    """
+    isdata_cnt = 0
+
+    if select == "day_90sza":
+        stime = "day"
+    elif select == "day":
+        return
+    else:
+        stime = select
+
+    (chan_label, nobs_label, date_label,
+     orbit_label, mean_label, stdv_label) = get_pystat_labels(channel)
+
+    plot_label = period.capitalize() + "ly pooled global statistics for AVHRR " + \
+                 chan_label + " (" + stime + ")\n"
+
+    (ax_val, ax_std, ax_rec) = init_pystat_plot()
+
+    # -- loop over satellites
+    for satellite in sat_list:
+
+        satcolor = subs.color_satstring(satellite)
+
+        (period_list, glob_list,
+         zonal_list, lats) = read_pooled_stats(satellite, channel, select, start_date,
+                                               end_date, cursor, period=period, reader=reader)
+        valid = [pos for pos, mom in enumerate(glob_list) if mom.nobs > 0]
+
+        if len(valid) > 1:
+            isdata_cnt += 1
+            datelst = [period_list[pos] for pos in valid]
+            ax_val.plot(datelst, [glob_list[pos].get_mean() for pos in valid], linesty,
+                        label=satellite, color=satcolor, alpha=0.8, markersize=5)
+            ax_std.plot(datelst, [glob_list[pos].get_stdv() for pos in valid], linesty,
+                        label=satellite, color=satcolor, alpha=0.8, markersize=5)
+            ax_rec.plot(datelst, [glob_list[pos].nobs for pos in valid], '--o',
+                        label=satellite, markersize=5, alpha=0.8, color=satcolor)
+    # -- end of loop over satellites
+
+    if isdata_cnt > 0:
+        sdate_str = subs.date2str(start_date)
+        edate_str = subs.date2str(end_date)
+        if len(sat_list) == 1:
+            sname = '_' + subs.full_sat_name(sat_list[0])[2]
+        else:
+            sname = ''
+        fbase = 'Plot_TimeSeries_' + period.capitalize() + 'ly_' + sdate_str + '_' + \
+                edate_str + '_' + channel + '_' + stime + sname + '.png'
+        ofile = os.path.join(outpath, fbase)
+
+        label_pystat_plot(ave=ax_val, std=ax_std, obs=ax_rec,
+                          min_x_date=start_date, max_x_date=end_date,
+                          delta_days=(end_date - start_date).days,
+                          plt_label=plot_label, dat_label=date_label,
+                          ave_label=mean_label, std_label=stdv_label, obs_label=nobs_label)
+
+        if len(sat_list) > 8:
+            num_of_sats = int(math.ceil(len(sat_list) / 2.))
+        else:
+            num_of_sats = len(sat_list)
+
+        leg = ax_std.legend(ncol=num_of_sats, loc='best', fancybox=True)
+        plt.tight_layout(rect=(0.02, 0.02, 0.98, 0.98))
+        leg.get_frame().set_alpha(0.5)
+
+        plt.savefig(ofile)
+        if show_fig:
+            plt.show()
+            logger.info("Shown: {0} ".format(os.path.basename(ofile)))
+        logger.info("Done {0}".format(ofile))
+        plt.close()
+
+    else:
+        plt.close()
+
+    return
+
+
 def plt_zonal_means(zonal_mean, zonal_nobs, global_mean, zone_size,
                     ofil_name, fill_value, date_str, chan_str, plat_str,
                     sel_str, show_fig):
@@ -811,15 +1296,37 @@ def plt_all_sat_zonal(outfile, mean, stdv, nobs, lats, cols, sats,
 
 
 def plot_zonal_results(sat_list, channel, select, start_date, end_date,
-                       outpath, cur, target, verbose=None, show_fig=None):
+                       outpath, cur, target, verbose=None, show_fig=None,
+                       reader=None):
     """
     plotting daily zonal means and standard deviation.
     c. schlundt, june 2014
+    :param reader: L{ZonalStatsReader} of cur, created if not given
+    :param cur: sqlite cursor or L{StatisticsCube}
     """
 
     fill_value = -9999.0
     chan_label = subs.full_cha_name(channel)
     cnt = 0
+    global_mean = fill_value
+
+    if isinstance(cur, StatisticsCube):
+        reader = cur
+    elif reader is None:
+        reader = ZonalStatsReader(cur)
+
+    # read the whole period once per satellite
+    zonal = dict()
+    glob = dict()
+    for satellite in sat_list:
+        (dates, zmean, zstdv, znobs, belts) = reader.read_range(satellite, channel, select,
+                                                                start_date, end_date)
+        zonal[satellite] = (dict((d, i) for i, d in enumerate(dates)),
+                            zmean, zstdv, znobs, belts)
+
+        (datelst, meanlst) = read_global_series(satellite, channel, select,
+                                                start_date, end_date, cur)[0:2]
+        glob[satellite] = dict(zip(datelst, meanlst))
 
     # -- loop over days
     for dt in rrule(DAILY, dtstart=start_date, until=end_date):
@@ -841,18 +1348,16 @@ def plot_zonal_results(sat_list, channel, select, start_date, end_date,
             satcolor = subs.color_satstring(satellite)
             sat_label = subs.plot_satstring(satellite)
 
-            (datelst, meanlst, stdvlst,
-             nobslst, orb_cnts_lst) = read_global_newstats(satellite, channel, select,
-                                                           dt.date(), dt.date(), cur)
+            global_mean = glob[satellite].get(dt.date(), global_mean)
 
-            if meanlst:
-                global_mean = meanlst.pop()
-
-            (zmean, zstdv, znobs, belts) = read_zonal_stats(satellite, channel, select, dt.date(), cur)
+            (index, zmean, zstdv, znobs, belts) = zonal[satellite]
 
             zone_size = 180. / len(belts)
 
-            if len(zmean) > 0:
+            if dt.date() in index:
+                zmean = zmean[index[dt.date()]]
+                zstdv = zstdv[index[dt.date()]]
+                znobs = znobs[index[dt.date()]]
 
                 # ---------------------------------------------------
                 # zonalall: save results for all satellites
@@ -1598,55 +2103,3 @@ def get_channel_difference_plot_title(label1, label2, selected_time, channel_lis
               "(" + ch1_name + "," + ch2_name + ") " + c_suffix + " (" + selected_time + ")\n"
 
     return p_title, ch1_name, ch2_name
-
-
-def collocte_pystat_lists(d1, m1, s1, n1,
-                          d2, m2, s2, n2):
-    """
-    Returns collocated lists (1 and 2) for calculating pystat channel differences.
-    d = list of date
-    m = list of mean values
-    s = list of standard deviation values
-    n = list of number of observations
-    :return:
-    """
-    dates = list()
-    nobs1 = list()
-    nobs2 = list()
-    mean1 = list()
-    mean2 = list()
-    stdv1 = list()
-    stdv2 = list()
-
-    if len(d1) > len(d2):
-
-        for i1, date1 in enumerate(d1):
-            for i2, date2 in enumerate(d2):
-                if date1 == date2:
-                    dates.append(date1)
-                    # list 1
-                    nobs1.append(n1[i1])
-                    mean1.append(m1[i1])
-                    stdv1.append(s1[i1])
-                    # list 2
-                    nobs2.append(n2[i2])
-                    mean2.append(m2[i2])
-                    stdv2.append(s2[i2])
-
-        return dates, mean1, mean2, stdv1, stdv2, nobs1, nobs2
-
-    else:
-        for i2, date2 in enumerate(d2):
-            for i1, date1 in enumerate(d1):
-                if date1 == date2:
-                    dates.append(date1)
-                    # list 1
-                    nobs1.append(n1[i1])
-                    mean1.append(m1[i1])
-                    stdv1.append(s1[i1])
-                    # list 2
-                    nobs2.append(n2[i2])
-                    mean2.append(m2[i2])
-                    stdv2.append(s2[i2])
-
-        return dates, mean1, mean2, stdv1, stdv2, nobs1, nobs2
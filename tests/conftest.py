@@ -0,0 +1,74 @@
+#
+# tools are flat modules in the repository root
+#
+
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def put_variable(grp, name, data, gain, offset, nodata, missingdata):
+    """
+    PyGAC variable: group with 'data' and scaling attributes in 'what'.
+    """
+    var = grp.create_group(name)
+    var.create_dataset('data', data=data)
+    what = var.create_group('what')
+    what.attrs['gain'] = gain
+    what.attrs['offset'] = offset
+    what.attrs['nodata'] = nodata
+    what.attrs['missingdata'] = missingdata
+    what.attrs['dataset_name'] = name
+
+
+def write_l1c_orbit(avhrr_file, sunsat_file, rows=60, cols=40, seed=0):
+    """
+    Small synthetic L1c orbit (avhrr and sunsatangles file) with
+    missing data, no data and unrealistic lat/lon values.
+    """
+    import h5py
+
+    rng = np.random.RandomState(seed)
+
+    with h5py.File(avhrr_file, 'w') as f:
+        for i in range(1, 7):
+            if i in (1, 2, 6):
+                counts = rng.randint(0, 10000, (rows, cols))
+                offset = 0.
+            else:
+                counts = rng.randint(-3000, 3000, (rows, cols))
+                offset = 273.15
+            counts = counts.astype('i2')
+            counts[rng.rand(rows, cols) < 0.05] = -32767
+            counts[rng.rand(rows, cols) < 0.01] = -32001
+            put_variable(f, 'image{0}'.format(i), counts, 0.01, offset, -32001, -32767)
+
+        where = f.create_group('where')
+        lat = np.linspace(-95., 95., rows)[:, None] + rng.uniform(-1., 1., (rows, cols))
+        lon = rng.uniform(-185., 185., (rows, cols))
+        lat = np.round(lat / 0.001).astype('i4')
+        lon = np.round(lon / 0.001).astype('i4')
+        lat[rng.rand(rows, cols) < 0.02] = -999999
+        put_variable(where, 'lat', lat, 0.001, 0., -999999, -999998)
+        put_variable(where, 'lon', lon, 0.001, 0., -999999, -999998)
+
+    with h5py.File(sunsat_file, 'w') as a:
+        sza = np.round(rng.uniform(0., 180., (rows, cols)) / 0.01).astype('i2')
+        sza[rng.rand(rows, cols) < 0.01] = -32767
+        # values on the selection boundaries
+        sza[0, :4] = [8000, 9000, 7999, 8999]
+        put_variable(a, 'image1', sza, 0.01, 0., -32001, -32767)
+
+
+@pytest.fixture
+def l1c_orbit(tmpdir):
+    """
+    Paths of a synthetic avhrr and sunsatangles file.
+    """
+    avhrr_file = str(tmpdir.join('ECC_GAC_avhrr_noaa18_99999_20080101T0000000Z.h5'))
+    sunsat_file = str(tmpdir.join('ECC_GAC_sunsatangles_noaa18_99999_20080101T0000000Z.h5'))
+    write_l1c_orbit(avhrr_file, sunsat_file)
+    return avhrr_file, sunsat_file
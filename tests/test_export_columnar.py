@@ -0,0 +1,98 @@
+#
+# tests of the columnar export
+#
+
+import datetime
+import sqlite3
+import numpy as np
+import h5py
+import subs_avhrrgac as subs
+import export_columnar as export
+
+
+def create_pystat_db(path):
+    db = sqlite3.connect(path)
+    db.row_factory = subs.dict_factory
+    for table in ('satellites', 'channels', 'selects'):
+        db.execute("CREATE TABLE {0} (id INTEGER PRIMARY KEY, name TEXT)".format(table))
+    subs.create_statistics_blob_table(db)
+    return db
+
+
+def get_id(db, table, name):
+    row = db.execute("SELECT id FROM {0} WHERE name=?".format(table), (name,)).fetchone()
+    if row:
+        return row['id']
+    return db.execute("INSERT INTO {0} (name) VALUES (?)".format(table), (name,)).lastrowid
+
+
+def add_record(db, sat, cha, sel, day, rng):
+    date = datetime.date(2008, 1, 1) + datetime.timedelta(days=day)
+    db.execute("INSERT INTO statistics_blob VALUES (?, ?, ?, ?, 60., 14, ?, ?, ?, ?, ?, ?)",
+               (get_id(db, 'satellites', sat), date.strftime('%Y-%m-%d'),
+                get_id(db, 'channels', cha), get_id(db, 'selects', sel),
+                rng.normal(270., 10.), rng.uniform(1., 5.), rng.randint(100, 1000),
+                subs.array_to_blob(rng.normal(270., 10., 3), '<f4'),
+                subs.array_to_blob(rng.uniform(1., 5., 3), '<f4'),
+                subs.array_to_blob(rng.randint(0, 100, 3), '<i4')))
+
+
+def export_file(db, path):
+    with h5py.File(path, 'a') as h5:
+        return export.export_statistics(db, h5)
+
+
+def read_cubes(path):
+    """
+    Cube slices by (satellite, channel, select) and the first date.
+    """
+    cubes = dict()
+    with h5py.File(path, 'r') as h5:
+        grp = h5['pystat']
+        axes = [[name.decode('ascii') for name in grp[axis][:]]
+                for axis in ('satellites', 'channels', 'selects')]
+        for i, sat in enumerate(axes[0]):
+            for j, cha in enumerate(axes[1]):
+                for k, sel in enumerate(axes[2]):
+                    cubes[(sat, cha, sel)] = dict(
+                        (name, grp[name][i, j, k]) for name in
+                        [item[0] for item in export.GLOBAL_CUBES + export.ZONAL_CUBES])
+        return cubes, int(grp.attrs['first_date'])
+
+
+def test_incremental_export_equals_full_export(tmpdir):
+    rng = np.random.RandomState(1)
+    db = create_pystat_db(str(tmpdir.join('pystat.sqlite3')))
+    incremental = str(tmpdir.join('incremental.h5'))
+
+    for day in range(10):
+        if day != 4:
+            add_record(db, 'NOAA18', 'ch4', 'night', day, rng)
+    db.commit()
+    assert export_file(db, incremental) == {'NOAA18': 9}
+    assert export_file(db, incremental) == {}
+
+    # backfilled day, new days, new satellite, channel and select
+    add_record(db, 'NOAA18', 'ch4', 'night', 4, rng)
+    add_record(db, 'NOAA18', 'ch4', 'night', 12, rng)
+    add_record(db, 'NOAA18', 'ch5', 'night', 2, rng)
+    add_record(db, 'NOAA18', 'ch4', 'day', 7, rng)
+    add_record(db, 'METOPA', 'ch4', 'night', 3, rng)
+    db.commit()
+    assert export_file(db, incremental) == {'NOAA18': 4, 'METOPA': 1}
+    assert export_file(db, incremental) == {}
+
+    full = str(tmpdir.join('full.h5'))
+    export_file(db, full)
+    db.close()
+
+    (expected, expected_first) = read_cubes(full)
+    (result, result_first) = read_cubes(incremental)
+
+    assert result_first == expected_first
+    assert sorted(result) == sorted(expected)
+    for key in expected:
+        for name in expected[key]:
+            np.testing.assert_array_equal(result[key][name], expected[key][name])
+    assert result[('METOPA', 'ch4', 'night')]['record'].tolist() == \
+        [0, 0, 0, 1] + [0] * 9
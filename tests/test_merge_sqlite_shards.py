@@ -0,0 +1,73 @@
+#
+# tests of the shard merge
+#
+
+import sqlite3
+import numpy as np
+import subs_avhrrgac as subs
+import merge_sqlite_shards as shards
+
+
+def create_pystat_db(path, satellites):
+    db = sqlite3.connect(path)
+    for table in ('satellites', 'channels', 'selects'):
+        db.execute("CREATE TABLE {0} (id INTEGER PRIMARY KEY, "
+                   "name TEXT UNIQUE)".format(table))
+    db.executemany("INSERT INTO satellites (name) VALUES (?)",
+                   [(sat,) for sat in satellites])
+    db.execute("INSERT INTO channels (name) VALUES ('ch4')")
+    db.execute("INSERT INTO selects (name) VALUES ('night')")
+    subs.create_statistics_blob_table(db)
+    return db
+
+
+def add_record(db, sat, date, mean):
+    sat_id = db.execute("SELECT id FROM satellites WHERE name=?", (sat,)).fetchone()[0]
+    zonal = np.full(36, mean)
+    db.execute("INSERT OR REPLACE INTO statistics_blob (satelliteID, date, channelID, "
+               "selectID, binsize, OrbitCount, GlobalMean, GlobalStdv, GlobalNobs, "
+               "ZonalMean, ZonalStdv, ZonalNobs) VALUES (?,?,1,1,5.,14,?,1.,100,?,?,?)",
+               (sat_id, date, mean, subs.array_to_blob(zonal, '<f4'),
+                subs.array_to_blob(zonal * 0 + 1, '<f4'),
+                subs.array_to_blob(zonal * 0 + 3, '<i4')))
+
+
+def read_records(db):
+    return db.execute("SELECT s.name, t.date, t.GlobalMean, t.ZonalMean "
+                      "FROM statistics_blob t JOIN satellites s ON s.id = t.satelliteID "
+                      "ORDER BY s.name, t.date").fetchall()
+
+
+def test_merge_shards_idempotent(tmpdir):
+    main_path = str(tmpdir.join('main.sqlite3'))
+    main = create_pystat_db(main_path, ['NOAA18', 'NOAA19'])
+    add_record(main, 'NOAA18', '2008-01-01', 270.)
+    main.commit()
+    main.close()
+
+    # IDs of the shard differ from the main database
+    shard_path = str(tmpdir.join('shard.sqlite3'))
+    shard = create_pystat_db(shard_path, ['NOAA19', 'METOPA', 'NOAA18'])
+    add_record(shard, 'NOAA19', '2008-01-01', 271.)
+    add_record(shard, 'NOAA18', '2008-01-02', 272.)
+    add_record(shard, 'METOPA', '2008-01-01', 273.)
+    shard.commit()
+    shard.close()
+
+    db = sqlite3.connect(main_path)
+    db.isolation_level = None
+
+    counts = shards.merge_shard(db, shard_path)
+    assert counts == {'statistics_blob': 3}
+    first = read_records(db)
+
+    counts = shards.merge_shard(db, shard_path)
+    assert counts == {'statistics_blob': 3}
+    assert read_records(db) == first
+
+    assert [row[0:3] for row in first] == [('METOPA', '2008-01-01', 273.),
+                                           ('NOAA18', '2008-01-01', 270.),
+                                           ('NOAA18', '2008-01-02', 272.),
+                                           ('NOAA19', '2008-01-01', 271.)]
+    assert db.execute("SELECT COUNT(*) FROM satellites").fetchone()[0] == 3
+    db.close()
@@ -0,0 +1,145 @@
+#
+# tests of the on-disk orbit cache
+#
+
+import os
+import time
+import numpy as np
+import pytest
+import orbit_cache
+
+
+@pytest.fixture
+def orbit_file(tmpdir):
+    path = str(tmpdir.join('ECC_GAC_avhrr_noaa18_99999_20080101T0000000Z.h5'))
+    with open(path, 'wb') as fp:
+        fp.write(b'orbit' * 1000)
+    return path
+
+
+@pytest.fixture
+def cache_env(tmpdir, monkeypatch):
+    """
+    Cache configured by the environment, limited to 20 KiB.
+    """
+    cache_dir = str(tmpdir.join('cache'))
+    monkeypatch.setenv(orbit_cache.CACHE_DIR_ENV, cache_dir)
+    monkeypatch.setenv(orbit_cache.CACHE_SIZE_ENV, '0.01953125')
+    monkeypatch.setattr(orbit_cache, '_cache', None)
+    return cache_dir
+
+
+def random_array(seed):
+    # incompressible, i.e. about 8 kB per entry
+    return np.random.RandomState(seed).rand(1000)
+
+
+def test_disabled_without_cache_dir(monkeypatch):
+    monkeypatch.delenv(orbit_cache.CACHE_DIR_ENV, raising=False)
+    assert orbit_cache.get_cache() is None
+
+
+def test_save_and_load(cache_env, orbit_file):
+    cache = orbit_cache.get_cache()
+    assert cache.max_size == 20480
+
+    assert cache.load([orbit_file], 'geo_mask') is None
+    cache.save([orbit_file], 'geo_mask', mask=random_array(1))
+
+    res = cache.load([orbit_file], 'geo_mask')
+    assert (res['mask'] == random_array(1)).all()
+    assert cache.load([orbit_file], 'tsm_mask') is None
+
+
+def test_key_changes_with_mtime_and_size(cache_env, orbit_file):
+    cache = orbit_cache.get_cache()
+    cache.save([orbit_file], 'geo_mask', mask=random_array(1))
+
+    # same size and content, other mtime
+    st = os.stat(orbit_file)
+    os.utime(orbit_file, (st.st_atime, st.st_mtime - 10))
+    assert cache.load([orbit_file], 'geo_mask') is None
+
+    cache.save([orbit_file], 'geo_mask', mask=random_array(2))
+    assert (cache.load([orbit_file], 'geo_mask')['mask'] == random_array(2)).all()
+
+    # other size, same mtime
+    st = os.stat(orbit_file)
+    with open(orbit_file, 'ab') as fp:
+        fp.write(b'reprocessed')
+    os.utime(orbit_file, (st.st_atime, st.st_mtime))
+    assert cache.load([orbit_file], 'geo_mask') is None
+
+
+def test_save_writes_temporary_file_and_renames(cache_env, orbit_file, monkeypatch):
+    cache = orbit_cache.get_cache()
+    renamed = list()
+    rename = os.rename
+
+    def recording_rename(src, dst):
+        renamed.append((src, dst))
+        return rename(src, dst)
+
+    monkeypatch.setattr(orbit_cache.os, 'rename', recording_rename)
+    cache.save([orbit_file], 'geo_mask', mask=random_array(1))
+
+    assert len(renamed) == 1
+    (src, dst) = renamed[0]
+    assert src.endswith('.tmp') and os.path.dirname(src) == cache_env
+    assert dst == cache._entry([orbit_file], 'geo_mask')
+    assert os.listdir(cache_env) == [os.path.basename(dst)]
+
+
+def test_failed_save_leaves_no_files(cache_env, orbit_file, monkeypatch):
+    cache = orbit_cache.get_cache()
+
+    def failing_savez(fp, **arrays):
+        fp.write(b'partial')
+        raise IOError("disk full")
+
+    monkeypatch.setattr(orbit_cache.np, 'savez_compressed', failing_savez)
+    cache.save([orbit_file], 'geo_mask', mask=random_array(1))
+
+    assert os.listdir(cache_env) == []
+    assert cache.load([orbit_file], 'geo_mask') is None
+
+
+def test_evict_least_recently_used(cache_env, orbit_file):
+    cache = orbit_cache.get_cache()
+    now = time.time()
+
+    cache.save([orbit_file], 'select_day', mask=random_array(1))
+    cache.save([orbit_file], 'select_night', mask=random_array(2))
+    day = cache._entry([orbit_file], 'select_day')
+    night = cache._entry([orbit_file], 'select_night')
+    os.utime(day, (now - 100, now - 100))
+    os.utime(night, (now - 50, now - 50))
+
+    # loading marks select_day as recently used
+    assert cache.load([orbit_file], 'select_day') is not None
+
+    # third entry exceeds 20 KiB
+    cache.save([orbit_file], 'select_twilight', mask=random_array(3))
+
+    assert os.path.isfile(day)
+    assert not os.path.isfile(night)
+    assert cache.load([orbit_file], 'select_twilight') is not None
+    assert cache._size <= cache.max_size
+
+
+def test_evict_ignores_temporary_files(cache_env, orbit_file):
+    cache = orbit_cache.get_cache()
+    cache.save([orbit_file], 'geo_mask', mask=random_array(1))
+    entry = cache._entry([orbit_file], 'geo_mask')
+
+    # entry being written by another process, older and larger than the limit
+    tmp = os.path.join(cache_env, 'tmpabcdef.tmp')
+    with open(tmp, 'wb') as fp:
+        fp.write(b'\0' * 50000)
+    os.utime(tmp, (time.time() - 1000, time.time() - 1000))
+
+    cache.evict()
+
+    assert os.path.isfile(tmp)
+    assert os.path.isfile(entry)
+    assert cache._size == os.path.getsize(entry)
@@ -0,0 +1,64 @@
+#
+# tests of the quick analysis statistics
+#
+
+import numpy as np
+import h5py
+import subs_avhrrgac as subs
+import read_avhrrgac_h5 as rh5
+import quick_l1c_analysis as quick
+
+
+def collect_stats_scaled(h5file, data):
+    """
+    Former collect_stats: statistics of the scaled masked data.
+    """
+    f = h5py.File(h5file, "r")
+    var, var_name, unscaled, fillv = rh5.read_var(f, data, unscaled=True)
+    f.close()
+
+    if data == 'image1' or data == 'image2' or data == 'image6':
+        var[:] = var[:] / 100.
+
+    if np.ma.count(var) > 0:
+        minv = float(var.min())
+        maxv = float(var.max())
+        meanv = float(var.mean())
+    else:
+        minv = maxv = meanv = float(fillv)
+
+    mask = np.ma.masked_equal(unscaled, fillv)
+    return [minv, maxv, meanv, int(np.ma.count(unscaled)),
+            int(np.ma.count_masked(mask)), int(np.ma.count(mask))]
+
+
+def test_analyse_l1c_equals_scaled_stats(l1c_orbit):
+    avhrr_file = l1c_orbit[0]
+    images = dict(zip(subs.get_channel_list(), subs.get_avhrr_h5image_list()))
+
+    stats = list(quick.analyse_l1c(avhrr_file))
+    assert [cha for cha, stat in stats] == subs.get_channel_list()
+
+    for cha, stat in stats:
+        expected = collect_stats_scaled(avhrr_file, images[cha])
+        # counts and min/max are exact, the mean is scaled after summing
+        assert stat[3:] == expected[3:]
+        assert np.allclose(stat[0:2], expected[0:2], rtol=1e-12, atol=0.)
+        assert np.isclose(stat[2], expected[2], rtol=1e-9, atol=0.)
+
+
+def test_collect_stats_without_valid_data(tmpdir):
+    path = str(tmpdir.join('empty.h5'))
+    with h5py.File(path, 'w') as f:
+        grp = f.create_group('image1')
+        grp.create_dataset('data', data=np.full((4, 3), -32767, dtype='i2'))
+        what = grp.create_group('what')
+        for key, val in (('gain', 0.01), ('offset', 0.), ('nodata', -32001),
+                         ('missingdata', -32767), ('dataset_name', 'image1')):
+            what.attrs[key] = val
+
+    with h5py.File(path, 'r') as f:
+        var = rh5.get_dataset_index(f)['image1']
+        stat = quick.collect_stats(var, 'ch1')
+
+    assert stat == [-32767., -32767., -32767., 12, 12, 0]
@@ -0,0 +1,250 @@
+#
+# tests of the L1c orbit reader
+#
+
+from functools import reduce
+import numpy as np
+import numpy.ma as ma
+import pytest
+import h5py
+import subs_avhrrgac as subs
+import read_avhrrgac_h5 as rh5
+
+
+def read_avhrrgac_per_call(f, a, tim, cha):
+    """
+    Former read_avhrrgac: every variable is read with its own
+    read_var call for each (channel, time selection).
+    """
+    sza, szanam = rh5.read_var(a, 'image1')
+    lat, latnam = rh5.read_var(f, 'lat')
+    lon, lonnam = rh5.read_var(f, 'lon')
+
+    images = dict(zip(subs.get_channel_list(), subs.get_avhrr_h5image_list()))
+    tar, tarname = rh5.read_var(f, images[cha])
+    if cha in ('ch1', 'ch2', 'ch3a'):
+        tar[:] = tar / 100.
+
+    all_masks = [lat < -90., lat > 90., lon < -180., lon > 180.]
+    total_mask = reduce(np.logical_or, all_masks)
+    lat = ma.masked_where(total_mask, lat)
+    lon = ma.masked_where(total_mask, lon)
+    tar = ma.masked_where(total_mask, tar)
+    sza = ma.masked_where(total_mask, sza)
+
+    if tim == 'day_90sza':
+        omask = sza >= 90.
+    elif tim == 'day':
+        omask = sza >= 80.
+    elif tim == 'twilight':
+        omask = ma.mask_or(sza < 80, sza >= 90)
+    elif tim == 'night':
+        omask = sza < 90.
+    else:
+        return lat, lon, tar, sza
+
+    return (ma.masked_where(omask, lat), ma.masked_where(omask, lon),
+            ma.masked_where(omask, tar), sza)
+
+
+def assert_masked_equal(x, y):
+    assert (ma.getmaskarray(x) == ma.getmaskarray(y)).all()
+    assert (ma.compressed(x) == ma.compressed(y)).all()
+
+
+@pytest.fixture
+def orbit_files(l1c_orbit, monkeypatch):
+    monkeypatch.delenv('AVHRRGAC_CACHE_DIR', raising=False)
+    f = h5py.File(l1c_orbit[0], 'r')
+    a = h5py.File(l1c_orbit[1], 'r')
+    yield f, a
+    f.close()
+    a.close()
+
+
+def test_orbit_equals_per_call_read_var(orbit_files):
+    (f, a) = orbit_files
+    orbit = rh5.AvhrrGacOrbit(f, a)
+
+    for cha in subs.get_channel_list():
+        for tim in subs.get_pystat_select_list() + ['all']:
+            expected = read_avhrrgac_per_call(f, a, tim, cha)
+            for x, y in zip(expected[:3], orbit.get(cha, tim)):
+                assert_masked_equal(x, y)
+
+    assert_masked_equal(orbit.sza, expected[3])
+
+
+def test_orbit_select_masks(orbit_files):
+    (f, a) = orbit_files
+    orbit = rh5.AvhrrGacOrbit(f, a)
+
+    sza = read_avhrrgac_per_call(f, a, 'all', 'ch1')[3]
+    conditions = {'day_90sza': sza >= 90., 'day': sza >= 80.,
+                  'twilight': ma.mask_or(sza < 80, sza >= 90), 'night': sza < 90.}
+
+    for tim, cond in conditions.items():
+        # former masking: ma.masked_where(cond, ...) for each variable
+        expected = ma.getmaskarray(ma.masked_where(cond, sza))
+        assert (np.logical_or(ma.getmaskarray(sza), orbit.select_mask(tim)) == expected).all()
+
+    assert orbit.select_mask('all') is ma.nomask
+
+
+def test_orbit_decodes_each_dataset_once(orbit_files, monkeypatch):
+    (f, a) = orbit_files
+    reads = list()
+    read_rows = rh5.read_rows
+
+    def counting_read_rows(dset, rows=None):
+        reads.append((dset.file.filename, dset.name))
+        return read_rows(dset, rows)
+
+    monkeypatch.setattr(rh5, 'read_rows', counting_read_rows)
+
+    orbit = rh5.AvhrrGacOrbit(f, a)
+    for cha in subs.get_channel_list():
+        for tim in subs.get_pystat_select_list() + ['all']:
+            orbit.get(cha, tim)
+
+    # lat, lon, sza and six channels
+    assert len(reads) == 9
+    assert len(set(reads)) == 9
+
+
+def gridbox_mean_loop(data, fill_value, box_size):
+    """
+    Former weave C code of gridbox_mean.
+    """
+    fdata = data.astype('f8').filled(fill_value)
+    nrows, ncols = data.shape
+    radius = (box_size - 1) // 2
+    filtered = np.zeros(data.shape, dtype='f8')
+
+    for row in range(nrows):
+        for col in range(ncols):
+            total = 0.
+            nbox = 0
+            for rowbox in range(max(row - radius, 0), min(row + radius + 1, nrows)):
+                for colbox in range(max(col - radius, 0), min(col + radius + 1, ncols)):
+                    if fdata[rowbox, colbox] != fill_value:
+                        total += fdata[rowbox, colbox]
+                        nbox += 1
+            if nbox > 0:
+                filtered[row, col] = total / nbox
+
+    return np.ma.masked_equal(filtered, fill_value)
+
+
+def gridbox_std_loop(data, box_size, fill_value):
+    """
+    Former gridbox_std based on the weave gridbox_mean.
+    """
+    mean_squared = np.square(gridbox_mean_loop(data, fill_value, box_size))
+    squared_mean = gridbox_mean_loop(np.square(data), fill_value, box_size)
+    return np.ma.sqrt(squared_mean - mean_squared)
+
+
+def get_random_image(shape=(30, 25), seed=5):
+    rng = np.random.RandomState(seed)
+    data = rng.normal(0., 2., shape)
+    mask = rng.rand(*shape) < 0.3
+    # masked block, i.e. boxes without or with one valid element
+    mask[10:16, 5:12] = True
+    mask[12, 8] = False
+    return ma.array(data, mask=mask)
+
+
+@pytest.mark.parametrize('box_size', [3, 5])
+def test_gridbox_mean_equals_loop(box_size):
+    data = get_random_image()
+
+    expected = gridbox_mean_loop(data, -9999., box_size)
+    result = rh5.gridbox_mean(data, -9999., box_size)
+
+    assert (ma.getmaskarray(expected) == ma.getmaskarray(result)).all()
+    assert np.allclose(expected.filled(0.), result.filled(0.), rtol=1e-12, atol=1e-12)
+
+    with pytest.raises(ValueError):
+        rh5.gridbox_mean(data, -9999., 4)
+
+
+@pytest.mark.parametrize('box_size', [3, 5])
+def test_gridbox_std_equals_loop(box_size):
+    data = get_random_image()
+
+    expected = gridbox_std_loop(data, box_size, -9999.)
+    result = rh5.gridbox_std(data, box_size, -9999.)
+
+    # negative variances due to rounding were masked, they are 0 now
+    rounding = ma.getmaskarray(expected) & ~ma.getmaskarray(result)
+    assert (ma.getmaskarray(result) <= ma.getmaskarray(expected)).all()
+    assert (result[rounding] < 1e-6).all()
+
+    valid = ~ma.getmaskarray(expected)
+    assert np.allclose(expected[valid], result[valid], rtol=1e-9, atol=1e-6)
+
+
+def test_tsm_mask_equals_gridbox_std():
+    rng = np.random.RandomState(11)
+    shape = (40, 30)
+    # scan motor noise in the lower half only
+    noise = np.where(np.arange(shape[0])[:, None] < 20, 0.1, 4.)
+    noise = np.repeat(noise, shape[1], axis=1)
+
+    def channel(mean, scale, masked=0.05):
+        data = mean + rng.normal(0., 1., shape) * scale
+        return ma.array(data, mask=rng.rand(*shape) < masked)
+
+    tar1 = channel(0.3, noise * 0.01)
+    tar2 = channel(0.3, noise * 0.01)
+    tar4 = channel(270., noise)
+    tar5 = channel(270., noise)
+
+    # former detector: two gridbox_std calls
+    std_d12 = gridbox_std_loop(abs(tar1 - tar2), 3, -9999.0)
+    std_d45 = gridbox_std_loop(100.0 * (tar4 - tar5) / tar5, 3, -9999.0)
+    expected = ma.filled((std_d12 > 0.02) & (std_d45 > 2.00), False)
+
+    result = rh5.tsm_mask(tar1, tar2, tar4, tar5)
+
+    assert result.dtype == bool
+    assert expected.any() and not expected.all()
+    assert (result == expected).all()
+
+
+def find_scanline_gaps_loop(col, rows, qdata):
+    """
+    Former find_scanline_gaps: one "in" test per scanline.
+    """
+    gap_list = list()
+    scanline_list = np.array(qdata[:, col].tolist())
+    for i in range(1, rows + 1):
+        if i not in scanline_list:
+            gap_list.append(i)
+    return gap_list
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_find_scanline_gaps_equals_loop(seed):
+    rng = np.random.RandomState(seed)
+    rows = 500
+    scanlines = np.arange(1, rows + 1)
+    keep = rng.rand(rows) > 0.05
+    # one large gap
+    keep[100 + seed * 50:180 + seed * 50] = False
+    qdata = np.zeros((keep.sum(), 3), dtype='i4')
+    qdata[:, 0] = scanlines[keep]
+
+    expected = find_scanline_gaps_loop(0, rows, qdata)
+    assert rh5.find_scanline_gaps(0, rows, qdata) == expected
+
+    ranges = rh5.find_scanline_gaps(0, rows, qdata, ranges=True)
+    assert sum(length for start, length in ranges) == len(expected)
+    assert [start + i for start, length in ranges for i in range(length)] == expected
+    assert max(length for start, length in ranges) >= 80
+
+
+def test_scanline_ranges():
+    assert rh5.scanline_ranges([]) == []
+    assert rh5.scanline_ranges([3, 4, 5, 9, 11, 12]) == [[3, 3], [9, 1], [11, 2]]
@@ -0,0 +1,114 @@
+#
+# tests of the single writer daemon
+#
+
+import sqlite3
+import threading
+import pytest
+import sqlite_writer as sqlwriter
+
+
+def store_records(db, value):
+    db.execute('INSERT INTO records VALUES (?)', (value,))
+
+
+# job function as the writer knows it
+store_records.__module__ = 'quick_l1c_analysis'
+
+
+@pytest.fixture
+def dbfile(tmpdir):
+    path = str(tmpdir.join('records.sqlite3'))
+    db = sqlite3.connect(path)
+    db.execute('CREATE TABLE records (value INTEGER)')
+    db.commit()
+    db.close()
+    return path
+
+
+def start_writer(server):
+    server.functions[('quick_l1c_analysis', 'store_records')] = store_records
+    thread = threading.Thread(target=server.serve)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def wait_for_socket(address):
+    for i in range(500):
+        try:
+            return sqlwriter.WriterClient(address, 'secret')
+        except (IOError, OSError):
+            threading.Event().wait(0.01)
+    raise IOError("writer not listening on {0}".format(address))
+
+
+def test_jobs_committed_on_sync(tmpdir, dbfile):
+    address = str(tmpdir.join('writer.sock'))
+    server = sqlwriter.SqliteWriter(dbfile, address, authkey='secret')
+    thread = start_writer(server)
+
+    client = wait_for_socket(address)
+    for value in range(5):
+        client.submit(store_records, value)
+    assert client.sync() == (5, [])
+
+    client.stop()
+    client.close()
+    thread.join(10)
+    assert not thread.is_alive()
+
+    db = sqlite3.connect(dbfile)
+    assert db.execute('SELECT COUNT(*) FROM records').fetchone()[0] == 5
+    db.close()
+
+
+class FailingConnection(object):
+
+    def __init__(self, rollback_error):
+        self.rollback_error = rollback_error
+
+    def execute(self, sql):
+        if sql == 'COMMIT':
+            raise sqlite3.OperationalError("disk I/O error")
+        if self.rollback_error:
+            raise sqlite3.OperationalError("cannot rollback - no transaction is active")
+
+
+@pytest.mark.parametrize('rollback_error', [False, True])
+def test_failed_commit_reports_lost_jobs(rollback_error):
+    server = sqlwriter.SqliteWriter(None, None, authkey='secret')
+    producer = sqlwriter.Producer(None)
+    producer.pending = 3
+
+    server._commit(FailingConnection(rollback_error), [producer])
+
+    assert producer.pending == 0
+    assert producer.committed == 0
+    assert producer.errors == ["3 jobs lost: disk I/O error"]
+
+
+def test_fatal_error_answers_sync(tmpdir, dbfile, monkeypatch):
+    address = str(tmpdir.join('writer.sock'))
+    server = sqlwriter.SqliteWriter(dbfile, address, authkey='secret')
+    connected = threading.Event()
+
+    def failing_open_db():
+        connected.wait(10)
+        raise sqlite3.OperationalError("unable to open database file")
+
+    monkeypatch.setattr(server, 'open_db', failing_open_db)
+    thread = start_writer(server)
+
+    client = wait_for_socket(address)
+    client.submit(store_records, 1)
+    connected.set()
+
+    (ncommitted, errors) = client.sync()
+    client.close()
+
+    assert ncommitted == 0
+    assert errors == ["1 jobs lost: writer stopped: unable to open database file",
+                      "writer stopped: unable to open database file"]
+    thread.join(10)
+    assert not thread.is_alive()
@@ -0,0 +1,205 @@
+#
+# tests of the pystat statistics helpers
+#
+
+import numpy as np
+import pytest
+import subs_avhrrgac as subs
+
+
+def test_moments_merge_equals_numpy():
+    rng = np.random.RandomState(42)
+    values = rng.normal(250., 20., 1000)
+
+    moments = subs.Moments()
+    for chunk in np.array_split(values, 7):
+        moments.merge(subs.Moments.from_data(np.ma.masked_array(chunk)))
+
+    assert moments.nobs == values.size
+    assert np.isclose(moments.get_mean(), values.mean())
+    assert np.isclose(moments.get_stdv(), values.std())
+
+
+def test_moments_merge_empty_and_masked():
+    data = np.ma.masked_array([1., 2., 3., 100.], mask=[0, 0, 0, 1])
+
+    moments = subs.Moments().merge(subs.Moments.from_data(data))
+    moments.merge(subs.Moments.from_data(np.ma.masked_all(3)))
+
+    assert moments.nobs == 3
+    assert np.isclose(moments.get_mean(), 2.)
+    assert np.isclose(moments.get_stdv(), np.std([1., 2., 3.]))
+
+
+def test_moments_from_stats_roundtrip():
+    rng = np.random.RandomState(1)
+    days = [rng.normal(280., 5., n) for n in (10, 200, 35)]
+
+    moments = subs.Moments()
+    for day in days:
+        moments.merge(subs.Moments.from_stats(day.mean(), day.std(), day.size,
+                                              fill_value=-9999.))
+    moments.merge(subs.Moments.from_stats(-9999., -9999., 12, fill_value=-9999.))
+
+    pooled = np.concatenate(days)
+    assert moments.nobs == pooled.size
+    assert np.isclose(moments.get_mean(), pooled.mean())
+    assert np.isclose(moments.get_stdv(), pooled.std())
+
+
+def cal_zonal_means_loop(lat, tar, zone_size):
+    """
+    Former per-zone masking loop of cal_zonal_means.
+    """
+    zone_rad = zone_size / 2.0
+    zone_centers = np.arange(-90 + zone_rad, 90 + zone_rad, zone_size)
+    nzones = len(zone_centers)
+
+    zonal_means = np.ma.zeros(nzones)
+    zonal_stdev = np.ma.zeros(nzones)
+    nobs = np.ma.zeros(nzones)
+
+    for zone_center, izone in zip(zone_centers, range(nzones)):
+        if izone == 0:
+            zonal_mask = np.ma.mask_or(lat < (zone_center - zone_rad),
+                                       lat > (zone_center + zone_rad))
+        else:
+            zonal_mask = np.ma.mask_or(lat <= (zone_center - zone_rad),
+                                       lat > (zone_center + zone_rad))
+        zonal_data = np.ma.masked_where(zonal_mask, tar)
+        zonal_means[izone] = zonal_data.mean(dtype=np.float64)
+        zonal_stdev[izone] = zonal_data.std(dtype=np.float64)
+        nobs[izone] = np.ma.count(zonal_data)
+
+    return zonal_means, zonal_stdev, nobs
+
+
+def get_random_orbit(size=20000, seed=7):
+    """
+    Random latitudes (partly masked, some outside -90 to 90, none
+    between 40 and 50, all zone edges of 5 degrees) and targets.
+    """
+    rng = np.random.RandomState(seed)
+    lat = rng.uniform(-95., 95., size)
+    lat[0:37] = np.arange(-90., 95., 5.)
+    lat[(lat > 40.) & (lat <= 50.)] -= 20.
+    lat = np.ma.masked_array(lat, mask=rng.rand(size) < 0.05)
+    lat.mask[0:37] = False
+    tar = np.ma.masked_array(rng.normal(270., 15., size), mask=rng.rand(size) < 0.1)
+    return lat, tar
+
+
+@pytest.mark.parametrize('zone_size', [1., 5., 10., 30.])
+def test_zonal_means_equal_loop(zone_size):
+    (lat, tar) = get_random_orbit()
+
+    expected = cal_zonal_means_loop(lat, tar, zone_size)
+    result = subs.cal_zonal_means(lat, tar, zone_size)
+
+    for x, y in zip(expected, result):
+        assert (np.ma.getmaskarray(x) == np.ma.getmaskarray(y)).all()
+    # empty zones between 40 and 50
+    assert np.ma.getmaskarray(result[0]).any() == (zone_size <= 10.)
+
+    # identical counts, means and stdv up to the summation order
+    assert (expected[2] == result[2]).all()
+    assert np.allclose(expected[0].compressed(), result[0].compressed(),
+                       rtol=1e-12, atol=0.)
+    assert np.allclose(expected[1].compressed(), result[1].compressed(),
+                       rtol=1e-10, atol=0.)
+
+
+def test_zonal_moments_zone_edges():
+    # first zone includes its left edge, all zones include their right edge
+    lat = np.ma.masked_array([-90., -80., -79.9, 0., 80., 90., 90.5, -90.5, 10.],
+                             mask=[0, 0, 0, 0, 0, 0, 0, 0, 1])
+    (zone_index, nzones) = subs.get_zone_index(lat, 10.)
+
+    assert nzones == 18
+    assert zone_index.tolist() == [0, 0, 1, 8, 16, 17, -1, -1, -1]
+
+    tar = np.ma.masked_array(np.arange(9, dtype=float))
+    (nobs, sums, sumsq) = subs.cal_zonal_moments(zone_index, nzones, [tar])
+
+    assert nobs.shape == (1, 18)
+    assert nobs.sum() == 6
+    assert nobs[0, 0] == 2 and sums[0, 0] == 1. and sumsq[0, 0] == 1.
+    assert nobs[0, 17] == 1 and sums[0, 17] == 5.
+
+
+def test_zonal_moments_masked_target():
+    lat = np.ma.masked_array([-85., -85., -85.])
+    (zone_index, nzones) = subs.get_zone_index(lat, 10.)
+    tar = np.ma.masked_array([1., 2., 4.], mask=[0, 1, 0])
+
+    (nobs, sums, sumsq) = subs.cal_zonal_moments(zone_index, nzones, [tar, tar * 2])
+
+    assert nobs[:, 0].tolist() == [2, 2]
+    assert sums[:, 0].tolist() == [5., 10.]
+    assert sumsq[:, 0].tolist() == [17., 68.]
+
+
+@pytest.mark.parametrize('zone_size', [2., 5., 10., 30., 180.])
+def test_merge_base_zones_equals_direct(zone_size):
+    (lat, tar) = get_random_orbit()
+    base_size = 1.
+
+    (base_index, nbase) = subs.get_zone_index(lat, base_size)
+    base = subs.cal_zonal_moments(base_index, nbase, [tar])
+    merged = subs.merge_base_zones(base[0], base[1], base[2], base_size, zone_size)
+
+    (zone_index, nzones) = subs.get_zone_index(lat, zone_size)
+    direct = subs.cal_zonal_moments(zone_index, nzones, [tar])
+
+    assert (merged[0] == direct[0]).all()
+    assert np.allclose(merged[1], direct[1])
+    assert np.allclose(merged[2], direct[2])
+
+
+def test_merge_base_band_equals_direct():
+    (lat, tar) = get_random_orbit()
+    base_size = 1.
+
+    (base_index, nbase) = subs.get_zone_index(lat, base_size)
+    base = subs.cal_zonal_moments(base_index, nbase, [tar])
+    (nobs, sums, sumsq) = subs.merge_base_band(base[0], base[1], base[2],
+                                               base_size, -30., 30.)
+
+    # zone edges: -30 excluded, 30 included
+    valid = ~np.ma.getmaskarray(lat) & ~np.ma.getmaskarray(tar)
+    lat = np.ma.getdata(lat)
+    values = np.ma.getdata(tar)[valid & (lat > -30.) & (lat <= 30.)]
+    assert nobs[0] == values.size
+    assert np.isclose(sums[0], values.sum())
+    assert np.isclose(sumsq[0], np.square(values).sum())
+
+
+def test_merge_base_invalid_sizes():
+    with pytest.raises(ValueError):
+        subs.get_base_factor(1., 7.)
+    with pytest.raises(ValueError):
+        subs.get_base_factor(2., 5.)
+    with pytest.raises(ValueError):
+        subs.get_band_slice(1., -10.5, 10.)
+
+
+@pytest.mark.parametrize('dtype', ['<f4', '<i4', '<i8', '<f8'])
+def test_blob_roundtrip(dtype):
+    arr = np.arange(36).astype(dtype) * 3 - 50
+
+    blob = subs.array_to_blob(arr, dtype)
+    res = subs.blob_to_array(bytes(blob))
+
+    assert res.dtype == np.dtype(dtype)
+    assert (res == arr).all()
+
+    cube = subs.blobs_to_array([bytes(blob), bytes(subs.array_to_blob(arr + 1, dtype))])
+    assert cube.shape == (2, 36)
+    assert (cube[1] == arr + 1).all()
+
+
+def test_blobs_differ():
+    blobs = [bytes(subs.array_to_blob(np.zeros(3), '<f4')),
+             bytes(subs.array_to_blob(np.zeros(4), '<f4'))]
+    with pytest.raises(ValueError):
+        subs.blobs_to_array(blobs)
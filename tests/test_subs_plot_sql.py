@@ -0,0 +1,88 @@
+#
+# tests of the pystat readers
+#
+
+import datetime
+import sqlite3
+import numpy as np
+import subs_avhrrgac as subs
+import subs_plot_sql as psql
+
+
+FILL_VALUE = -9999.
+
+
+def create_pystat_db(path):
+    db = sqlite3.connect(path)
+    db.row_factory = subs.dict_factory
+    for table, name in (('satellites', 'NOAA18'), ('channels', 'ch4'), ('selects', 'night')):
+        db.execute("CREATE TABLE {0} (id INTEGER PRIMARY KEY, name TEXT)".format(table))
+        db.execute("INSERT INTO {0} (name) VALUES (?)".format(table), (name,))
+    subs.create_statistics_blob_table(db)
+    return db
+
+
+def add_day(db, date, zonal_samples, binsize):
+    """
+    Daily record of samples per zone like run_pystat_add2sqlite.py.
+    """
+    values = np.concatenate(zonal_samples)
+    nobs = np.array([len(s) for s in zonal_samples])
+    mean = np.array([s.mean() if len(s) else FILL_VALUE for s in zonal_samples])
+    stdv = np.array([s.std() if len(s) else FILL_VALUE for s in zonal_samples])
+
+    db.execute("INSERT INTO statistics_blob VALUES (1, ?, 1, 1, ?, 14, ?, ?, ?, ?, ?, ?)",
+               (date.strftime('%Y-%m-%d'), binsize, values.mean(), values.std(), values.size,
+                subs.array_to_blob(mean, '<f4'), subs.array_to_blob(stdv, '<f4'),
+                subs.array_to_blob(nobs, '<i4')))
+
+
+def test_read_pooled_stats_equals_numpy(tmpdir):
+    rng = np.random.RandomState(3)
+    binsize = 60.
+    db = create_pystat_db(str(tmpdir.join('pystat.sqlite3')))
+
+    samples = dict()
+    sdate = datetime.date(2008, 1, 27)
+    for day in range(10):
+        date = sdate + datetime.timedelta(days=day)
+        zonal = [rng.normal(250. + 10 * zone + day, 5. + zone, rng.randint(50, 200))
+                 for zone in range(3)]
+        # day without observations in the first zone
+        if day == 3:
+            zonal[0] = zonal[0][:0]
+        add_day(db, date, zonal, binsize)
+        samples.setdefault(datetime.date(date.year, date.month, 1), list()).append(zonal)
+    db.commit()
+    cur = db.cursor()
+
+    for reader in (None, psql.ZonalStatsReader(cur)):
+        (period_list, glob_list,
+         zonal_list, lats) = psql.read_pooled_stats('NOAA18', 'ch4', 'night', '2008-01-01',
+                                                    '2008-12-31', cur, reader=reader)
+
+        assert period_list == sorted(samples)
+        assert lats == [-60., 0., 60.]
+
+        for key, glob, zonal in zip(period_list, glob_list, zonal_list):
+            values = np.concatenate([np.concatenate(day) for day in samples[key]])
+            assert glob.nobs == values.size
+            assert np.isclose(glob.get_mean(), values.mean(), rtol=1e-12)
+            assert np.isclose(glob.get_stdv(), values.std(), rtol=1e-12)
+
+            for zone in range(3):
+                values = np.concatenate([day[zone] for day in samples[key]])
+                assert zonal.nobs[zone] == values.size
+                # zonal blobs are stored as float32
+                assert np.isclose(zonal.get_mean()[zone], values.mean(), rtol=1e-6)
+                assert np.isclose(zonal.get_stdv()[zone], values.std(), rtol=1e-5)
+
+    (period_list, glob_list,
+     zonal_list, lats) = psql.read_pooled_stats('NOAA18', 'ch4', 'night', '2008-01-01',
+                                                '2008-12-31', cur, period='year')
+    values = np.concatenate([np.concatenate(day) for key in samples for day in samples[key]])
+    assert period_list == [datetime.date(2008, 1, 1)]
+    assert glob_list[0].nobs == values.size
+    assert np.isclose(glob_list[0].get_stdv(), values.std(), rtol=1e-12)
+
+    db.close()